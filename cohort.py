@@ -0,0 +1,208 @@
+import os
+import sys
+import glob
+import json
+import numpy as np
+from ast import literal_eval
+from concurrent.futures import ProcessPoolExecutor
+
+from .motion_trace import MotionTrace
+from .motion_trace_catalog import load_motion_trace
+
+# The displacement series of a fraction: (name, plane, column of the plane displacement), in the order of the
+# displacement statistics of the analysis notebooks (x, y and z measured by two planes each)
+SERIES = [('TransversalX', 0, 0), ('CoronalX', 1, 0),
+          ('TransversalY', 0, 1), ('SagittalY', 2, 0),
+          ('SagittalZ', 2, 1), ('CoronalZ', 1, 1)]
+
+
+class CohortTable(object):
+    """ Columnar (long format) table of the motion traces of a cohort: one row per fraction, series and sample.
+    The rows are sorted by fraction, series and time, so the groups (fraction, series) are contiguous.
+    The patient ID and plan label are stored per fraction.
+    """
+
+    def __init__(self, patient_IDs:list[str], plan_labels:list[str], fraction:np.array, series:np.array,
+                 time:np.array, displacement:np.array):
+        self.patient_IDs = list(patient_IDs)
+        self.plan_labels = list(plan_labels)
+        self.fraction = np.asarray(fraction, dtype=np.int32)
+        self.series = np.asarray(series, dtype=np.int8)
+        self.time = np.asarray(time, dtype=float)
+        self.displacement = np.asarray(displacement, dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @property
+    def num_fractions(self) -> int:
+        return len(self.patient_IDs)
+
+    @property
+    def group(self) -> np.array:
+        """ The group index (fraction, series) of each row. """
+        return self.fraction.astype(np.int64) * len(SERIES) + self.series
+
+    @property
+    def num_groups(self) -> int:
+        return self.num_fractions * len(SERIES)
+
+    def select(self, rows:np.array) -> 'CohortTable':
+        """ The table of the selected rows (boolean mask or indices). """
+        return CohortTable(self.patient_IDs, self.plan_labels, self.fraction[rows], self.series[rows],
+                           self.time[rows], self.displacement[rows])
+
+    def with_displacement(self, displacement:np.array) -> 'CohortTable':
+        return CohortTable(self.patient_IDs, self.plan_labels, self.fraction, self.series, self.time, displacement)
+
+    def fraction_keys(self) -> list[tuple[str, str]]:
+        return list(zip(self.patient_IDs, self.plan_labels))
+
+    def group_bounds(self) -> tuple[np.array, np.array]:
+        """ The first row and the number of rows of each group. """
+        counts = np.bincount(self.group, minlength=self.num_groups)
+        return np.cumsum(counts) - counts, counts
+
+    def group_reduce(self, ufunc, values:np.array, initial:float) -> np.array:
+        """ Reduce the values per group with a numpy ufunc (e.g. np.maximum), initial for empty groups. """
+        starts, counts = self.group_bounds()
+        reduced = np.full(self.num_groups, initial, dtype=float)
+        reduced[counts > 0] = ufunc.reduceat(values, starts[counts > 0])
+        return reduced
+
+#################################################################################
+def trace_columns(trace:MotionTrace) -> tuple[str, str, np.array, np.array, np.array]:
+    """ The columns of one motion trace: patient ID, plan label, series, time and displacement. """
+    times = [trace.times_transversal, trace.times_coronal, trace.times_sagittal]
+    displacements = [trace.displacements_transversal, trace.displacements_coronal, trace.displacements_sagittal]
+
+    series = np.concatenate([np.full(len(times[plane]), i, dtype=np.int8) for i, (_, plane, _) in enumerate(SERIES)])
+    time = np.concatenate([times[plane] for _, plane, _ in SERIES])
+    displacement = np.concatenate([displacements[plane][:, column] for _, plane, column in SERIES])
+    return trace.patient_ID, trace.plan_label, series, time, displacement
+
+#################################################################################
+def load_report_columns(report_filename:str) -> tuple[str, str, np.array, np.array, np.array]:
+    """ Load the motion trace of a report (binary if written) as columns, see trace_columns. """
+    return trace_columns(load_motion_trace(report_filename))
+
+#################################################################################
+def load_cohort(report_filenames:list[str], max_workers:int=None) -> CohortTable:
+    """ Load the motion reports into a cohort table, the fractions in the order of the file names.
+
+    :param max_workers: Number of processes loading the reports, 1 to load in this process,
+                        if None the number of cores
+    """
+    if max_workers == 1 or len(report_filenames) <= 1:
+        loaded = [load_report_columns(filename) for filename in report_filenames]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            loaded = list(executor.map(load_report_columns, report_filenames, chunksize=4))
+
+    if len(loaded) == 0:
+        return CohortTable([], [], [], [], [], [])
+
+    patient_IDs, plan_labels, series, time, displacement = zip(*loaded)
+    fraction = np.concatenate([np.full(len(t), i, dtype=np.int32) for i, t in enumerate(time)])
+    return CohortTable(patient_IDs, plan_labels, fraction, np.concatenate(series), np.concatenate(time),
+                       np.concatenate(displacement))
+
+#################################################################################
+def treatment_window(table:CohortTable, treatment_times:np.array) -> CohortTable:
+    """ Keep the samples during the treatment. If a series is longer than the treatment time, the treatment is
+    assumed to be at the end of the series (as find_start_index of the analysis notebooks).
+
+    :param treatment_times: Treatment time (s) per fraction, nan to keep all samples of the fraction
+    """
+    treatment_times = np.asarray(treatment_times, dtype=float)
+    if len(treatment_times) != table.num_fractions:
+        raise ValueError(f'Number of treatment times {len(treatment_times)} does not match the number of fractions {table.num_fractions}')
+
+    end_times = table.group_reduce(np.maximum, table.time, -np.inf)[table.group]
+    start_times = end_times - treatment_times[table.fraction]
+    keep = ~(start_times > 0) | (table.time >= start_times)
+    return table.select(keep)
+
+#################################################################################
+def reset_to_mean_of_first(table:CohortTable, num_samples=10) -> CohortTable:
+    """ Subtract the mean of the first samples of each series of each fraction from the series. """
+    group = table.group
+    starts, _ = table.group_bounds()
+    first = (np.arange(len(table)) - starts[group]) < num_samples
+
+    sums = np.bincount(group[first], weights=table.displacement[first], minlength=table.num_groups)
+    counts = np.bincount(group[first], minlength=table.num_groups)
+    means = sums / np.maximum(counts, 1)
+    return table.with_displacement(table.displacement - means[group])
+
+#################################################################################
+def group_percentiles(table:CohortTable, percentiles:list[float]) -> np.array:
+    """ The percentiles (0-100, linear interpolation as np.percentile) per fraction and series.
+
+    :return: [fraction, series, percentile], nan for empty series
+    """
+    order = np.lexsort((table.displacement, table.group))
+    values = table.displacement[order]
+    starts, counts = table.group_bounds()
+
+    result = np.full((table.num_groups, len(percentiles)), np.nan)
+    nonempty = counts > 0
+    for i, p in enumerate(percentiles):
+        position = (counts[nonempty] - 1) * p / 100.0
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, counts[nonempty] - 1)
+        weight = position - lower
+        result[nonempty, i] = ((1 - weight) * values[starts[nonempty] + lower] +
+                               weight * values[starts[nonempty] + upper])
+
+    return result.reshape(table.num_fractions, len(SERIES), len(percentiles))
+
+#################################################################################
+def displacement_statistics(table:CohortTable, treatment_times:np.array=None, q=0.975,
+                            num_reset_samples=10) -> np.array:
+    """ The displacement statistics of the analysis notebooks for all fractions: the samples during the treatment,
+    reset to the mean of the first samples, and the q and 1-q quantiles per series.
+
+    :param treatment_times: Treatment time (s) per fraction, if None all samples
+    :return: [fraction, series, (q, 1-q)] (mm), series as SERIES
+    """
+    if treatment_times is not None:
+        table = treatment_window(table, treatment_times)
+    table = reset_to_mean_of_first(table, num_reset_samples)
+    return group_percentiles(table, [100 * q, 100 * (1 - q)])
+
+
+if __name__ == "__main__":
+    """
+    Displacement statistics of all motion reports in a directory.
+    Usage: python -m MRLCinema.cohort <report directory> [treatment_info.json] [q]
+    The treatment info (as written by the analysis notebooks) maps "('patient ID', 'plan label')" to
+    "('date', 'treatment time')", fractions without treatment info are analysed over all samples.
+    """
+    report_dir = sys.argv[1]
+    treatment_info_filename = sys.argv[2] if len(sys.argv) > 2 else None
+    q = float(sys.argv[3]) if len(sys.argv) > 3 else 0.975
+
+    report_filenames = sorted(glob.glob(os.path.join(report_dir, '*_cine_motion_analysis.json')))
+    table = load_cohort(report_filenames)
+
+    treatment_times = np.full(table.num_fractions, np.nan)
+    if treatment_info_filename is not None:
+        with open(treatment_info_filename, 'r') as f:
+            treatment_info = {literal_eval(key): literal_eval(value) for key, value in json.load(f).items()}
+        for i, key in enumerate(table.fraction_keys()):
+            if key in treatment_info:
+                treatment_times[i] = float(treatment_info[key][1])
+
+    statistics = displacement_statistics(table, treatment_times, q)
+
+    results = []
+    for (patient_ID, plan_label), fraction_statistics in zip(table.fraction_keys(), statistics):
+        results.append({'PatientID': patient_ID, 'PlanLabel': plan_label,
+                        **{name: values.tolist() for (name, _, _), values in zip(SERIES, fraction_statistics)}})
+    print(f'{table.num_fractions} fractions, {len(table)} samples')
+
+    results_filename = os.path.join(report_dir, 'cohort_displacement_statistics.json')
+    with open(results_filename, 'w') as f:
+        json.dump(results, f, indent=4)
+        print(f'Wrote displacement statistics to {results_filename}')
@@ -1,5 +1,7 @@
 import SimpleITK as sitk
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.ndimage import distance_transform_edt
 
 def create_margin_sitk(mask:sitk.Image, pixel_radius:np.array) -> sitk.Image:
     """ Create a new binary image using a margin from a Simple ITK binay image
@@ -52,4 +54,117 @@ def create_margin(mask:np.array, spacing:np.array, margin:np.array) -> np.array:
     # convert back 
     mask_margin = sitk.GetArrayFromImage(sitk_mask_margin)
     
-    return mask_margin
\ No newline at end of file
+    return mask_margin
+
+
+class MarginEngine(object):
+    """ Create margins around a mask for many margin vectors using distance maps.
+
+    The margin [x, y, z] is an ellipsoid around each voxel of the mask. Scaling each axis with the margin 
+    turns the ellipsoid into a sphere, i.e. a voxel is within the margin if the distance map computed with 
+    sampling = spacing / ratio is within the scale of the margin, where margin = scale * ratio.
+    Hence only one distance map is computed per ratio (direction of the margin vector), and all margins 
+    with the same ratio, e.g. all isotropic margins, are a threshold of the same map. 
+    In contrast to create_margin the margins are not rounded to an integer number of voxels.
+
+    The mask, spacing and margins are given in the same axis order, as in create_margin.
+    """
+
+    def __init__(self, mask:np.array, spacing:np.array, max_margin:np.array=None):
+        """ 
+        :param mask      : mask to be expanded
+        :param spacing   : spacing btwn voxels  
+        :param max_margin: largest margin [x, y, z] (mm) that will be requested, used to crop the 
+                           mask before the distance maps are computed. If None the full volume is used.
+        """
+        self.shape = mask.shape
+        self.spacing = np.asarray(spacing, dtype=float)
+        self.max_margin = None if max_margin is None else np.asarray(max_margin, dtype=float)
+
+        if len(self.shape) != 3 or len(self.spacing) != 3:
+            raise ValueError(f'Mask must be 3D and spacing of length 3 {self.shape} {self.spacing}')
+
+        self._box = self._crop_box(mask > 0)
+        self._mask = np.ascontiguousarray(mask[self._box] > 0)
+        self._distance_maps = {}
+
+    def _crop_box(self, mask:np.array) -> tuple[slice, slice, slice]:
+        """ Box around the mask with room for the largest margin. """
+        if self.max_margin is None or not np.any(mask):
+            return tuple(slice(0, n) for n in self.shape)
+        
+        pad = np.ceil(self.max_margin / self.spacing).astype(int) + 1
+        box = []
+        for axis in range(3):
+            other_axes = tuple(a for a in range(3) if a != axis)
+            indices = np.where(np.any(mask, axis=other_axes))[0]
+            box.append(slice(max(0, indices[0] - pad[axis]), min(self.shape[axis], indices[-1] + pad[axis] + 1)))
+
+        return tuple(box)
+    
+    @staticmethod
+    def _ratio_and_scale(margin:np.array) -> tuple[tuple, float]:
+        """ Split the margin into the (normalised) ratio and the scale, margin = scale * ratio. """
+        scale = float(np.max(margin))
+        ratio = tuple(np.round(margin / scale, 6))
+        return ratio, scale
+
+    def distance_map(self, ratio:tuple) -> np.array:
+        """ Distance map (of the cropped mask) to the mask in the scaled coordinates of the ratio. Cached per ratio. """
+        if ratio not in self._distance_maps:
+            # a tiny ratio makes any distance along that axis larger than all margins, i.e. no expansion
+            sampling = self.spacing / np.maximum(np.array(ratio), 1e-6)
+            self._distance_maps[ratio] = distance_transform_edt(~self._mask, sampling=sampling)
+        return self._distance_maps[ratio]
+    
+    def create_margin(self, margin:np.array) -> np.array:
+        """ Create the expanded mask for a margin.
+
+        :param margin: margin to expand [x, y, z] (mm)
+        :return expanded volume (uint8)
+        """
+        margin = np.asarray(margin, dtype=float)
+        if len(margin) != 3:
+            raise ValueError(f'Margin must be specified with a single number in x, y, z (vector of length 3) {margin}')
+        if np.any(margin < 0):
+            raise ValueError(f'Margin must be non-negative {margin}')
+        if self.max_margin is not None and np.any(margin > self.max_margin):
+            raise ValueError(f'Margin {margin} larger than the max margin {self.max_margin}')
+
+        mask_margin = np.zeros(self.shape, dtype=np.uint8)
+        if np.all(margin == 0):
+            mask_margin[self._box] = self._mask
+            return mask_margin
+
+        ratio, scale = self._ratio_and_scale(margin)
+        mask_margin[self._box] = self.distance_map(ratio) <= scale * (1 + 1e-9)
+
+        return mask_margin
+
+    def create_margins(self, margins:list[np.array]) -> list[np.array]:
+        """ Create the expanded masks for a list of margins, see create_margin. """
+        return [self.create_margin(margin) for margin in margins]
+
+
+def create_margins(mask:np.array, spacing:np.array, margins:list[np.array]) -> list[np.array]:
+    """ Create the expanded masks of one mask for a list of margins [x, y, z] (mm), see MarginEngine. """
+    max_margin = np.max(np.array(margins, dtype=float).reshape(-1, 3), axis=0)
+    engine = MarginEngine(mask, spacing, max_margin)
+    return engine.create_margins(margins)
+
+
+def create_margins_parallel(masks:list[np.array], spacings:list[np.array], margins:list[np.array], max_workers=None) -> list[list[np.array]]:
+    """ Create the expanded masks for many masks (e.g. one CTV per patient) in parallel processes.
+
+    :param masks     : masks to be expanded
+    :param spacings  : spacing of each mask
+    :param margins   : margins [x, y, z] (mm) to apply to every mask
+    :param max_workers: number of processes, if None the number of cpus
+    :return list (per mask) of the list of expanded masks (per margin) 
+    """
+    if len(masks) != len(spacings):
+        raise ValueError(f'Number of masks and spacings differ {len(masks)} {len(spacings)}')
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(create_margins, mask, spacing, margins) for mask, spacing in zip(masks, spacings)]
+        return [future.result() for future in futures]
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class DeliveryTimeline(object):
+    """ The delivered MU as function of time of a linac logfile, and the alignment of a motion trace to it.
+    The cumulative MU is computed once, MU(t) is the monotone piecewise linear interpolant of the cumulative MU.
+    All queries are vectorised over arrays of times.
+    """
+
+    def __init__(self, times:np.array, delta_mu:np.array, total_mu:float=None):
+        """
+        :param times   : The (increasing) times of the logfile samples (s)
+        :param delta_mu: The MU delivered at each sample
+        :param total_mu: The total MU of the plan, if None the sum of delta_mu
+        """
+        self.times = np.asarray(times, dtype=float)
+        self.delta_mu = np.asarray(delta_mu, dtype=float)
+        if len(self.times) != len(self.delta_mu):
+            raise ValueError(f'Number of times {len(self.times)} does not match the number of MU samples {len(self.delta_mu)}')
+        if np.any(np.diff(self.times) < 0):
+            raise ValueError('Logfile times are not increasing')
+
+        self.cumulative_mu = np.cumsum(self.delta_mu)
+        self.total_mu = float(self.cumulative_mu[-1]) if total_mu is None else float(total_mu)
+
+    @staticmethod
+    def from_logfile(logfile) -> 'DeliveryTimeline':
+        """ The timeline of a QAckis Logfile (times, delta_mu and total_mu_header). """
+        return DeliveryTimeline(logfile.times, logfile.delta_mu, logfile.total_mu_header)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1])
+
+    def mu_at(self, times:np.array) -> np.array:
+        """ The cumulative MU delivered at the times (0 before and the total after the logfile). """
+        return np.interp(times, self.times, self.cumulative_mu, left=0.0, right=self.cumulative_mu[-1])
+
+    def nearest_cumulative_mu(self, times:np.array) -> np.array:
+        """ The cumulative MU of the logfile sample nearest in time (the first of equally near samples),
+        as cumulative_mu[find_nearest_index(times, t)] in fraction_dose but for all times in one call. """
+        times = np.asarray(times, dtype=float)
+        upper = np.clip(np.searchsorted(self.times, times), 0, len(self.times) - 1)
+        lower = np.clip(upper - 1, 0, len(self.times) - 1)
+        nearest = np.where(np.abs(times - self.times[lower]) <= np.abs(self.times[upper] - times), lower, upper)
+        # first of duplicated times, as argmin
+        nearest = np.searchsorted(self.times, self.times[nearest])
+        return self.cumulative_mu[nearest]
+
+    def beam_on_segments(self, min_delta_mu=0.0) -> np.array:
+        """ The time intervals of continuous delivery (delta_mu above min_delta_mu).
+
+        :return: [segment, (start, stop)] (s), from the first to the last sample of each segment
+        """
+        beam_on = self.delta_mu > min_delta_mu
+        changes = np.diff(np.concatenate([[False], beam_on, [False]]).astype(np.int8))
+        starts = np.flatnonzero(changes == 1)
+        stops = np.flatnonzero(changes == -1) - 1
+        return np.stack([self.times[starts], self.times[stops]], axis=1)
+
+    def mu_per_bin(self, bin_edges:np.array) -> np.array:
+        """ The MU delivered in each time bin. """
+        return np.diff(self.mu_at(bin_edges))
+
+    def sample_mu(self, trace_times:np.array, time_offset=0.0) -> np.array:
+        """ The MU delivered while each sample of a trace was the latest, i.e. from the sample time to the next
+        (the last sample to the end of the delivery).
+
+        :param trace_times: The (increasing) times of the trace samples (s)
+        :param time_offset: The trace time at the start of the logfile, see end_aligned_offset
+        :return: The MU per sample
+        """
+        edges = np.concatenate([np.asarray(trace_times, dtype=float), [np.inf]]) - time_offset
+        edges[0] = min(edges[0], 0.0)
+        return self.mu_per_bin(edges)
+
+    def end_aligned_offset(self, trace_times:np.array) -> float:
+        """ The time offset aligning the end of the delivery to the end of the trace (as find_start_index of the
+        analysis notebooks, the treatment is assumed to be at the end of the cines), 0 if the trace is shorter. """
+        return max(0.0, float(np.max(trace_times)) - self.duration)
+
+
+#################################################################################
+def displacement_mu_histogram(displacements:np.array, sample_mu:np.array, bin_edges) -> tuple[np.array, list[np.array]]:
+    """ The fraction of the delivered MU at each displacement.
+
+    :param displacements: [sample, axis] displacements (mm), e.g. MotionTrace.resample_3d at the trace times
+    :param sample_mu    : The MU delivered at each sample, see DeliveryTimeline.sample_mu
+    :param bin_edges    : The bin edges (mm) per axis, or one array for all axes, see np.histogramdd
+    :return: The histogram (fraction of the MU) and the bin edges per axis
+    """
+    displacements = np.asarray(displacements, dtype=float)
+    if displacements.ndim == 1:
+        displacements = displacements[:, np.newaxis]
+    if np.ndim(bin_edges) == 1 and not isinstance(bin_edges[0], (list, np.ndarray)):
+        bin_edges = [bin_edges] * displacements.shape[1]
+
+    histogram, edges = np.histogramdd(displacements, bins=bin_edges, weights=sample_mu)
+    total = np.sum(sample_mu)
+    return (histogram / total if total > 0 else histogram), edges
+
+
+#################################################################################
+def mu_weighted_percentiles(values:np.array, sample_mu:np.array, percentiles:np.array) -> np.array:
+    """ The percentiles (0-100) of the values weighted by the MU delivered at each sample, i.e. the value
+    not exceeded during the given percentage of the delivered MU. """
+    order = np.argsort(values)
+    values, weights = np.asarray(values, dtype=float)[order], np.asarray(sample_mu, dtype=float)[order]
+    cumulative = np.cumsum(weights)
+    if cumulative[-1] <= 0:
+        raise ValueError('No MU delivered during the samples')
+    centres = (cumulative - 0.5 * weights) / cumulative[-1]
+    return np.interp(np.asarray(percentiles) / 100.0, centres, values)
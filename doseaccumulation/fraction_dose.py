@@ -2,6 +2,10 @@
 import SimpleITK as sitk
 import numpy as np
 from QAckis.Logfiles.Logfile import Logfile
+from ..motion_trace import MotionTrace
+from .alignment import DeliveryTimeline
+from .motion_convolution import dose_accumulation_convolution
+from .shift_cache import ShiftedDoseCache
 
 
 
@@ -42,6 +46,17 @@ def displacement_at_time(motion_report:dict, time:float) -> tuple:
     dz = 0.5 * (s_dz + c_dz)
     
     return (dx, dy, dz)
+
+def displacements_at_times(motion_report:dict|MotionTrace, times:np.array) -> np.array:
+    """ The displacements at the given times, as displacement_at_time but for all times in one call.
+    
+    :param motion_report: The motion report dictionary or the motion trace
+    :param times: The times at which to get the displacement
+    :return: (N,3) displacements in x, y, z direction
+    """
+    if isinstance(motion_report, dict):
+        motion_report = MotionTrace.from_dict(motion_report)
+    return motion_report.resample_3d(times, method='previous', fusion='mean')
     
 def cumulative_mu(logfile:Logfile) -> float:
     """ Get the cumulative MU at a given time from the logfile.
@@ -58,6 +73,26 @@ def find_nearest_index(array, value):
     idx = (np.abs(array - value)).argmin()
     return idx
 
+def accumulation_steps(times:np.array, motion_trace:np.array, logfile:Logfile, delta_time=5) -> tuple[np.array, np.array]:
+    """ The positions and dose weights of the time steps of the dose accumulation: the position at the midpoint 
+    of each step and the fraction of the total MU delivered during the step.
+
+    :return: [step, (x, y, z)] positions (mm) and the weight of each step
+    """
+    delivery = DeliveryTimeline.from_logfile(logfile)
+    total_treatment_time = np.max(logfile.times)
+    dt = delta_time
+
+    num_steps = int(np.floor((total_treatment_time - dt) / dt)) + 1 if total_treatment_time >= dt else 0
+    time_starts = np.arange(num_steps) * dt
+    time_mids = time_starts + 0.5*dt
+    positions = np.stack([np.interp(time_mids, times, motion_trace[:,i]) for i in range(3)], axis=1)
+
+    mu_ends = delivery.nearest_cumulative_mu(time_starts + dt)
+    weights = np.diff(mu_ends, prepend=0.0) / delivery.total_mu
+
+    return positions, weights
+
 def dose_accumulation_sitk(nominal_dose:sitk.Image, times:np.array, motion_trace:np.array, logfile:Logfile, delta_time=5) -> sitk.Image:
     """ Accumulate the dose over the motion trace with the assumption 
     that the whole (scaled) dose distribution is delivered at each time point.
@@ -65,7 +100,7 @@ def dose_accumulation_sitk(nominal_dose:sitk.Image, times:np.array, motion_trace
     The dose is integrated over the motion trace, the position of the CTV
     is taken at the midpoint of the time step.
 
-    :param motion_trace : The displacements in the motion trace 
+    :param motion_trace : The (N,3) displacements in the motion trace, e.g. MotionTrace.resample_3d(times)
     :param times        : The time points corresponding to the motion trace displacements
     :param nominal_dose : The dose distribution in a statis patient.
     :param logfile      : The logfile with the MU and time information
@@ -74,52 +109,62 @@ def dose_accumulation_sitk(nominal_dose:sitk.Image, times:np.array, motion_trace
     accumulated_dose = sitk.Image(nominal_dose.GetSize(), sitk.sitkFloat64)
     accumulated_dose.CopyInformation(nominal_dose)
 
-    cum_mu = cumulative_mu(logfile)
-    tot_mu = logfile.total_mu_header
+    # the positions and the MU of all time steps in one call
+    positions, dose_scalings = accumulation_steps(times, motion_trace, logfile, delta_time)
     
-    total_treatment_time = np.max(logfile.times)
-    dt = delta_time
-    mu_start = 0
-    time_start = 0
-    
-    while time_start <= (total_treatment_time-dt):
-        
-        time_mid = time_start + 0.5*dt
-        dx = np.interp(time_mid, times, motion_trace[:,0])
-        dy = np.interp(time_mid, times, motion_trace[:,1])
-        dz = np.interp(time_mid, times, motion_trace[:,2])
+    for (dx, dy, dz), dose_scaling in zip(positions, dose_scalings):
 
         # Resample the dose with the translation
-        translation = sitk.TranslationTransform(3,[dx, dy, dz])  
+        translation = sitk.TranslationTransform(3,[float(dx), float(dy), float(dz)])  
         dose_now = sitk.Resample(nominal_dose, accumulated_dose, translation, sitk.sitkLinear, 0.0, nominal_dose.GetPixelID())        
-        
-        # Calculate the number of MU from the logfile
-        index = find_nearest_index(logfile.times, time_start + dt)
-        mu_end = cum_mu[index]
-        delta_mu = mu_end - mu_start 
-        dose_scaling = delta_mu / tot_mu
 
         # update the dose over the time step
         scaled_dose = dose_now * dose_scaling
         accumulated_dose += scaled_dose
 
-        # prepare for next step
-        mu_start = mu_end
-        time_start += dt
-
     return accumulated_dose
 
+def dose_accumulation_sitk_fft(nominal_dose:sitk.Image, times:np.array, motion_trace:np.array, logfile:Logfile, delta_time=5) -> sitk.Image:
+    """ As dose_accumulation_sitk, with the time steps applied as one convolution of the nominal dose 
+    with the MU weighted displacement distribution (the cost of one FFT for any number of steps).
+    The result is the same where the dose is zero at the border of the grid, see dose_accumulation_convolution.
+    """
+    positions, dose_scalings = accumulation_steps(times, motion_trace, logfile, delta_time)
+    return dose_accumulation_convolution(nominal_dose, positions, dose_scalings)
+
+
+def dose_accumulation_sitk_cached(nominal_dose:sitk.Image, times:np.array, motion_trace:np.array, logfile:Logfile, 
+                                  delta_time=5, cache:ShiftedDoseCache=None) -> sitk.Image:
+    """ As dose_accumulation_sitk, with the positions quantised to a sub-voxel grid and the MU of the time steps 
+    at the same position summed, so the dose is resampled once per distinct position. 
+
+    :param cache: The shifted dose cache of the nominal dose (the same image), reuse over traces 
+                  (e.g. margin studies), if None a new cache
+    """
+    if cache is None:
+        cache = ShiftedDoseCache(nominal_dose)
+    elif cache.nominal_dose is not nominal_dose:
+        raise ValueError('The shifted dose cache is of another nominal dose')
+    positions, dose_scalings = accumulation_steps(times, motion_trace, logfile, delta_time)
+    return cache.accumulate(positions, dose_scalings)
 
 def dose_accumulation(nominal_dose:np.array, pos_000:np.array, spacing:np.array, 
-                      times:np.array, motion_trace:np.array, logfile:Logfile, delta_time=5) -> np.array:
+                      times:np.array, motion_trace:np.array, logfile:Logfile, delta_time=5, fft=False) -> np.array:
     """ Accumulate the dose over the motion trace with the assumption 
     Wrapper function around accumlation function using sitk images.
+
+    :param fft: Accumulate by convolution (dose_accumulation_sitk_fft), otherwise resample per time step.
+                The convolution takes the dose as zero outside the grid, so it differs from resampling 
+                where the dose is not zero at the border of the grid, see dose_accumulation_convolution
     """
     nominal_dose_sitk = sitk.GetImageFromArray(np.swapaxes(nominal_dose, 0, 2))
     nominal_dose_sitk.SetOrigin(pos_000.tolist())
     nominal_dose_sitk.SetSpacing(spacing.tolist())
 
-    accumulated_dose_sitk = dose_accumulation_sitk(nominal_dose_sitk, times, motion_trace, logfile, delta_time)
+    if fft:
+        accumulated_dose_sitk = dose_accumulation_sitk_fft(nominal_dose_sitk, times, motion_trace, logfile, delta_time)
+    else:
+        accumulated_dose_sitk = dose_accumulation_sitk(nominal_dose_sitk, times, motion_trace, logfile, delta_time)
 
     accumulated_dose = np.swapaxes(sitk.GetArrayFromImage(accumulated_dose_sitk), 0, 2)        
     
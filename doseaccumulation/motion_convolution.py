@@ -0,0 +1,73 @@
+import numpy as np
+import SimpleITK as sitk
+
+
+#################################################################################
+def voxel_offsets(dose:sitk.Image, displacements:np.array) -> np.array:
+    """ The displacements (mm, x y z) as continuous voxel offsets of the dose grid, in numpy (z, y, x) order. """
+    direction = np.array(dose.GetDirection()).reshape(3, 3)
+    offsets = (np.asarray(displacements, dtype=float) @ direction) / np.array(dose.GetSpacing())
+    return offsets[:, ::-1]
+
+#################################################################################
+def displacement_kernel(offsets:np.array, weights:np.array) -> tuple[np.array, np.array]:
+    """ The weighted displacement distribution splatted trilinearly onto the voxel offsets.
+    Trilinear splatting of the sub-voxel offsets is the adjoint of linear interpolation, so convolving with the
+    kernel gives the same dose as resampling with linear interpolation at each displacement.
+
+    :param offsets: [sample, (z, y, x)] continuous voxel offsets
+    :param weights: weight of each sample
+    :return: The kernel, flipped for convolution (kernel[radius - m] is the weight of offset m), and the radius per axis
+    """
+    base = np.floor(offsets).astype(np.int64)
+    fraction = offsets - base
+    radius = np.max(np.abs(np.concatenate([base, base + 1])), axis=0)
+
+    kernel = np.zeros(2 * radius + 1)
+    for corner in np.ndindex(2, 2, 2):
+        corner = np.array(corner)
+        corner_weights = weights * np.prod(np.where(corner, fraction, 1 - fraction), axis=1)
+        index = radius - (base + corner)
+        np.add.at(kernel, tuple(index.T), corner_weights)
+
+    return kernel, radius
+
+#################################################################################
+def convolve_fft(image:np.array, kernel:np.array, radius:np.array) -> np.array:
+    """ Convolution of the image with the (centred) kernel, zero outside the image, the size of the image. """
+    shape = np.array(image.shape) + np.array(kernel.shape) - 1
+    axes = tuple(range(image.ndim))
+    spectrum = np.fft.rfftn(image, shape, axes=axes) * np.fft.rfftn(kernel, shape, axes=axes)
+    full = np.fft.irfftn(spectrum, shape, axes=axes)
+    return full[tuple(slice(r, r + n) for r, n in zip(radius, image.shape))]
+
+#################################################################################
+def dose_accumulation_convolution(nominal_dose:sitk.Image, displacements:np.array, weights:np.array) -> sitk.Image:
+    """ Accumulate the dose over rigid translations of the dose (the model of dose_accumulation_sitk) as one
+    convolution of the nominal dose with the weighted displacement distribution. The cost is one FFT of the dose,
+    independent of the number of displacements.
+
+    The dose at each displacement d is the nominal dose resampled at x + d (linear interpolation, zero outside),
+    weighted by e.g. the fraction of the MU delivered at the displacement.
+    At the border of the grid the result differs from sitk.Resample, which takes the edge voxel value up to half
+    a voxel outside the grid, the convolution takes zero outside the grid. The results are the same where the
+    dose is zero at the border of the grid.
+
+    :param nominal_dose : The dose distribution in a static patient
+    :param displacements: [sample, (x, y, z)] displacements (mm)
+    :param weights      : The weight of each displacement, e.g. delta MU / total MU
+    :return: The accumulated dose (float64) on the grid of the nominal dose
+    """
+    weights = np.asarray(weights, dtype=float)
+    if len(weights) != len(displacements):
+        raise ValueError(f'Number of weights {len(weights)} does not match the number of displacements {len(displacements)}')
+
+    if len(weights) == 0:
+        accumulated = np.zeros(nominal_dose.GetSize()[::-1])
+    else:
+        kernel, radius = displacement_kernel(voxel_offsets(nominal_dose, displacements), weights)
+        accumulated = convolve_fft(sitk.GetArrayViewFromImage(nominal_dose).astype(float), kernel, radius)
+
+    accumulated_dose = sitk.GetImageFromArray(accumulated)
+    accumulated_dose.CopyInformation(nominal_dose)
+    return accumulated_dose
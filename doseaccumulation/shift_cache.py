@@ -0,0 +1,105 @@
+import numpy as np
+import SimpleITK as sitk
+from collections import OrderedDict
+from .motion_convolution import voxel_offsets
+
+
+class ShiftedDoseCache(object):
+    """ Cache of the nominal dose resampled at translations, for repeated accumulations of the same dose
+    (many time steps, or many traces in margin studies).
+    The translations are quantised to a sub-voxel grid, so nearby positions share one resampled dose.
+    The resampled doses are kept in a least recently used cache bounded by memory size.
+    """
+
+    def __init__(self, nominal_dose:sitk.Image, subdivisions=4, max_megabytes=1000.0):
+        """
+        :param nominal_dose : The dose distribution in a static patient
+        :param subdivisions : Number of quantisation steps per voxel along each axis
+        :param max_megabytes: Memory bound of the cached doses (MB)
+        """
+        self.nominal_dose = nominal_dose
+        self.subdivisions = subdivisions
+        self.direction = np.array(nominal_dose.GetDirection()).reshape(3, 3)
+        self.spacing = np.array(nominal_dose.GetSpacing())
+        self.max_bytes = int(max_megabytes * 1e6)
+
+        self._doses = OrderedDict()
+        self._num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantise(self, displacements:np.array) -> np.array:
+        """ The indices of the displacements (mm, x y z) on the quantisation grid, in voxels of the dose grid
+        (along the image axes, x y z) times the subdivisions. """
+        offsets = voxel_offsets(self.nominal_dose, np.atleast_2d(displacements))[:, ::-1]
+        return np.round(offsets * self.subdivisions).astype(np.int64)
+
+    def translation(self, key:tuple) -> np.array:
+        """ The displacement (mm, x y z) of the indices on the quantisation grid, see quantise. """
+        return self.direction @ (np.asarray(key, dtype=float) / self.subdivisions * self.spacing)
+
+    def _resample(self, key:tuple) -> np.array:
+        translation = sitk.TranslationTransform(3, self.translation(key).tolist())
+        dose = sitk.Resample(self.nominal_dose, self.nominal_dose, translation, sitk.sitkLinear, 0.0, sitk.sitkFloat64)
+        return sitk.GetArrayFromImage(dose)
+
+    def shifted_dose(self, key:tuple) -> np.array:
+        """ The nominal dose (float64 array) resampled at the quantised translation, see quantise. """
+        key = tuple(int(k) for k in key)
+        if key in self._doses:
+            self.hits += 1
+            self._doses.move_to_end(key)
+            return self._doses[key]
+
+        self.misses += 1
+        dose = self._resample(key)
+        dose.flags.writeable = False
+
+        # a dose larger than the bound is not cached
+        if dose.nbytes <= self.max_bytes:
+            while self._num_bytes + dose.nbytes > self.max_bytes:
+                _, evicted = self._doses.popitem(last=False)
+                self._num_bytes -= evicted.nbytes
+                self.evictions += 1
+            self._doses[key] = dose
+            self._num_bytes += dose.nbytes
+
+        return dose
+
+    def accumulate(self, displacements:np.array, weights:np.array) -> sitk.Image:
+        """ Accumulate the dose over the displacements. The weights of displacements quantised to the same
+        translation are summed first, so the dose is resampled (or read from the cache) once per distinct position.
+
+        :param displacements: [step, (x, y, z)] displacements (mm)
+        :param weights      : The weight of each step, e.g. delta MU / total MU
+        :return: The accumulated dose (float64) on the grid of the nominal dose
+        """
+        weights = np.asarray(weights, dtype=float)
+        if len(weights) != len(displacements):
+            raise ValueError(f'Number of weights {len(weights)} does not match the number of displacements {len(displacements)}')
+
+        accumulated = np.zeros(self.nominal_dose.GetSize()[::-1])
+        if len(weights) > 0:
+            keys, inverse = np.unique(self.quantise(displacements), axis=0, return_inverse=True)
+            key_weights = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+            for key, weight in zip(keys, key_weights):
+                if weight != 0:
+                    accumulated += weight * self.shifted_dose(key)
+
+        accumulated_dose = sitk.GetImageFromArray(accumulated)
+        accumulated_dose.CopyInformation(self.nominal_dose)
+        return accumulated_dose
+
+    @property
+    def hit_rate(self) -> float|None:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else None
+
+    def statistics(self) -> dict:
+        return {'Hits': self.hits,
+                'Misses': self.misses,
+                'HitRate': self.hit_rate,
+                'Evictions': self.evictions,
+                'NumEntries': len(self._doses),
+                'Megabytes': self._num_bytes / 1e6}
@@ -1,21 +1,33 @@
 
 
+import os
+import time
 import numpy as np
 import SimpleITK as sitk
+from concurrent.futures import ProcessPoolExecutor
 
 from readcine.convert_to_sitk import is_same_geometry
 from .readcine.readcines import CineImage, SliceDirection, resample_cine_to_identity 
-from .registration.create_mask import create_registration_mask, create_grid
-from .registration.preprocessing import crop_sequence, crop_image, find_crop_box
-from .registration.preprocessing import histogram_matching_sequence, image_to_2d, sequence_to_2d
-from .registration.group import group_registration_elastix
+from .registration.create_mask import create_registration_mask, create_registration_mask_from_contours, create_grid, registration_mask_family
+from .registration.rasterise_plane import rasterise_contours_to_plane
+from .registration.preprocessing import crop_sequence, crop_image, find_crop_box, histogram_matching_sequence, image_to_2d, sequence_to_2d
+from .registration.group import group_registration_elastix, group_registration_elastix_telemetry, group_registration_elastix_warm
+from .registration.config import RegistrationConfig, registration_profile
+from .registration.phase_correlation import phase_correlation_registration
+from .registration.pyramid import PreprocessedStack, coarse_to_fine_registration
+from .registration.windowed import window_ranges, stitch_windows
+from .registration.warm_start import WarmStart
+from .registration.mask_cache import mask_cache_key, cached_masks
+from .registration.result_cache import registration_cache_key, cached_registration
+from .registration.telemetry import RegistrationTelemetry, registration_record
+from .patient_data import read_sop_instance_uid, read_roi_contours
 from U2Dose.patient.Roi import Roi
 from U2Dose.dicomio.rtstruct import RtStruct
 
 #################################################################################
-def parameter_map_to_displacements(transform_parameter_map, reset_first=True):
-    """ Extracts the displacements from a transform parameter map.
-    Two parameters per displacement, one for each direction.
+def reset_to_first(displacements:np.array, num_frames=10) -> np.array:
+    """ Make the displacements relative to the first frames. 
+    The mean of the first frames, without the extreme values, is subtracted per direction.
     """
     def mean_wo_extreme(v):
         imin = np.argmin(v)
@@ -23,23 +35,37 @@ def parameter_map_to_displacements(transform_parameter_map, reset_first=True):
         v = np.delete(v,[imin, imax])
         return v
 
-    transform_parameters = transform_parameter_map['TransformParameters']
-    even = transform_parameters[::2]
-    odd = transform_parameters[1::2]
-    displacements = np.zeros([len(even), 2])
-    displacements[:,0] = even
-    displacements[:,1] = odd
-    if reset_first:
-        v = displacements[0:10,0]
-        v = mean_wo_extreme(v)
-        displacements[:,0] -= np.mean(v)
+    displacements = np.array(displacements, dtype=float)
+
+    v = displacements[0:num_frames,0]
+    v = mean_wo_extreme(v)
+    displacements[:,0] -= np.mean(v)
+
+    v = displacements[0:num_frames,1]
+    v = mean_wo_extreme(v)
+    displacements[:,1] -= np.mean(v)
+
+    return displacements
 
-        v = displacements[0:10,1]
-        v = mean_wo_extreme(v)
-        displacements[:,1] -= np.mean(v)
+#################################################################################
+def transform_parameters_to_displacements(transform_parameters, reset_first=True) -> np.array:
+    """ Extracts the displacements from the transform parameters of a TranslationStackTransform.
+    Two parameters per displacement, one for each direction.
+    """
+    transform_parameters = np.array(transform_parameters, dtype=float)
+    displacements = np.zeros([len(transform_parameters) // 2, 2])
+    displacements[:,0] = transform_parameters[::2]
+    displacements[:,1] = transform_parameters[1::2]
+    if reset_first:
+        displacements = reset_to_first(displacements)
     
     return displacements
 
+#################################################################################
+def parameter_map_to_displacements(transform_parameter_map, reset_first=True):
+    """ Extracts the displacements from a transform parameter map, see transform_parameters_to_displacements. """
+    return transform_parameters_to_displacements(transform_parameter_map['TransformParameters'], reset_first)
+
 
 #################################################################################
 def sort_cines_direction(cines:list[CineImage]) -> list[list[CineImage]]:
@@ -75,28 +101,19 @@ def filter_geometry(cines:list[CineImage], reference_image:CineImage=None) -> li
     return list(filtered_cines)
 
 #################################################################################
-def prepare_masks(transversal, coronal, sagittal, rtss:RtStruct):
-    """ Prepare the masks and crop boxes for subsequent motion analysis. """
-
-    # Create the grid for the mask
-    grid = create_grid(transversal, coronal, sagittal)
-    z_mm = Roi.from_rtstruct(rtss, name='Z_MM', grid=grid)
-
-    # Create masks per slice direction
-    mask_transversal = create_registration_mask(z_mm, transversal)
-    mask_coronal = create_registration_mask(z_mm, coronal)
-    mask_sagittal = create_registration_mask(z_mm, sagittal)
+def crop_masks(mask_transversal:sitk.Image, mask_coronal:sitk.Image, mask_sagittal:sitk.Image, margin=30):
+    """ Crop the masks to the box around the mask (with a margin) and convert to 2D images. """
 
     # crop mask to box
-    crop_box_transversal = find_crop_box(mask_transversal, m=30)
+    crop_box_transversal = find_crop_box(mask_transversal, m=margin)
     mask_transversal_cropped = crop_image(mask_transversal, crop_box_transversal)
     mask_transversal_cropped = sitk.Cast(mask_transversal_cropped, sitk.sitkUInt8)
     
-    crop_box_coronal = find_crop_box(mask_coronal, m=30)
+    crop_box_coronal = find_crop_box(mask_coronal, m=margin)
     mask_coronal_cropped = crop_image(mask_coronal, crop_box_coronal)
     mask_coronal_cropped = sitk.Cast(mask_coronal_cropped, sitk.sitkUInt8)
 
-    crop_box_sagittal = find_crop_box(mask_sagittal, m=30)
+    crop_box_sagittal = find_crop_box(mask_sagittal, m=margin)
     mask_sagittal_cropped = crop_image(mask_sagittal, crop_box_sagittal)
     mask_sagittal_cropped = sitk.Cast(mask_sagittal_cropped, sitk.sitkUInt8)
 
@@ -107,6 +124,65 @@ def prepare_masks(transversal, coronal, sagittal, rtss:RtStruct):
     
     return [mask_transversal_cropped, mask_coronal_cropped, mask_sagittal_cropped],[crop_box_transversal, crop_box_coronal, crop_box_sagittal] 
 
+#################################################################################
+def prepare_masks(transversal, coronal, sagittal, z_mm_contours:list[np.array], dilation_distance=20, num_pixels_per_side=3, margin=30):
+    """ Prepare the masks and crop boxes for subsequent motion analysis. 
+    The Z_MM contours are rasterised directly in each cine plane.
+    """
+
+    # Create masks per slice direction
+    mask_transversal = create_registration_mask_from_contours(z_mm_contours, transversal, dilation_distance, num_pixels_per_side)
+    mask_coronal = create_registration_mask_from_contours(z_mm_contours, coronal, dilation_distance, num_pixels_per_side)
+    mask_sagittal = create_registration_mask_from_contours(z_mm_contours, sagittal, dilation_distance, num_pixels_per_side)
+
+    return crop_masks(mask_transversal, mask_coronal, mask_sagittal, margin)
+
+#################################################################################
+def prepare_mask_family(transversal, coronal, sagittal, z_mm_contours:list[np.array], 
+                        dilation_distances:list[float], num_pixels_per_sides:list[int], margin=30) -> dict:
+    """ Prepare masks and crop boxes for all combinations of dilation distances and center cross sizes.
+    The contours are rasterised and the distance map computed once per slice direction.
+
+    :return: dictionary with (dilation_distance, num_pixels_per_side) as key and (masks, crop_boxes) as value, 
+             see prepare_masks
+    """
+    families = []
+    for cine in [transversal, coronal, sagittal]:
+        mask_slice = rasterise_contours_to_plane(z_mm_contours, cine.image)
+        families.append(registration_mask_family(mask_slice, dilation_distances, num_pixels_per_sides))
+
+    masks = {}
+    for setting in families[0].keys():
+        masks[setting] = crop_masks(families[0][setting], families[1][setting], families[2][setting], margin)
+
+    return masks
+
+#################################################################################
+def prepare_masks_cached(transversal, coronal, sagittal, rtss_filename:str, cache_dir:str|None,
+                         dilation_distance=20, num_pixels_per_side=3, margin=30):
+    """ Prepare the masks and crop boxes, reusing previously created masks from the cache directory.
+    On a cache hit the structure set is not read. 
+
+    :param rtss_filename: Filename of the RT structure set containing Z_MM
+    :param cache_dir    : Directory of the mask cache, None to disable caching
+    :return: masks and crop boxes as returned by prepare_masks
+    """
+    def create_masks():
+        z_mm_contours = read_roi_contours(rtss_filename, 'Z_MM')
+        return prepare_masks(transversal, coronal, sagittal, z_mm_contours, dilation_distance, num_pixels_per_side, margin)
+
+    if cache_dir is None:
+        return create_masks()
+
+    parameters = {'type': 'registration',
+                  'rasterisation': 'plane',
+                  'dilation_distance': dilation_distance, 
+                  'num_pixels_per_side': num_pixels_per_side, 
+                  'margin': margin}
+    key = mask_cache_key(read_sop_instance_uid(rtss_filename), 'Z_MM', [transversal, coronal, sagittal], parameters)
+
+    return cached_masks(cache_dir, key, create_masks)
+
 
 #################################################################################
 def resample_to_identity(transversals:list[CineImage], coronals:list[CineImage], sagittals:list[CineImage]
@@ -121,10 +197,10 @@ def resample_to_identity(transversals:list[CineImage], coronals:list[CineImage],
 
 #################################################################################
 def prepare_images(transversals:list[sitk.Image], coronals:list[sitk.Image], sagittals:list[sitk.Image], 
-                   crop_boxes) -> tuple[list[sitk.Image], list[sitk.Image], list[sitk.Image]]:
+                   crop_boxes, references:list[sitk.Image]=None) -> tuple[list[sitk.Image], list[sitk.Image], list[sitk.Image]]:
     """ Prepare images for motion analysis, 
     1. Crop to crop box
-    2. Histogram matching 
+    2. Histogram matching to the references (cropped images), if None the 10th image of each sequence
     3. Convert to 2D images. """
     
     # Crop images to box
@@ -133,9 +209,11 @@ def prepare_images(transversals:list[sitk.Image], coronals:list[sitk.Image], sag
     sagittals_cropped = crop_sequence(sagittals, crop_boxes[2])
     
     # Histogram matching
-    transversals_cropped = histogram_matching_sequence(transversals_cropped[10], transversals_cropped)
-    coronals_cropped = histogram_matching_sequence(coronals_cropped[10], coronals_cropped)
-    sagittals_cropped = histogram_matching_sequence(sagittals_cropped[10], sagittals_cropped)
+    if references is None:
+        references = [transversals_cropped[10], coronals_cropped[10], sagittals_cropped[10]]
+    transversals_cropped = histogram_matching_sequence(references[0], transversals_cropped)
+    coronals_cropped = histogram_matching_sequence(references[1], coronals_cropped)
+    sagittals_cropped = histogram_matching_sequence(references[2], sagittals_cropped)
 
     # convert to 2D images
     transversals_cropped = sequence_to_2d(transversals_cropped, SliceDirection.TRANSVERSAL)
@@ -237,22 +315,169 @@ def prepare_motion_analysis_(cines:list[CineImage], rtss:RtStruct):
 
 
 #################################################################################
-def motion_analysis_single_plane(image_sequence:list[sitk.Image], mask:sitk.Image) -> np.array:
-    """ Perform the group registration of a sequence of images. The mask determines which pixels are used for evaluation."""
-
-    # 
-    # perform the group registration
-    #
-    _resultImage, transformParameterMap = group_registration_elastix(image_sequence, mask) 
+def motion_analysis_single_plane(image_sequence:list[sitk.Image], mask:sitk.Image, number_of_threads:int=None, 
+                                 config:RegistrationConfig=None, reset_first=True, cache_dir:str=None, 
+                                 return_record=False) -> np.array:
+    """ Perform the group registration of a sequence of images. The mask determines which pixels are used for evaluation.
+    If a cache directory is given, the transform parameters are reused when the same images and mask were registered
+    with the same settings before, see registration_cache_key.
+    If return_record, the displacements and the telemetry record of the registration are returned.
+    """
+    if config is None:
+        config = registration_profile('default')
+
+    record = None
+    def register():
+        nonlocal record
+        # 
+        # perform the group registration
+        #
+        if return_record:
+            transformParameterMap, record = group_registration_elastix_telemetry(image_sequence, mask, number_of_threads=number_of_threads, 
+                                                                                 config=config) 
+        else:
+            _resultImage, transformParameterMap = group_registration_elastix(image_sequence, mask, number_of_threads=number_of_threads, 
+                                                                             config=config) 
+        return transformParameterMap[0]['TransformParameters']
+
+    parameters = {'type': 'group_registration',
+                  'transform': 'TranslationStackTransform',
+                  'metric': 'VarianceOverLastDimensionMetric',
+                  'config': config.registration_parameters()}
+    start = time.perf_counter()
+    key = registration_cache_key(image_sequence, mask, parameters) if cache_dir is not None else None
+    transform_parameters = cached_registration(cache_dir, key, register)
     
     #
     # extract the displacements for the sequence
     #
-    displacements = parameter_map_to_displacements(transformParameterMap[0], reset_first=True)
+    displacements = transform_parameters_to_displacements(transform_parameters, reset_first=reset_first)
+
+    if return_record:
+        if record is None:
+            record = registration_record('elastix', time.perf_counter() - start, 0, config.elastix_iteration_limits()[0], 
+                                         None, None, len(image_sequence), mask.GetNumberOfPixels(), False, cached=True)
+        return displacements, record
 
+    return displacements
+
+#################################################################################
+def motion_analysis_single_plane_fft(image_sequence:list[sitk.Image], mask:sitk.Image, template='first', 
+                                     reset_first=True, workers=-1) -> np.array:
+    """ Register the sequence of images with FFT phase correlation, a fast alternative to the group registration.
+    The displacements are in the same format as motion_analysis_single_plane.
+    The FFTs use workers threads, -1 for all cores.
+    """
+    displacements = phase_correlation_registration(image_sequence, mask, template=template, workers=workers)
+
+    if reset_first:
+        displacements = reset_to_first(displacements)
 
     return displacements
 
+#################################################################################
+def motion_analysis_single_plane_coarse_to_fine(image_sequence:list[sitk.Image]|PreprocessedStack, mask:sitk.Image, 
+                                                factors=(4, 2, 1), reset_first=True, workers=-1) -> np.array:
+    """ Register the sequence of images coarse to fine, phase correlation on a binned stack refined by a small
+    search at full resolution, see coarse_to_fine_registration. The displacements are in the same format as 
+    motion_analysis_single_plane.
+    Pass a PreprocessedStack instead of the images to reuse its pyramid between runs (the mask is then ignored).
+    The FFTs use workers threads, -1 for all cores.
+    """
+    stack = image_sequence if isinstance(image_sequence, PreprocessedStack) else PreprocessedStack(image_sequence, mask)
+    displacements = coarse_to_fine_registration(stack, factors=factors, workers=workers)
+
+    if reset_first:
+        displacements = reset_to_first(displacements)
+
+    return displacements
+
+#################################################################################
+def motion_analysis_plane(method:str, image_sequence:list[sitk.Image]|PreprocessedStack, mask:sitk.Image, number_of_threads:int=None, 
+                          config:RegistrationConfig=None, reset_first=True, cache_dir:str=None, 
+                          return_record=False) -> np.array:
+    """ Extract the displacements of a sequence of images with the given method.
+
+    :param method: 'elastix' for the group registration, 'phase_correlation' for FFT phase correlation or
+                   'coarse_to_fine' for phase correlation on a binned pyramid refined at full resolution
+    :param image_sequence: The images, for coarse_to_fine also a PreprocessedStack to reuse its pyramid between 
+                           calls (the mask is then ignored)
+    :param number_of_threads: Threads of the registration (Elastix, or the FFTs of the phase correlation), 
+                              if None all cores
+    :param reset_first: Make the displacements relative to the first frames, see reset_to_first
+    :param cache_dir: Directory of the registration result cache (elastix only), None to disable caching
+    :param return_record: Return the displacements and the telemetry record, see registration_record
+    """
+    if isinstance(image_sequence, PreprocessedStack) and method != 'coarse_to_fine':
+        raise ValueError(f'A preprocessed stack can only be registered coarse_to_fine, not {method}')
+
+    if method == 'elastix':
+        return motion_analysis_single_plane(image_sequence, mask, number_of_threads, config, reset_first=reset_first,
+                                            cache_dir=cache_dir, return_record=return_record)
+    
+    # the FFT threads of the phase correlation, the share of the cores of the worker (see threads_per_worker)
+    workers = number_of_threads if number_of_threads is not None else -1
+    start = time.perf_counter()
+    if method == 'phase_correlation':
+        displacements = motion_analysis_single_plane_fft(image_sequence, mask, reset_first=reset_first, workers=workers)
+    elif method == 'coarse_to_fine':
+        displacements = motion_analysis_single_plane_coarse_to_fine(image_sequence, mask, reset_first=reset_first, 
+                                                                    workers=workers)
+    else:
+        raise ValueError(f'Unknown motion analysis method {method}')
+
+    if return_record:
+        num_pixels = image_sequence.mask.size if isinstance(image_sequence, PreprocessedStack) else mask.GetNumberOfPixels()
+        record = registration_record(method, time.perf_counter() - start, 0, 0, None, None, len(image_sequence), 
+                                     num_pixels, False)
+        return displacements, record
+
+    return displacements
+
+#################################################################################
+def threads_per_worker(num_workers:int) -> int:
+    """ Number of threads per worker such that the workers together do not use more than the available cores. """
+    return max(1, (os.cpu_count() or 1) // num_workers)
+
+#################################################################################
+def motion_analysis_planes_parallel(image_sequences:list[list[sitk.Image]], masks:list[sitk.Image], max_workers:int=None,
+                                    config:RegistrationConfig=None, methods:list[str]=None, 
+                                    cache_dir:str=None, telemetry:RegistrationTelemetry=None) -> list[np.array]:
+    """ Perform the group registration of several slice directions concurrently, one process per slice direction.
+    The cores are shared between the processes, i.e. Elastix in each process gets its share of the threads.
+    Only the displacements are returned from the processes (not the registered images). 
+
+    :param image_sequences: The image sequence per slice direction
+    :param masks: The mask per slice direction
+    :param max_workers: Number of processes, if None one per slice direction
+    :param config: The registration config, the threads of the config are split between the processes
+    :param methods: Method per slice direction, see motion_analysis_plane, if None elastix for all
+    :param cache_dir: Directory of the registration result cache, None to disable caching
+    :param telemetry: If given, the telemetry of the registrations is added as the next batch
+    :return: displacements per slice direction
+    """
+    if methods is None:
+        methods = ['elastix'] * len(image_sequences)
+    if max_workers is None:
+        max_workers = len(image_sequences)
+    number_of_threads = threads_per_worker(max_workers)
+    if config is not None and config.number_of_threads is not None:
+        number_of_threads = max(1, config.number_of_threads // max_workers)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(motion_analysis_plane, method, image_sequence, mask, number_of_threads, config, 
+                                   cache_dir=cache_dir, return_record=telemetry is not None) 
+                   for method, image_sequence, mask in zip(methods, image_sequences, masks)]
+        results = [future.result() for future in futures]
+
+    if telemetry is None:
+        return results
+
+    batch = telemetry.num_batches
+    for plane, (_, record) in enumerate(results):
+        telemetry.add(record, plane, batch)
+    return [displacements for displacements, _ in results]
+
 #################################################################################
 def extract_motion2(images:list[sitk.Image], mask:sitk.Image, crop_box: np.array) -> np.array:
     """ Extract the motion of the from a cine directory.
@@ -288,11 +513,49 @@ def extract_motion2(images:list[sitk.Image], mask:sitk.Image, crop_box: np.array
 
 
 
+#################################################################################
+def motion_analysis_warm(image_sequences:list[list[sitk.Image]], masks:list[sitk.Image], warm_start:WarmStart, 
+                         parallel=True, config:RegistrationConfig=None, 
+                         telemetry:RegistrationTelemetry=None) -> list[np.array]:
+    """ Group registration of the prepared image sequences (one per slice direction), each started from the
+    prediction of the warm start. The warm start is updated with the solutions and the iterations used.
+    The config must stop early (early_stopping_tolerance), otherwise every registration runs to the iteration cap.
+    If given, the telemetry of the registrations is added to the telemetry as the next batch.
+
+    :return: displacements per slice direction, reset to the first images
+    """
+    if config is None or config.early_stopping_tolerance is None:
+        raise ValueError('The warm start requires a config with early stopping, see RegistrationConfig.with_early_stopping')
+
+    initial_displacements = [warm_start.initial_displacements(plane, len(image_sequence)) 
+                             for plane, image_sequence in enumerate(image_sequences)]
+
+    if parallel:
+        number_of_threads = threads_per_worker(len(image_sequences))
+        with ProcessPoolExecutor(max_workers=len(image_sequences)) as executor:
+            futures = [executor.submit(group_registration_elastix_warm, image_sequence, mask, initial, number_of_threads, config)
+                       for image_sequence, mask, initial in zip(image_sequences, masks, initial_displacements)]
+            results = [future.result() for future in futures]
+    else:
+        results = [group_registration_elastix_warm(image_sequence, mask, initial, config=config)
+                   for image_sequence, mask, initial in zip(image_sequences, masks, initial_displacements)]
+
+    displacements = []
+    batch = telemetry.num_batches if telemetry is not None else None
+    for plane, (displacements_raw, record) in enumerate(results):
+        warm_start.update(plane, displacements_raw, record['Iterations'])
+        displacements.append(reset_to_first(displacements_raw))
+        if telemetry is not None:
+            telemetry.add(record, plane, batch)
+
+    return displacements
+
 #################################################################################
 def motion_analysis(transversals:list[CineImage], coronals:list[CineImage], sagittals:list[CineImage], 
                     mask_transversal:sitk.Image, mask_coronal:sitk.Image, mask_sagittal:sitk.Image, 
-                    crop_boxes: np.array
-                    ) -> tuple[np.array, np.array, np.array]:
+                    crop_boxes: np.array, parallel=True, config:RegistrationConfig=None, 
+                    methods:list[str]=None, warm_start:WarmStart=None, cache_dir:str=None,
+                    telemetry:RegistrationTelemetry=None) -> tuple[np.array, np.array, np.array]:
     """ Extract the motion of the from a cine directory.
     The cines are 
     1. Sorted in increasing time
@@ -303,15 +566,104 @@ def motion_analysis(transversals:list[CineImage], coronals:list[CineImage], sagi
     6. The displacements are extracted from the transform parameter map.
 
     The motion is returned as a three tuples of (times, displacements), one for each slice direction.
+    If parallel the three slice directions are registered concurrently in separate processes.
+    The config (default profile if None) sets the registration settings.
+    The methods select the registration per slice direction (transversal, coronal, sagittal), elastix (default)
+    phase_correlation or coarse_to_fine, see motion_analysis_plane.
+    If a warm start is given, the elastix registrations start from the solution of the previous batch, 
+    see motion_analysis_warm. The warm start applies to elastix only and cannot be combined with methods, 
+    the config must stop early.
+    If a cache directory is given, unchanged registrations are read from the registration result cache (not with 
+    warm start, where the result depends on the previous batch).
+    If a telemetry is given, the telemetry of the registrations is added as the next batch.
     """
 
+    if warm_start is not None and methods is not None:
+        raise ValueError('The warm start applies to the elastix registration only, not to methods')
+    if warm_start is not None and cache_dir is not None:
+        raise ValueError('Registrations with warm start depend on the previous batch and cannot be cached')
+
     transversals_sitk, coronals_sitk, sagittals_sitk = prepare_images(transversals, coronals, sagittals, crop_boxes)
 
-    displacements_transversal = motion_analysis_single_plane(transversals_sitk, mask_transversal) 
-    displacements_coronal = motion_analysis_single_plane(coronals_sitk, mask_coronal) 
-    displacements_sagittal = motion_analysis_single_plane(sagittals_sitk, mask_sagittal)
+    if warm_start is not None:
+        return motion_analysis_warm([transversals_sitk, coronals_sitk, sagittals_sitk], 
+                                    [mask_transversal, mask_coronal, mask_sagittal], warm_start, parallel, config, 
+                                    telemetry)
 
-    displacements = [displacements_transversal, displacements_coronal, displacements_sagittal]
+    if methods is None:
+        methods = ['elastix', 'elastix', 'elastix']
+
+    if parallel:
+        displacements = motion_analysis_planes_parallel([transversals_sitk, coronals_sitk, sagittals_sitk], 
+                                                        [mask_transversal, mask_coronal, mask_sagittal], config=config,
+                                                        methods=methods, cache_dir=cache_dir, telemetry=telemetry)
+        return displacements
+
+    results = [motion_analysis_plane(method, image_sequence, mask, config=config, cache_dir=cache_dir, 
+                                     return_record=telemetry is not None)
+               for method, image_sequence, mask in zip(methods, [transversals_sitk, coronals_sitk, sagittals_sitk], 
+                                                       [mask_transversal, mask_coronal, mask_sagittal])]
+
+    if telemetry is None:
+        return results
+
+    batch = telemetry.num_batches
+    for plane, (_, record) in enumerate(results):
+        telemetry.add(record, plane, batch)
+
+    displacements = [displacements for displacements, _ in results]
 
     return displacements
 
+#################################################################################
+def motion_analysis_windowed(image_sequences:list[list[sitk.Image]], masks:list[sitk.Image], 
+                             window_size=200, overlap=50, max_workers:int=None, config:RegistrationConfig=None,
+                             methods:list[str]=None, cache_dir:str=None, 
+                             telemetry:RegistrationTelemetry=None) -> list[np.array]:
+    """ Extract the motion with the sequences split in overlapping windows, all registered in parallel processes.
+    The windows of a slice direction are stitched by aligning them over the overlaps (least squares),
+    and the stitched displacements are reset to the first frames.
+    The cost scales linearly with the length of the sequence, and no window depends on another.
+    With a cache directory each window is cached on its own, so a rerun only registers the changed windows.
+
+    :param image_sequences: Prepared (cropped, 2D) image sequence per slice direction, see prepare_images
+    :param masks: The mask per slice direction
+    :param window_size: Number of frames per window
+    :param overlap: Number of frames shared by adjacent windows
+    :param max_workers: Number of processes, if None the number of cores
+    :param config: The registration config
+    :param methods: Method per slice direction, see motion_analysis_plane, if None elastix for all
+    :param cache_dir: Directory of the registration result cache, None to disable caching
+    :param telemetry: If given, the telemetry of the registrations is added, one batch per window
+    :return: displacements per slice direction
+    """
+    if methods is None:
+        methods = ['elastix'] * len(image_sequences)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    number_of_threads = threads_per_worker(max_workers)
+
+    ranges = [window_ranges(len(image_sequence), window_size, overlap) for image_sequence in image_sequences]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for method, image_sequence, mask, plane_ranges in zip(methods, image_sequences, masks, ranges):
+            futures.append([executor.submit(motion_analysis_plane, method, image_sequence[start:stop], mask, 
+                                            number_of_threads, config, False, cache_dir, 
+                                            return_record=telemetry is not None) 
+                            for start, stop in plane_ranges])
+        
+        window_results = [[future.result() for future in plane_futures] for plane_futures in futures]
+
+    if telemetry is None:
+        window_displacements = window_results
+    else:
+        first_batch = telemetry.num_batches
+        for plane, plane_results in enumerate(window_results):
+            for window, (_, record) in enumerate(plane_results):
+                telemetry.add(record, plane, first_batch + window)
+        window_displacements = [[displacements for displacements, _ in plane_results] for plane_results in window_results]
+
+    displacements = [reset_to_first(stitch_windows(d, plane_ranges)) for d, plane_ranges in zip(window_displacements, ranges)]
+
+    return displacements
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+
+from MRLCinema.readcine.readcines import CineImage
+from readcine.readcines_mha import readcines_mha
+from MRLCinema.extract_motion import motion_analysis, resample_to_identity, filter_geometry
+from MRLCinema.extract_motion import sort_cines_direction, prepare_mask_family
+from MRLCinema.patient_data import read_roi_contours
+
+
+#################################################################################
+def trace_roughness(displacements:np.array) -> float:
+    """ Roughness of a motion trace, RMS of the second difference (mm) over both directions.
+    Breathing motion is smooth on the cine frame rate, so high roughness indicates registration noise or failures.
+    """
+    if len(displacements) < 3:
+        return np.nan
+    second_difference = np.diff(displacements, n=2, axis=0)
+    return float(np.sqrt(np.mean(second_difference**2)))
+
+#################################################################################
+def trace_amplitude(displacements:np.array) -> float:
+    """ Motion amplitude of a trace, length of the 5 to 95 percentile range of the displacements (mm).
+    A registration that failed to follow the motion gives a flat trace, which is smooth but has no amplitude.
+    """
+    if len(displacements) == 0:
+        return np.nan
+    percentile_range = np.percentile(displacements, 95, axis=0) - np.percentile(displacements, 5, axis=0)
+    return float(np.linalg.norm(percentile_range))
+
+#################################################################################
+def score_displacements(displacements:list[np.array], min_amplitude=1.0) -> dict:
+    """ Score the motion traces of the three slice directions (transversal, coronal, sagittal).
+    The traces are valid if all of them move at least min_amplitude (mm), so flat traces are not ranked as smooth.
+    """
+    roughness = [trace_roughness(d) for d in displacements]
+    max_jump = [float(np.max(np.abs(np.diff(d, axis=0)))) if len(d) > 1 else np.nan for d in displacements]
+    amplitude = [trace_amplitude(d) for d in displacements]
+
+    return {'Roughness': roughness,
+            'MeanRoughness': float(np.nanmean(roughness)),
+            'MaxJump': max_jump,
+            'Amplitude': amplitude,
+            'Valid': bool(np.all(np.array(amplitude) >= min_amplitude))}
+
+#################################################################################
+def mask_sweep(transversals:list[CineImage], coronals:list[CineImage], sagittals:list[CineImage], z_mm_contours:list[np.array],
+               dilation_distances:list[float], num_pixels_per_sides:list[int], margin=30, min_amplitude=1.0) -> list[dict]:
+    """ Extract the motion for all combinations of mask settings and score the resulting motion traces.
+    The cines must be resampled to identity direction cosines.
+
+    :param min_amplitude: Minimum motion amplitude (mm) of each trace, settings with a flat trace are ranked last
+    :return: List of results, one per setting, sorted with the smoothest valid motion trace first
+    """
+    mask_family = prepare_mask_family(transversals[0], coronals[0], sagittals[0], z_mm_contours,
+                                      dilation_distances, num_pixels_per_sides, margin)
+
+    results = []
+    for (dilation_distance, num_pixels_per_side), (masks, crop_boxes) in mask_family.items():
+        start_time = time.time()
+        displacements = motion_analysis(transversals, coronals, sagittals, masks[0], masks[1], masks[2], crop_boxes)
+
+        result = {'DilationDistance': dilation_distance,
+                  'NumPixelsPerSide': num_pixels_per_side,
+                  'Time': time.time() - start_time}
+        result.update(score_displacements(displacements, min_amplitude))
+        results.append(result)
+
+        print(f'Dilation {dilation_distance} mm, cross {num_pixels_per_side} pixels: '
+              f'roughness {result["MeanRoughness"]:.3f} mm ({result["Time"]:.1f} s)'
+              f'{"" if result["Valid"] else ", flat trace"}')
+
+    return sorted(results, key=lambda result: (not result['Valid'], result['MeanRoughness']))
+
+
+if __name__ == "__main__":
+    """
+    Sweep the registration mask settings for one fraction.
+    Usage: python mask_sweep.py <cine_times_filenames.json> <rtss.dcm> [num_cines]
+    """
+    cine_filename_times_filename = sys.argv[1]
+    rtss_filename = sys.argv[2]
+    num_cines = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+
+    dilation_distances = [5, 10, 15, 20, 25, 30]
+    num_pixels_per_sides = [0, 3, 6]
+
+    with open(cine_filename_times_filename, 'r') as f:
+        cine_filename_times = json.load(f)
+
+    cine_filenames = list(cine_filename_times.keys())[0:num_cines]
+    cines = readcines_mha({ filename: cine_filename_times[filename] for filename in cine_filenames })
+
+    transversals, coronals, sagittals = sort_cines_direction(cines)
+    transversals, coronals, sagittals = filter_geometry(transversals), filter_geometry(coronals), filter_geometry(sagittals)
+    transversals, coronals, sagittals = resample_to_identity(transversals, coronals, sagittals)
+
+    z_mm_contours = read_roi_contours(rtss_filename, 'Z_MM')
+    results = mask_sweep(transversals, coronals, sagittals, z_mm_contours, dilation_distances, num_pixels_per_sides)
+
+    for result in results:
+        print(f'{result["DilationDistance"]:5} mm {result["NumPixelsPerSide"]:3} pixels {result["MeanRoughness"]:.3f} mm'
+              f'{"" if result["Valid"] else " (flat trace)"}')
+
+    results_filename = os.path.splitext(cine_filename_times_filename)[0] + '_mask_sweep.json'
+    with open(results_filename, 'w') as f:
+        json.dump(results, f, indent=4)
+        print(f'Wrote mask sweep to {results_filename}')
@@ -1,37 +1,248 @@
 
 
+import os
 import numpy as np
 import json
+from .motion_statistics import TDigest, motion_statistics_sketch
+
+# Binary motion trace format (.mtrace): magic, header length (uint64 little endian), JSON header and the
+# columns (little endian). The header lists name, dtype, shape and offset of each column, relative to the start 
+# of the columns (the first multiple of MTRACE_COLUMN_ALIGNMENT after the header), so they can be memory mapped.
+MTRACE_MAGIC = b'MTRACE01'
+MTRACE_COLUMN_ALIGNMENT = 64
+
+
+def _align(offset:int) -> int:
+    return -(-offset // MTRACE_COLUMN_ALIGNMENT) * MTRACE_COLUMN_ALIGNMENT
+
+
+class _GrowableArray(object):
+    """ Append-only array with amortised growth, the capacity is doubled when full.
+    Appending n rows costs O(n) in total, instead of O(n^2) for repeated np.concatenate.
+    """
+
+    def __init__(self, row_shape:tuple=(), dtype=float, capacity=64):
+        self._data = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+        self._size = 0
+        self._frozen = False
+
+    @staticmethod
+    def wrap(array:np.array):
+        """ A frozen buffer of the array, without copy (e.g. a memory mapped column). """
+        buffer = _GrowableArray(array.shape[1:], array.dtype, capacity=0)
+        buffer._data = array
+        buffer._size = len(array)
+        buffer._frozen = True
+        return buffer
+
+    @staticmethod
+    def from_array(array:np.array, row_shape:tuple=(), dtype=float):
+        """ A buffer holding (a copy of) the array. """
+        array = np.asarray(array, dtype=dtype).reshape((-1,) + tuple(row_shape))
+        buffer = _GrowableArray(row_shape, dtype, capacity=max(len(array), 1))
+        buffer.extend(array)
+        return buffer
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    @property
+    def frozen(self) -> bool:
+        return self._frozen
+
+    @property
+    def array(self) -> np.array:
+        """ Read-only view of the rows appended so far. """
+        view = self._data[0:self._size]
+        view.flags.writeable = False
+        return view
+
+    def _reserve(self, size:int):
+        if self._frozen:
+            raise ValueError('Cannot append to a frozen array')
+        if size <= len(self._data):
+            return
+        capacity = max(2 * len(self._data), size, 1)
+        data = np.empty((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+        data[0:self._size] = self._data[0:self._size]
+        self._data = data
+
+    def append(self, row):
+        self._reserve(self._size + 1)
+        self._data[self._size] = row
+        self._size += 1
+
+    def extend(self, rows:np.array):
+        rows = np.asarray(rows, dtype=self._data.dtype).reshape((-1,) + self._data.shape[1:])
+        self._reserve(self._size + len(rows))
+        self._data[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+
+    def freeze(self) -> np.array:
+        """ Trim the buffer to a compact read-only array, no more rows can be appended. """
+        if not self._frozen:
+            self._data = self._data[0:self._size].copy()
+            self._data.flags.writeable = False
+            self._frozen = True
+        return self._data
+
 
 class MotionTrace():
 
+    PLANES = ['Transversal', 'Coronal', 'Sagittal']
+
     def __init__(self):
         self.patient_ID = None
         self.plan_label = None
-        self.times_transversal = np.array([])
-        self.times_coronal = np.array([])
-        self.times_sagittal = np.array([])
-        self.displacements_transversal = np.array([])
-        self.displacements_coronal = np.array([])
-        self.displacements_sagittal = np.array([])
+        self._times = [_GrowableArray() for _ in self.PLANES]
+        self._displacements = [_GrowableArray((2,)) for _ in self.PLANES]
+        self._fused_timelines = {}
+        self._sketches = [[TDigest(), TDigest()] for _ in self.PLANES]
         self.n_skip = 10
 
     @staticmethod 
     def from_file(filename:str):
         """ Load a motion trace from file. """
         with open(filename, 'r') as f:
-            trace = json.load(f)
-            motion_trace = MotionTrace()
-            motion_trace.patient_ID = trace['PatientID']
-            motion_trace.plan_label = trace['PlanLabel']
-            motion_trace.times_transversal = np.array(trace['TimesTransversal'])
-            motion_trace.displacements_transversal = np.array(list(zip(trace['DisplacementTransversalX'], trace['DisplacementTransversalY'])))
-            motion_trace.times_coronal = np.array(trace['TimesCoronal'])
-            motion_trace.displacements_coronal = np.array(list(zip(trace['DisplacementCoronalX'], trace['DisplacementCoronalZ'])))
-            motion_trace.times_sagittal = np.array(trace['TimesSagittal'])
-            motion_trace.displacements_sagittal = np.array(list(zip(trace['DisplacementSagittalY'], trace['DisplacementSagittalZ'])))
-            return motion_trace
+            return MotionTrace.from_dict(json.load(f))
+
+    @staticmethod
+    def from_dict(trace:dict):
+        """ The motion trace of a motion report, see report.create_report. """
+        motion_trace = MotionTrace()
+        motion_trace.patient_ID = trace['PatientID']
+        motion_trace.plan_label = trace['PlanLabel']
+        motion_trace.times_transversal = np.array(trace['TimesTransversal'])
+        motion_trace.displacements_transversal = np.array(list(zip(trace['DisplacementTransversalX'], trace['DisplacementTransversalY'])))
+        motion_trace.times_coronal = np.array(trace['TimesCoronal'])
+        motion_trace.displacements_coronal = np.array(list(zip(trace['DisplacementCoronalX'], trace['DisplacementCoronalZ'])))
+        motion_trace.times_sagittal = np.array(trace['TimesSagittal'])
+        motion_trace.displacements_sagittal = np.array(list(zip(trace['DisplacementSagittalY'], trace['DisplacementSagittalZ'])))
+        return motion_trace
     
+    def to_binary(self, filename:str):
+        """ Write the trace in the binary columnar format (.mtrace), times and displacements as float64 columns. 
+        The file is first written to a temporary name to never leave a partially written trace.
+        """
+        columns = {}
+        for plane, name in enumerate(self.PLANES):
+            columns[f'Times{name}'] = np.ascontiguousarray(self._times[plane].array, dtype='<f8')
+            columns[f'Displacements{name}'] = np.ascontiguousarray(self._displacements[plane].array, dtype='<f8')
+
+        header = {'PatientID': self.patient_ID, 'PlanLabel': self.plan_label, 'Columns': []}
+        offset = 0
+        for name, column in columns.items():
+            header['Columns'].append({'Name': name, 'DType': column.dtype.str, 'Shape': list(column.shape), 'Offset': offset})
+            offset = _align(offset + column.nbytes)
+        header_bytes = json.dumps(header).encode('utf-8')
+        columns_start = _align(len(MTRACE_MAGIC) + 8 + len(header_bytes))
+
+        filename_tmp = f'{filename}.{os.getpid()}.tmp'
+        with open(filename_tmp, 'wb') as f:
+            f.write(MTRACE_MAGIC)
+            f.write(np.uint64(len(header_bytes)).astype('<u8').tobytes())
+            f.write(header_bytes)
+            for column_header, column in zip(header['Columns'], columns.values()):
+                f.write(b'\0' * (columns_start + column_header['Offset'] - f.tell()))
+                f.write(column.tobytes())
+        os.replace(filename_tmp, filename)
+
+    @staticmethod
+    def from_binary(filename:str, memory_map=True):
+        """ Load a motion trace written by to_binary.
+
+        :param memory_map: Memory map the columns (read-only, read on access), otherwise read into memory
+        """
+        with open(filename, 'rb') as f:
+            if f.read(len(MTRACE_MAGIC)) != MTRACE_MAGIC:
+                raise ValueError(f'{filename} is not a binary motion trace')
+            header_length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        columns_start = _align(len(MTRACE_MAGIC) + 8 + header_length)
+
+        if memory_map:
+            data = np.memmap(filename, dtype=np.uint8, mode='r')
+        else:
+            with open(filename, 'rb') as f:
+                data = f.read()
+
+        columns = {}
+        for column in header['Columns']:
+            dtype = np.dtype(column['DType'])
+            count = int(np.prod(column['Shape']))
+            columns[column['Name']] = np.frombuffer(data, dtype=dtype, count=count, 
+                                                    offset=columns_start + column['Offset']).reshape(column['Shape'])
+
+        motion_trace = MotionTrace()
+        motion_trace.patient_ID = header['PatientID']
+        motion_trace.plan_label = header['PlanLabel']
+        for plane, name in enumerate(MotionTrace.PLANES):
+            motion_trace._times[plane] = _GrowableArray.wrap(columns[f'Times{name}'])
+            motion_trace._displacements[plane] = _GrowableArray.wrap(columns[f'Displacements{name}'].reshape(-1, 2))
+            motion_trace._reset_sketches(plane)
+        return motion_trace
+
+    @property
+    def times_transversal(self) -> np.array:
+        return self._times[0].array
+
+    @times_transversal.setter
+    def times_transversal(self, times:np.array):
+        self._times[0] = _GrowableArray.from_array(times)
+        self._fused_timelines = {}
+
+    @property
+    def times_coronal(self) -> np.array:
+        return self._times[1].array
+
+    @times_coronal.setter
+    def times_coronal(self, times:np.array):
+        self._times[1] = _GrowableArray.from_array(times)
+        self._fused_timelines = {}
+
+    @property
+    def times_sagittal(self) -> np.array:
+        return self._times[2].array
+
+    @times_sagittal.setter
+    def times_sagittal(self, times:np.array):
+        self._times[2] = _GrowableArray.from_array(times)
+        self._fused_timelines = {}
+
+    @property
+    def displacements_transversal(self) -> np.array:
+        return self._displacements[0].array
+
+    @displacements_transversal.setter
+    def displacements_transversal(self, displacements:np.array):
+        self._displacements[0] = _GrowableArray.from_array(displacements, (2,))
+        self._fused_timelines = {}
+        self._reset_sketches(0)
+
+    @property
+    def displacements_coronal(self) -> np.array:
+        return self._displacements[1].array
+
+    @displacements_coronal.setter
+    def displacements_coronal(self, displacements:np.array):
+        self._displacements[1] = _GrowableArray.from_array(displacements, (2,))
+        self._fused_timelines = {}
+        self._reset_sketches(1)
+
+    @property
+    def displacements_sagittal(self) -> np.array:
+        return self._displacements[2].array
+
+    @displacements_sagittal.setter
+    def displacements_sagittal(self, displacements:np.array):
+        self._displacements[2] = _GrowableArray.from_array(displacements, (2,))
+        self._fused_timelines = {}
+        self._reset_sketches(2)
+
     @property
     def displacements_transversal_x(self) -> np.array:
         return self.displacements_transversal[:,0]
@@ -96,35 +307,160 @@ class MotionTrace():
         
         return max(times)
 
-    def add_transversal(self, times:np.array, displacements:np.array):
-        if self._is_transversal_empty():
-            self.times_transversal = times.copy()
-            self.displacements_transversal = displacements.copy()
+    def append_frame(self, plane:int, time:float, displacement:np.array):
+        """ Append the displacement of one frame (online use).
+
+        :param plane: 0 transversal, 1 coronal, 2 sagittal
+        :param displacement: (2,) displacement (mm)
+        """
+        self._times[plane].append(time)
+        self._displacements[plane].append(displacement)
+        self._fused_timelines = {}
+        if self._sketches[plane] is not None:
+            for column, sketch in enumerate(self._sketches[plane]):
+                sketch.update(displacement[column])
+
+    def extend(self, plane:int, times:np.array, displacements:np.array):
+        """ Append the displacements of a sequence of frames (batch use).
+
+        :param plane: 0 transversal, 1 coronal, 2 sagittal
+        :param displacements: [frame, 2] displacements (mm), one per time
+        """
+        if len(times) != len(displacements):
+            raise ValueError(f'Number of times {len(times)} does not match the number of displacements {len(displacements)}')
+        self._times[plane].extend(times)
+        self._displacements[plane].extend(displacements)
+        self._fused_timelines = {}
+        if self._sketches[plane] is not None:
+            for column, sketch in enumerate(self._sketches[plane]):
+                sketch.update(np.asarray(displacements, dtype=float).reshape(-1, 2)[:, column])
+
+    def _reset_sketches(self, plane:int):
+        """ Drop the quantile sketches of the plane, they are rebuilt from its displacements when used. """
+        self._sketches[plane] = None
+
+    @property
+    def sketches(self) -> list[list[TDigest]]:
+        """ The quantile sketches (x, y) per plane, updated with the appended frames. The sketches of loaded or 
+        assigned displacements are built on first use, so loading a trace does not read the displacements. """
+        for plane, sketches in enumerate(self._sketches):
+            if sketches is None:
+                self._sketches[plane] = [TDigest(), TDigest()]
+                for column, sketch in enumerate(self._sketches[plane]):
+                    sketch.update(self._displacements[plane].array[:, column])
+        return self._sketches
+
+    def percentile_ranges(self, q=0.975) -> dict:
+        """ The (q, 1-q) quantiles of each direction per plane from the quantile sketches, available 
+        during online tracking (as plots.displacement_statistics_1d on the full trace). Empty planes are left out. """
+        return {name: [sketch.quantile([q, 1 - q]).tolist() for sketch in sketches] 
+                for name, sketches in zip(self.PLANES, self.sketches) if sketches[0].count > 0}
+
+    def motion_statistics(self, percentile=0.95) -> tuple:
+        """ The percentile of the absolute displacement in x, y and z from the quantile sketches, see 
+        motion_statistics.motion_statistics. """
+        return motion_statistics_sketch(self.sketches[0], self.sketches[2], self.sketches[1], percentile)
+
+    def freeze(self):
+        """ Trim the buffers to compact read-only arrays, when the trace is complete. """
+        for buffer in self._times + self._displacements:
+            buffer.freeze()
+
+    def _add_plane(self, plane:int, times:np.array, displacements:np.array):
+        """ Add a batch. Except for the first batch the displacements start with n_skip reference images 
+        (without times) which are skipped. """
+        if len(self._times[plane]) == 0:
+            self.extend(plane, times, displacements)
         else:
-            d_tranversal = displacements[self.n_skip:]
-            self.displacements_transversal = np.concatenate((self.displacements_transversal, d_tranversal))
-            self.times_transversal = np.concatenate((self.times_transversal, times))
+            self.extend(plane, times, displacements[self.n_skip:])
+
+    def add_transversal(self, times:np.array, displacements:np.array):
+        self._add_plane(0, times, displacements)
 
     def add_coronal(self, times:np.array, displacements:np.array):
-        if self._is_coronal_empty():
-            self.times_coronal = times.copy()
-            self.displacements_coronal = displacements.copy()
-        else:
-            d_coronal = displacements[self.n_skip:]
-            self.displacements_coronal = np.concatenate((self.displacements_coronal, d_coronal))
-            self.times_coronal = np.concatenate((self.times_coronal, times))
+        self._add_plane(1, times, displacements)
 
     def add_sagittal(self, times:np.array, displacements:np.array):
-        if self._is_sagittal_empty():
-            self.times_sagittal = times.copy()
-            self.displacements_sagittal = displacements.copy()
-        else:
-            d_sagittal = displacements[self.n_skip:]
-            self.displacements_sagittal = np.concatenate((self.displacements_sagittal, d_sagittal))
-            self.times_sagittal = np.concatenate((self.times_sagittal, times))
+        self._add_plane(2, times, displacements)
 
     def add(self, times:np.array, displacements:np.array):
         self.add_transversal(times[0], displacements[0])
         self.add_coronal(times[1], displacements[1])
         self.add_sagittal(times[2], displacements[2])
 
+    # (plane, column) of the two planes measuring x, y and z
+    AXIS_COMPONENTS = [[(0, 0), (1, 0)],  # x: transversal x, coronal x
+                       [(0, 1), (2, 0)],  # y: transversal y, sagittal y
+                       [(2, 1), (1, 1)]]  # z: sagittal z, coronal z
+
+    def _sample_planes(self, times:np.array, method:str) -> list[np.array]:
+        """ The 2D displacements of each plane at the times, nan for empty planes.
+
+        :param method: 'previous' the last sample at or before the time (the first sample before the trace), 
+                       'linear' linear interpolation (constant outside the trace)
+        """
+        samples = []
+        for plane_times, displacements in zip(self._times, self._displacements):
+            plane_times, displacements = plane_times.array, displacements.array
+            if len(plane_times) == 0:
+                samples.append(np.full((len(times), 2), np.nan))
+            elif method == 'previous':
+                idx = np.clip(np.searchsorted(plane_times, times, side='right') - 1, 0, len(plane_times) - 1)
+                samples.append(displacements[idx])
+            elif method == 'linear':
+                samples.append(np.stack([np.interp(times, plane_times, displacements[:, i]) for i in range(2)], axis=1))
+            else:
+                raise ValueError(f'Unknown resampling method {method}')
+        return samples
+
+    def fused_timeline(self, method='previous', fusion='mean') -> tuple[np.array, np.array]:
+        """ The 3D displacements on the common timeline (the times of all planes).
+        Each axis is measured by two planes, fused by
+            'mean'   : the mean of the planes
+            'max_abs': the displacement of the largest magnitude
+        Planes without samples are ignored. Cached until the trace is changed.
+
+        :return: times (N,) and displacements (N,3) (mm)
+        """
+        key = (method, fusion)
+        if key in self._fused_timelines:
+            return self._fused_timelines[key]
+
+        if self._is_empty():
+            raise ValueError('Motion trace is empty')
+
+        times = np.unique(np.concatenate([plane_times.array for plane_times in self._times]))
+        samples = self._sample_planes(times, method)
+        displacements = np.empty((len(times), 3))
+        for axis, components in enumerate(self.AXIS_COMPONENTS):
+            values = np.stack([samples[plane][:, column] for plane, column in components], axis=1)
+            if fusion == 'mean':
+                displacements[:, axis] = np.nanmean(values, axis=1)
+            elif fusion == 'max_abs':
+                idx = np.argmax(np.nan_to_num(np.abs(values), nan=-1.0), axis=1)
+                displacements[:, axis] = values[np.arange(len(values)), idx]
+            else:
+                raise ValueError(f'Unknown fusion {fusion}')
+
+        self._fused_timelines[key] = (times, displacements)
+        return times, displacements
+
+    def resample_3d(self, times:np.array, method='previous', fusion='mean') -> np.array:
+        """ The 3D displacements (x, y, z) at the times, in one vectorised call.
+
+        :param times : Query times (s)
+        :param method: 'previous' the last sample before the time in each plane (as displacement_at_time 
+                       in doseaccumulation.fraction_dose), 'linear' linear interpolation in each plane
+        :param fusion: How the two planes measuring each axis are fused, see fused_timeline
+        :return: (N,3) displacements (mm)
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        timeline, displacements = self.fused_timeline(method, fusion)
+
+        if method == 'previous':
+            # the fused timeline holds the samples at or before each time, take the last time before the query
+            idx = np.clip(np.searchsorted(timeline, times) - 1, 0, len(timeline) - 1)
+            return displacements[idx]
+
+        # linear in each plane is linear between the times of all planes (for 'mean', 'max_abs' is approximated)
+        return np.stack([np.interp(times, timeline, displacements[:, axis]) for axis in range(3)], axis=1)
@@ -0,0 +1,70 @@
+import os
+import sys
+import glob
+import json
+import time
+import numpy as np
+
+from MRLCinema.motion_trace import MotionTrace
+
+
+#################################################################################
+def benchmark_load(report_filenames:list[str], convert=True) -> dict:
+    """ Time loading the motion traces from the JSON reports and from the binary traces (memory mapped and read).
+
+    :param convert: Write the binary trace of reports without one
+    :return: Total load time (s) per format, number of traces and sizes (MB)
+    """
+    results = {'NumTraces': 0, 'JSON': 0.0, 'BinaryMemoryMapped': 0.0, 'BinaryRead': 0.0, 
+               'JSONSize': 0.0, 'BinarySize': 0.0}
+
+    for report_filename in report_filenames:
+        binary_filename = os.path.splitext(report_filename)[0] + '.mtrace'
+        if not os.path.exists(binary_filename):
+            if not convert:
+                continue
+            MotionTrace.from_file(report_filename).to_binary(binary_filename)
+
+        start = time.perf_counter()
+        trace_json = MotionTrace.from_file(report_filename)
+        results['JSON'] += time.perf_counter() - start
+
+        # touch the columns, memory mapped columns are read on access
+        start = time.perf_counter()
+        trace = MotionTrace.from_binary(binary_filename)
+        for displacements in [trace.displacements_transversal, trace.displacements_coronal, trace.displacements_sagittal]:
+            np.sum(displacements)
+        results['BinaryMemoryMapped'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        trace = MotionTrace.from_binary(binary_filename, memory_map=False)
+        results['BinaryRead'] += time.perf_counter() - start
+
+        if not np.array_equal(trace.displacements_transversal, trace_json.displacements_transversal):
+            raise ValueError(f'Binary trace {binary_filename} does not match {report_filename}')
+
+        results['NumTraces'] += 1
+        results['JSONSize'] += os.path.getsize(report_filename) / 1e6
+        results['BinarySize'] += os.path.getsize(binary_filename) / 1e6
+
+    return results
+
+
+if __name__ == "__main__":
+    """
+    Benchmark loading the motion traces of all reports in a directory, JSON against binary.
+    Usage: python motion_trace_benchmark.py <report directory>
+    """
+    report_dir = sys.argv[1]
+
+    report_filenames = sorted(glob.glob(os.path.join(report_dir, '*_cine_motion_analysis.json')))
+    results = benchmark_load(report_filenames)
+
+    print(f'{results["NumTraces"]} traces, JSON {results["JSON"]:.2f} s ({results["JSONSize"]:.1f} MB), '
+          f'binary memory mapped {results["BinaryMemoryMapped"]:.2f} s, read {results["BinaryRead"]:.2f} s '
+          f'({results["BinarySize"]:.1f} MB)')
+
+    results_filename = os.path.join(report_dir, 'motion_trace_benchmark.json')
+    with open(results_filename, 'w') as f:
+        json.dump(results, f, indent=4)
+        print(f'Wrote benchmark to {results_filename}')
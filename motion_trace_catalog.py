@@ -0,0 +1,118 @@
+import os
+import glob
+import json
+import functools
+import numpy as np
+
+from .motion_trace import MotionTrace
+from .motion_statistics import motion_statistics, TDigest
+
+CATALOG_VERSION = '1.1'
+
+
+##########################################################################
+def binary_filename(report_filename:str) -> str:
+    """ The binary motion trace written next to the report, see MotionTrace.to_binary. """
+    return os.path.splitext(report_filename)[0] + '.mtrace'
+
+##########################################################################
+def load_motion_trace(report_filename:str) -> MotionTrace:
+    """ Load the motion trace of a report, from the binary trace (memory mapped) if written. """
+    if os.path.exists(binary_filename(report_filename)):
+        return MotionTrace.from_binary(binary_filename(report_filename))
+    return MotionTrace.from_file(report_filename)
+
+##########################################################################
+@functools.lru_cache(maxsize=4)
+def load_motion_trace_cached(report_filename:str, modification_time:float) -> MotionTrace:
+    """ load_motion_trace of the recently opened traces. The modification time is part of the key,
+    so a rewritten report is loaded again. """
+    return load_motion_trace(report_filename)
+
+##########################################################################
+def modification_time(report_filename:str) -> float:
+    """ The latest modification time of the report and its binary trace. """
+    filenames = [report_filename, binary_filename(report_filename)]
+    return max(os.path.getmtime(filename) for filename in filenames if os.path.exists(filename))
+
+##########################################################################
+def catalog_entry(report_filename:str, trace:MotionTrace) -> dict:
+    """ The catalog entry of a motion trace: patient, plan, file, duration, number of samples per plane and
+    summary statistics (mean and standard deviation per plane and direction, 95th percentile of the absolute
+    displacement in x, y and z, see motion_statistics) and the quantile sketches per plane and direction, 
+    to aggregate percentiles over fractions without loading the traces, see merged_sketches. """
+    displacements = [trace.displacements_transversal, trace.displacements_coronal, trace.displacements_sagittal]
+    num_samples = [len(d) for d in displacements]
+
+    statistics = {}
+    for name, d in zip(MotionTrace.PLANES, displacements):
+        if len(d) > 0:
+            statistics[name] = {'Mean': np.mean(d, axis=0).tolist(), 'Std': np.std(d, axis=0).tolist()}
+    if min(num_samples) > 0:
+        statistics['Percentile95'] = [float(p) for p in motion_statistics(trace.displacements_transversal,
+                                                                            trace.displacements_sagittal,
+                                                                            trace.displacements_coronal)]
+
+    return {'PatientID': trace.patient_ID,
+            'PlanLabel': trace.plan_label,
+            'Filename': report_filename,
+            'ModificationTime': modification_time(report_filename),
+            'StartTime': None if max(num_samples) == 0 else float(trace.start_times()),
+            'Duration': 0.0 if max(num_samples) == 0 else float(trace.end_times() - trace.start_times()),
+            'NumSamples': dict(zip(MotionTrace.PLANES, num_samples)),
+            'Statistics': statistics,
+            'Sketches': {name: [sketch.to_dict() for sketch in sketches] 
+                         for name, sketches in zip(MotionTrace.PLANES, trace.sketches)}}
+
+##########################################################################
+def read_catalog(catalog_filename:str) -> dict:
+    """ Read the catalog, an empty catalog if not found or written by another version. """
+    if os.path.exists(catalog_filename):
+        with open(catalog_filename, 'r') as f:
+            catalog = json.load(f)
+        if catalog.get('Version') == CATALOG_VERSION:
+            return catalog
+    return {'Version': CATALOG_VERSION, 'Entries': {}}
+
+##########################################################################
+def write_catalog(catalog_filename:str, catalog:dict):
+    """ Write the catalog, first to a temporary name to never leave a partially written catalog. """
+    filename_tmp = f'{catalog_filename}.{os.getpid()}.tmp'
+    with open(filename_tmp, 'w') as f:
+        json.dump(catalog, f, indent=4)
+    os.replace(filename_tmp, catalog_filename)
+
+##########################################################################
+def update_catalog(catalog_filename:str, report_dir:str) -> dict:
+    """ Update the catalog with the motion reports in the directory. Only new or modified reports are loaded,
+    entries of removed reports are dropped. The catalog is written if changed.
+
+    :return: The catalog, entries per report file name
+    """
+    catalog = read_catalog(catalog_filename)
+    entries = {}
+    changed = False
+    for report_filename in sorted(glob.glob(os.path.join(report_dir, '*cine_motion_analysis.json'))):
+        name = os.path.basename(report_filename)
+        entry = catalog['Entries'].get(name)
+        if entry is None or entry['ModificationTime'] != modification_time(report_filename):
+            entry = catalog_entry(report_filename, load_motion_trace(report_filename))
+            changed = True
+        entries[name] = entry
+
+    changed = changed or entries.keys() != catalog['Entries'].keys()
+    catalog['Entries'] = entries
+    if changed:
+        try:
+            write_catalog(catalog_filename, catalog)
+        except OSError as e:
+            print(f'Could not write motion trace catalog {catalog_filename}: {e}')
+
+    return catalog
+
+##########################################################################
+def merged_sketches(entries:list[dict]) -> dict:
+    """ The quantile sketches per plane and direction merged over the catalog entries (e.g. of a patient). """
+    return {name: [TDigest.merged([TDigest.from_dict(entry['Sketches'][name][column]) for entry in entries]) 
+                   for column in range(2)] 
+            for name in MotionTrace.PLANES}
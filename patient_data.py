@@ -1,6 +1,7 @@
 from U2Dose.dicomio.rtstruct import RtStruct
 from U2Dose.dicomio.rtplan import RtPlan
 import pydicom
+import numpy as np
 import glob, os
 import json
 
@@ -25,6 +26,42 @@ def rtss_frame_of_reference_ds(ds:pydicom.Dataset) -> str:
 def rtss_frame_of_reference(rtss:RtStruct) -> str:
     return rtss_frame_of_reference_ds(rtss._ds)
 
+#############################################################################
+def rtss_sop_instance_uid_ds(ds:pydicom.Dataset) -> str:
+    return ds.SOPInstanceUID
+
+def rtss_sop_instance_uid(rtss:RtStruct) -> str:
+    return rtss_sop_instance_uid_ds(rtss._ds)
+
+def read_sop_instance_uid(filename:str) -> str:
+    """ Read only the SOP Instance UID from a DICOM file, i.e. without parsing the full object. """
+    ds = pydicom.dcmread(filename, stop_before_pixels=True, specific_tags=['SOPInstanceUID'])
+    return rtss_sop_instance_uid_ds(ds)
+
+#############################################################################
+def rtss_roi_contours_ds(ds:pydicom.Dataset, roi_name:str) -> list[np.array]:
+    """ Extract the contour polygons of a ROI from the RT structure set. 
+
+    :return: List of (N, 3) arrays of contour points (mm)
+    """
+    roi_numbers = [roi.ROINumber for roi in ds.StructureSetROISequence if roi.ROIName == roi_name]
+    if len(roi_numbers) == 0:
+        raise ValueError(f'ROI {roi_name} not found in the structure set')
+
+    contours = []
+    for roi_contour in ds.ROIContourSequence:
+        if roi_contour.ReferencedROINumber != roi_numbers[0]:
+            continue
+        for contour in getattr(roi_contour, 'ContourSequence', []):
+            contours.append(np.array(contour.ContourData, dtype=float).reshape(-1, 3))
+
+    return contours
+
+def read_roi_contours(filename:str, roi_name:str) -> list[np.array]:
+    """ Read the contour polygons of a ROI directly from the RT structure set file. """
+    ds = pydicom.dcmread(filename)
+    return rtss_roi_contours_ds(ds, roi_name)
+
 #############################################################################
 def read_cine_patient_ID(path) -> str:
     """ Read the patient ID from the current directory
@@ -58,22 +95,36 @@ def find_cine_frame_of_reference(path) -> str:
         return mask_file['FrameOfReferenceUid']
 
 ############################################################################
-def find_structure_set(patient_path:str, frame_of_reference:str) -> RtStruct|None:
-    """ Find the RT structure set for a given patient ID and frame of reference."""
+def find_structure_set_filename(patient_path:str, frame_of_reference:str) -> str|None:
+    """ Find the filename of the RT structure set for a given patient ID and frame of reference."""
 
     rtss_filenames = glob.glob(os.path.join(patient_path, '*', 'RS*.dcm'))
 
-    rtss = None 
     for filename in rtss_filenames:
         rtss_ds = pydicom.dcmread(filename)
         
-        if rtss_ds.ReferencedFrameOfReferenceSequence[0].FrameOfReferenceUID == frame_of_reference:
-            rtss = RtStruct(filename)
-            rtss.parse()
-            return rtss
+        if rtss_frame_of_reference_ds(rtss_ds) == frame_of_reference:
+            return filename
         
     return None
 
+############################################################################
+def read_structure_set(filename:str) -> RtStruct:
+    """ Read and parse an RT structure set. """
+    rtss = RtStruct(filename)
+    rtss.parse()
+    return rtss
+
+############################################################################
+def find_structure_set(patient_path:str, frame_of_reference:str) -> RtStruct|None:
+    """ Find the RT structure set for a given patient ID and frame of reference."""
+
+    filename = find_structure_set_filename(patient_path, frame_of_reference)
+    if filename is None:
+        return None
+        
+    return read_structure_set(filename)
+
 ############################################################################
 def find_plan_from_frame_of_reference(patient_data_path:str, frame_of_reference:str) -> RtPlan|None:
     """ Find the RT plan for a given patient based on the FoR."""
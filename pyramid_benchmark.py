@@ -0,0 +1,70 @@
+import sys
+import json
+import time
+import numpy as np
+import SimpleITK as sitk
+from scipy.ndimage import shift, gaussian_filter
+
+from MRLCinema.registration.pyramid import PreprocessedStack, coarse_to_fine_registration
+from MRLCinema.registration.phase_correlation import phase_correlation_registration
+
+
+#################################################################################
+def synthetic_sequence(num_frames:int, spacing=(1.5, 1.2), shape=(128, 112), max_shift=8.0) -> tuple[list[sitk.Image], sitk.Image, np.array]:
+    """ Sequence of a smooth noisy image shifted randomly (the first 10 frames not shifted), and a central mask.
+
+    :return: The images, the mask and the true displacements [frame, (x, y)] (mm)
+    """
+    rng = np.random.default_rng(1)
+    shifts = rng.uniform(-max_shift, max_shift, size=[num_frames, 2])
+    shifts[0:10] = 0
+
+    image = gaussian_filter(rng.normal(size=shape), 3)
+    sequence = []
+    for dx, dy in shifts:
+        frame = shift(image, (dy, dx), order=3, mode='nearest') + rng.normal(scale=0.002, size=shape)
+        frame = sitk.GetImageFromArray(frame.astype(np.float32))
+        frame.SetSpacing(spacing)
+        sequence.append(frame)
+
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[shape[0] // 4:3 * shape[0] // 4, shape[1] // 4:3 * shape[1] // 4] = 1
+    mask = sitk.GetImageFromArray(mask)
+    mask.SetSpacing(spacing)
+    return sequence, mask, shifts * np.array(spacing)
+
+#################################################################################
+def benchmark_coarse_to_fine(num_frames=300) -> dict:
+    """ Time (CPU) and error of the coarse to fine registration against phase correlation at full resolution. """
+    sequence, mask, true_displacements = synthetic_sequence(num_frames)
+
+    results = {'NumFrames': num_frames}
+    stack = PreprocessedStack(sequence, mask)
+    start = time.process_time()
+    displacements = coarse_to_fine_registration(stack)
+    results['CoarseToFineTime'] = time.process_time() - start
+    results['CoarseToFineMaxError'] = float(np.max(np.abs(displacements - true_displacements)))
+
+    start = time.process_time()
+    phase_correlation_registration(sequence, mask)
+    results['PhaseCorrelationTime'] = time.process_time() - start
+
+    return results
+
+
+if __name__ == "__main__":
+    """
+    Benchmark the coarse to fine registration against phase correlation at full resolution on a synthetic sequence.
+    Usage: python pyramid_benchmark.py [num_frames] [results.json]
+    """
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    results = benchmark_coarse_to_fine(num_frames)
+
+    print(f'{num_frames} frames, coarse to fine {results["CoarseToFineTime"]:.2f} s '
+          f'(max error {results["CoarseToFineMaxError"]:.3f} mm), '
+          f'phase correlation {results["PhaseCorrelationTime"]:.2f} s')
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w') as f:
+            json.dump(results, f, indent=4)
+            print(f'Wrote benchmark to {sys.argv[2]}')
@@ -0,0 +1,142 @@
+import SimpleITK as sitk
+
+# iterations of the SimpleITK registrations if not set in the config
+SIMPLEITK_MAXIMUM_NUMBER_OF_ITERATIONS = 500
+
+
+class RegistrationConfig(object):
+    """ Settings of the registrations, shared by the Elastix group registration and the SimpleITK single registrations.
+    Named profiles are available in REGISTRATION_PROFILES, see registration_profile.
+    """
+
+    def __init__(self, name:str='default', number_of_resolutions:int=None, maximum_number_of_iterations:int=None,
+                 number_of_spatial_samples:int=None, image_sampler:str=None,
+                 number_of_threads:int=None, log_to_console:bool=False, early_stopping_tolerance:float=None):
+        """ The registration settings that are None keep the defaults of the registration method, the Elastix 
+        default groupwise parameter map, and for SimpleITK one resolution, 500 iterations and all pixels.
+
+        :param name                        : Name of the profile, recorded in the report
+        :param number_of_resolutions       : Number of resolution levels in the image pyramid
+        :param maximum_number_of_iterations: Maximum number of optimiser iterations per resolution
+        :param number_of_spatial_samples   : Number of pixels sampled per iteration to evaluate the metric
+        :param image_sampler               : Elastix image sampler, Random, RandomCoordinate, Grid or Full
+        :param number_of_threads           : Number of threads, if None the default (all cores)
+        :param log_to_console              : Log registration progress and settings to the console
+        :param early_stopping_tolerance    : If set, stop when the optimiser step (mm) is below the tolerance. 
+                                             Uses a regular step gradient descent in Elastix, which in contrast
+                                             to the default stochastic optimiser has a stopping criterion.
+        """
+        if image_sampler not in [None, 'Random', 'RandomCoordinate', 'Grid', 'Full']:
+            raise ValueError(f'Unknown image sampler {image_sampler}')
+
+        self.name = name
+        self.number_of_resolutions = number_of_resolutions
+        self.maximum_number_of_iterations = maximum_number_of_iterations
+        self.number_of_spatial_samples = number_of_spatial_samples
+        self.image_sampler = image_sampler
+        self.number_of_threads = number_of_threads
+        self.log_to_console = log_to_console
+        self.early_stopping_tolerance = early_stopping_tolerance
+
+    def with_threads(self, number_of_threads:int) -> 'RegistrationConfig':
+        """ A copy of the config using the given number of threads. """
+        config = RegistrationConfig(**self.to_dict())
+        config.number_of_threads = number_of_threads
+        return config
+
+    def with_early_stopping(self, early_stopping_tolerance:float) -> 'RegistrationConfig':
+        """ A copy of the config stopping when the optimiser step (mm) is below the tolerance. """
+        config = RegistrationConfig(**self.to_dict())
+        config.early_stopping_tolerance = early_stopping_tolerance
+        return config
+
+    def to_dict(self) -> dict:
+        return {'name': self.name,
+                'number_of_resolutions': self.number_of_resolutions,
+                'maximum_number_of_iterations': self.maximum_number_of_iterations,
+                'number_of_spatial_samples': self.number_of_spatial_samples,
+                'image_sampler': self.image_sampler,
+                'number_of_threads': self.number_of_threads,
+                'log_to_console': self.log_to_console,
+                'early_stopping_tolerance': self.early_stopping_tolerance}
+
+    def registration_parameters(self) -> dict:
+        """ The settings that determine the registration result (not the name, threads or logging), e.g. for cache keys. """
+        parameters = self.to_dict()
+        for key in ['name', 'number_of_threads', 'log_to_console']:
+            parameters.pop(key)
+        return parameters
+
+    def apply_to_parameter_map(self, parameter_map):
+        """ Set the config in an Elastix parameter map, the settings that are None are kept. """
+        if self.number_of_resolutions is not None:
+            parameter_map['NumberOfResolutions'] = [str(self.number_of_resolutions)]
+        if self.maximum_number_of_iterations is not None:
+            parameter_map['MaximumNumberOfIterations'] = [str(self.maximum_number_of_iterations)]
+        if self.number_of_spatial_samples is not None:
+            parameter_map['NumberOfSpatialSamples'] = [str(self.number_of_spatial_samples)]
+        if self.image_sampler is not None:
+            parameter_map['ImageSampler'] = [self.image_sampler]
+        if self.early_stopping_tolerance is not None:
+            parameter_map['Optimizer'] = ['RegularStepGradientDescent']
+            parameter_map['MaximumStepLength'] = ['1.0']
+            parameter_map['MinimumStepLength'] = [str(self.early_stopping_tolerance)]
+            parameter_map['MinimumGradientMagnitude'] = ['1e-8']
+            parameter_map['RelaxationFactor'] = ['0.5']
+        return parameter_map
+
+    def elastix_iteration_limits(self) -> tuple[int, int]:
+        """ The maximum number of iterations per resolution and the number of resolutions of the Elastix 
+        group registration, the settings that are None from the default groupwise parameter map. """
+        parameter_map = self.apply_to_parameter_map(sitk.GetDefaultParameterMap('groupwise'))
+        return int(parameter_map['MaximumNumberOfIterations'][-1]), int(parameter_map['NumberOfResolutions'][0])
+
+    def simpleitk_iterations(self) -> int:
+        """ The maximum number of iterations of the SimpleITK registrations. """
+        if self.maximum_number_of_iterations is None:
+            return SIMPLEITK_MAXIMUM_NUMBER_OF_ITERATIONS
+        return self.maximum_number_of_iterations
+
+    def sampling_percentage(self, image:sitk.Image) -> float:
+        """ The fraction of the pixels corresponding to the number of spatial samples (SimpleITK registration). """
+        if self.number_of_spatial_samples is None:
+            return 1.0
+        return min(1.0, self.number_of_spatial_samples / image.GetNumberOfPixels())
+
+    def apply_to_registration_method(self, R:sitk.ImageRegistrationMethod, image:sitk.Image):
+        """ Set the sampling, pyramid and threads of a SimpleITK registration method, the settings that are None
+        are kept (all pixels, one resolution without smoothing).
+        The optimiser is set by the caller, see simpleitk_iterations.
+        """
+        if self.image_sampler is None or self.image_sampler == 'Full':
+            R.SetMetricSamplingStrategy(R.NONE)
+        elif self.image_sampler == 'Grid':
+            R.SetMetricSamplingStrategy(R.REGULAR)
+            R.SetMetricSamplingPercentage(self.sampling_percentage(image))
+        else:
+            R.SetMetricSamplingStrategy(R.RANDOM)
+            R.SetMetricSamplingPercentage(self.sampling_percentage(image))
+
+        if self.number_of_resolutions is not None:
+            shrink_factors = [2**level for level in reversed(range(self.number_of_resolutions))]
+            R.SetShrinkFactorsPerLevel(shrink_factors)
+            R.SetSmoothingSigmasPerLevel([factor / 2 if factor > 1 else 0.0 for factor in shrink_factors])
+            R.SmoothingSigmasAreSpecifiedInPhysicalUnitsOff()
+
+        if self.number_of_threads is not None:
+            R.SetNumberOfThreads(self.number_of_threads)
+
+
+REGISTRATION_PROFILES = {
+    'fast'    : RegistrationConfig('fast', number_of_resolutions=1, maximum_number_of_iterations=100,
+                                   number_of_spatial_samples=1024, image_sampler='Random'),
+    'default' : RegistrationConfig('default', number_of_resolutions=1),
+    'accurate': RegistrationConfig('accurate', number_of_resolutions=2, maximum_number_of_iterations=500,
+                                   number_of_spatial_samples=4096, image_sampler='RandomCoordinate'),
+}
+
+def registration_profile(name:str) -> RegistrationConfig:
+    """ Get a copy of a named registration profile, fast, default or accurate. """
+    if name not in REGISTRATION_PROFILES:
+        raise ValueError(f'Unknown registration profile {name}, available {list(REGISTRATION_PROFILES.keys())}')
+    return RegistrationConfig(**REGISTRATION_PROFILES[name].to_dict())
@@ -3,6 +3,7 @@ from scipy.ndimage import distance_transform_edt
 import SimpleITK as sitk
 from ..readcine.readcines import CineImage
 from ..readcine.convert_to_sitk import sitk_resample_mask_to_slice
+from .rasterise_plane import rasterise_contours_to_plane
 from U2Dose.geometry.Grid3D import Grid3D
 from U2Dose.patient.Roi import Roi
 
@@ -29,8 +30,20 @@ def mask_dilation(mask:sitk.Image, dilation_distance) -> sitk.Image:
     np_mask = sitk.GetArrayFromImage(mask)
     spacing = mask.GetSpacing()
     dt = distance_map(np_mask, spacing)
-    dt = dt + dilation_distance 
-    np_mask_dilated = (dt >= 0).astype(np.uint8)
+
+    return dilation_from_distance_map(dt, mask, dilation_distance)
+
+##########################################################################
+def dilation_from_distance_map(dt:np.array, mask:sitk.Image, dilation_distance) -> sitk.Image:
+    """
+    Threshold a (signed) distance map of a mask to get the dilated mask. 
+
+    :param dt: the distance map of the mask, see distance_map
+    :param mask: the mask as sitk Image, defines the geometry
+    :param dilation_distance: Distance in wolrd units (mm) to dilate the mask
+    :return: the dilated mask
+    """
+    np_mask_dilated = (dt + dilation_distance >= 0).astype(np.uint8)
     mask_dilated = sitk.GetImageFromArray(np_mask_dilated)
     mask_dilated.SetOrigin(mask.GetOrigin())
     mask_dilated.SetSpacing(mask.GetSpacing())
@@ -107,24 +120,71 @@ def create_grid(transversal, coronal, sagittal) -> Grid3D:
 
 
 ##########################################################################
-def create_registration_mask(mask:Roi, cine:CineImage) -> sitk.Image:
+def registration_mask_from_slice(mask_slice:sitk.Image, dilation_distance=20, num_pixels_per_side=3) -> sitk.Image:
+    """ Create the registration mask from a mask already cut in the cine plane.
+    The mask is dilated and then a center cross is removed.
+
+    :param mask_slice: The mask in the cine plane
+    :param dilation_distance: Distance (mm) to dilate the mask
+    :param num_pixels_per_side: Half width (pixels) of the removed center cross
+    :return: The registation mask
+    """
+    mask_slice = mask_dilation(mask_slice, dilation_distance=dilation_distance)
+
+    mask_slice = remove_center_cross(mask_slice, num_pixels_per_side)
+
+    return mask_slice
+
+##########################################################################
+def registration_mask_family(mask_slice:sitk.Image, dilation_distances:list[float], num_pixels_per_sides:list[int]
+                             ) -> dict[tuple[float, int], sitk.Image]:
+    """ Create registration masks for all combinations of dilation distances and center cross sizes.
+    The distance map of the mask is only computed once, each mask is then a threshold of the same map.
+
+    :param mask_slice: The mask in the cine plane
+    :param dilation_distances: Distances (mm) to dilate the mask
+    :param num_pixels_per_sides: Half widths (pixels) of the removed center cross
+    :return: The registation masks with (dilation_distance, num_pixels_per_side) as key
+    """
+    dt = distance_map(sitk.GetArrayFromImage(mask_slice), mask_slice.GetSpacing())
+
+    masks = {}
+    for dilation_distance in dilation_distances:
+        mask_dilated = dilation_from_distance_map(dt, mask_slice, dilation_distance)
+        for num_pixels_per_side in num_pixels_per_sides:
+            masks[(dilation_distance, num_pixels_per_side)] = remove_center_cross(mask_dilated, num_pixels_per_side)
+
+    return masks
+
+##########################################################################
+def create_registration_mask(mask:Roi, cine:CineImage, dilation_distance=20, num_pixels_per_side=3) -> sitk.Image:
     """ Create a 2D SimpleITK image from a 3D Roi representation of the registration mask. 
     Makes a 2D slice defined by the cine image. 
     The mask is dilated and then a center cross is removed.
 
     :param mask: Roi respresentation of mask
     :param cine: The cine image, defines where the 2D mask cut should be made
+    :param dilation_distance: Distance (mm) to dilate the mask
+    :param num_pixels_per_side: Half width (pixels) of the removed center cross
     :return: The registation mask
     """
 
     mask_slice = sitk_resample_mask_to_slice(mask, cine.image)
 
-    dilation_distance = 20 # mm
-    mask_slice = mask_dilation(mask_slice, dilation_distance=dilation_distance)
+    return registration_mask_from_slice(mask_slice, dilation_distance, num_pixels_per_side)
 
-    num_pixels_per_side = 3
-    mask_slice = remove_center_cross(mask_slice, num_pixels_per_side)
+##########################################################################
+def create_registration_mask_from_contours(contours:list[np.array], cine:CineImage, dilation_distance=20, num_pixels_per_side=3) -> sitk.Image:
+    """ Create the registration mask by rasterising the structure set contours directly in the cine plane,
+    i.e. without a 3D voxelisation of the structure.
 
-    return mask_slice
+    :param contours: List of (N, 3) arrays of contour points (mm)
+    :param cine: The cine image, defines where the 2D mask cut should be made
+    :param dilation_distance: Distance (mm) to dilate the mask
+    :param num_pixels_per_side: Half width (pixels) of the removed center cross
+    :return: The registation mask
+    """
 
+    mask_slice = rasterise_contours_to_plane(contours, cine.image)
 
+    return registration_mask_from_slice(mask_slice, dilation_distance, num_pixels_per_side)
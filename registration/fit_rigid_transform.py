@@ -41,3 +41,76 @@ def fit_rigid_transform(A:np.array, B:np.array) -> np.array:
     T[:m, -1] = t.ravel()
     
     return T
+
+
+def fit_rigid_transforms(A:np.array, B:np.array, weights:np.array=None) -> np.array:
+    """
+    Calculates the best-fit transforms that map points A onto points B for a batch of frames at once,
+    the (weighted) Kabsch algorithm with one stacked SVD.
+    Input:
+        A: nxm or Nxnxm numpy array of source points (shared by all frames if nxm)
+        B: Nxnxm numpy array of destination points for N frames
+        weights: n or Nxn numpy array of point weights, if None all points have the same weight
+    Output:
+        T: Nx(m+1)x(m+1) homogeneous transformation matrices
+    """
+    B = np.asarray(B, dtype=float)
+    A = np.broadcast_to(np.asarray(A, dtype=float), B.shape)
+    N, n, m = B.shape
+
+    if weights is None:
+        weights = np.ones([N, n])
+    weights = np.broadcast_to(weights, [N, n])
+    weights = weights / np.sum(weights, axis=1, keepdims=True)
+
+    # Translate points to their (weighted) centroids
+    centroid_A = np.einsum('Nn,Nni->Ni', weights, A)
+    centroid_B = np.einsum('Nn,Nni->Ni', weights, B)
+    AA = A - centroid_A[:, None, :]
+    BB = B - centroid_B[:, None, :]
+
+    # Rotation matrices, with the special reflection case
+    H = np.einsum('Nni,Nn,Nnj->Nij', AA, weights, BB)
+    U, S, Vt = np.linalg.svd(H)
+    d = np.sign(np.linalg.det(np.matmul(U, Vt)))
+    Vt[:, m-1, :] *= d[:, None]
+    R = np.matmul(np.transpose(Vt, (0, 2, 1)), np.transpose(U, (0, 2, 1)))
+
+    # Translation
+    t = centroid_B - np.einsum('Nij,Nj->Ni', R, centroid_A)
+
+    # Homogeneous transformation
+    T = np.tile(np.eye(m+1), (N, 1, 1))
+    T[:, :m, :m] = R
+    T[:, :m, -1] = t
+
+    return T
+
+
+def fit_rigid_transforms_robust(A:np.array, B:np.array, num_iterations:int=10, tuning:float=4.685) -> np.array:
+    """
+    Outlier robust version of fit_rigid_transforms, iteratively reweighted least squares with Tukey biweights.
+    The residual scale per frame is estimated from the median absolute residual, points with a residual 
+    above tuning x scale get zero weight.
+    Input:
+        A: nxm or Nxnxm numpy array of source points
+        B: Nxnxm numpy array of destination points for N frames
+    Output:
+        T: Nx(m+1)x(m+1) homogeneous transformation matrices
+    """
+    B = np.asarray(B, dtype=float)
+    A = np.broadcast_to(np.asarray(A, dtype=float), B.shape)
+    m = B.shape[2]
+
+    T = fit_rigid_transforms(A, B)
+    for _ in range(num_iterations):
+        residuals = np.linalg.norm(np.einsum('Nij,Nnj->Nni', T[:, :m, :m], A) + T[:, None, :m, -1] - B, axis=2)
+        scale = 1.4826 * np.median(residuals, axis=1, keepdims=True)
+        u = residuals / (tuning * np.maximum(scale, 1e-9))
+        weights = np.where(u < 1, (1 - u**2)**2, 0.0)
+
+        # frames without (enough) residual spread keep equal weights
+        weights[np.sum(weights > 0, axis=1) <= m] = 1.0
+        T = fit_rigid_transforms(A, B, weights)
+
+    return T
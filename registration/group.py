@@ -1,24 +1,72 @@
-
+import os
+import time
+import resource
+import tempfile
 import SimpleITK as sitk
 import numpy as np
+from .config import RegistrationConfig, registration_profile
+from .telemetry import read_iteration_info, elastix_record
+
+#################################################################################
+def sequence_volume(cines:list[sitk.Image]) -> sitk.Image:
+    """ Join the 2D images into a 3D volume, the last dimension is the image index (spacing 1, origin 0).
+    This is the JoinSeries of the original registration, the volume is a copy of all the images.
+    """
+    return sitk.JoinSeries(cines)
+
+#################################################################################
+def mask_volume(mask:sitk.Image, num_images:int) -> sitk.Image:
+    """ The 2D mask repeated for each image as a uint8 volume with the geometry of sequence_volume.
+    GetImageFromArray copies the broadcast mask into a full volume of num_images slices, the same memory
+    as joining num_images copies of the mask.
+    """
+    mask_array = sitk.GetArrayViewFromImage(mask)
+    if mask_array.dtype != np.uint8:
+        mask_array = (mask_array > 0).astype(np.uint8)
+
+    volume = sitk.GetImageFromArray(np.broadcast_to(mask_array, (num_images,) + mask_array.shape))
+    volume.SetSpacing(list(mask.GetSpacing()) + [1.0])
+    volume.SetOrigin(list(mask.GetOrigin()) + [0.0])
+    direction = np.eye(3)
+    direction[0:2, 0:2] = np.array(mask.GetDirection()).reshape(2, 2)
+    volume.SetDirection(direction.flatten().tolist())
+    return volume
+
+#################################################################################
+def volume_memory_mb(image:sitk.Image) -> float:
+    """ Memory of the pixel buffer of an image (MB). """
+    bytes_per_pixel = sitk.GetArrayViewFromImage(image).itemsize * image.GetNumberOfComponentsPerPixel()
+    return image.GetNumberOfPixels() * bytes_per_pixel / 1e6
 
 #################################################################################
-def group_registration_elastix(cines:list[sitk.Image], mask:sitk.Image, initial_transform_filename=None) -> tuple[sitk.Image, list[dict]]:
+def peak_memory_mb(include_children=True) -> float:
+    """ Peak resident memory (MB) of this process, or the largest of this process and its finished 
+    child processes (e.g. registration workers). """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1e3
+
+#################################################################################
+def group_registration_elastix(cines:list[sitk.Image], mask:sitk.Image, initial_transform_filename=None, 
+                               number_of_threads:int=None, config:RegistrationConfig=None, 
+                               output_directory:str=None) -> tuple[sitk.Image, list[dict]]:
     """ Group registration of a sequence of images.
     Minimize the variation over sequence per pixel position.
-    """
 
-    #sitk.LogToConsoleOn()
+    :param initial_transform_filename: Parameter file of a TranslationStackTransform to start from, see write_initial_transform
+    :param number_of_threads: Number of threads used by Elastix, overrides the threads of the config
+    :param config: The registration config, if None the default profile
+    :param output_directory: If given Elastix writes its log and iteration info to the directory
+    """
 
-    vector_of_images = sitk.VectorOfImage()
-    vector_of_masks = sitk.VectorOfImage()
+    if config is None:
+        config = registration_profile('default')
+    if number_of_threads is None:
+        number_of_threads = config.number_of_threads
 
-    for cine in cines:
-        vector_of_images.push_back(cine)       
-        vector_of_masks.push_back(mask)
-    
-    sequence_image = sitk.JoinSeries(vector_of_images)
-    sequence_mask = sitk.JoinSeries(vector_of_masks)
+    sequence_image = sequence_volume(cines)
+    sequence_mask = mask_volume(mask, len(cines))
 
     elastixImageFilter = sitk.ElastixImageFilter()
     elastixImageFilter.SetFixedImage(sequence_image)
@@ -26,31 +74,148 @@ def group_registration_elastix(cines:list[sitk.Image], mask:sitk.Image, initial_
     elastixImageFilter.SetFixedMask(sequence_mask)
     elastixImageFilter.SetMovingMask(sequence_mask)
 
-    elastixImageFilter.LogToConsoleOn()
-    parameter_map = sitk.GetDefaultParameterMap('translation')
+    if config.log_to_console:
+        elastixImageFilter.LogToConsoleOn()
+    else:
+        elastixImageFilter.LogToConsoleOff()
+    if output_directory is not None:
+        elastixImageFilter.SetOutputDirectory(output_directory)
+        elastixImageFilter.LogToFileOn()
+    if number_of_threads is not None:
+        elastixImageFilter.SetNumberOfThreads(number_of_threads)
 
     parameter_map = sitk.GetDefaultParameterMap('groupwise')
-    parameter_map['NumberOfResolutions'] = '1'
     parameter_map['Transform'] = ['TranslationStackTransform']
     parameter_map['Metric'] = ['VarianceOverLastDimensionMetric']
-    #parameter_map['MaximumNumberOfIterations'] = ['999'] 
+    parameter_map = config.apply_to_parameter_map(parameter_map)
 
     if initial_transform_filename != None:
         elastixImageFilter.SetInitialTransformParameterFileName(initial_transform_filename)
-        parameter_map['NumberOfSubTransforms'] = str(len(cines))  
+        parameter_map['NumberOfSubTransforms'] = [str(len(cines))]
     
-    print()
-    print('start parameter map')
-    print(sitk.PrintParameterMap(parameter_map))
-    print('end parameter map')
-    print()
+    if config.log_to_console:
+        print()
+        print('start parameter map')
+        print(sitk.PrintParameterMap(parameter_map))
+        print('end parameter map')
+        print()
 
     elastixImageFilter.SetParameterMap(parameter_map)
     elastixImageFilter.Execute()
 
+    if config.log_to_console:
+        print(f'Stack {volume_memory_mb(sequence_image):.1f} MB, mask {volume_memory_mb(sequence_mask):.1f} MB, '
+              f'peak memory {peak_memory_mb():.1f} MB')
+
     resultImage = elastixImageFilter.GetResultImage()
     transformParameterMap = elastixImageFilter.GetTransformParameterMap()
     
     return resultImage, transformParameterMap
 
+#################################################################################
+def initial_stack_transform(cines:list[sitk.Image], displacements:np.array) -> dict:
+    """ Create a TranslationStackTransform parameter map with the given displacements, one per image.
+    The geometry is the geometry of the joined sequence, as in group_registration_elastix.
+
+    :param cines: The 2D images of the sequence
+    :param displacements: [image, (x, y)] displacements (mm)
+    :return: The parameter map
+    """
+    if len(displacements) != len(cines):
+        raise ValueError(f'Number of displacements {len(displacements)} does not match the number of images {len(cines)}')
+
+    num_images = len(cines)
+    size = list(cines[0].GetSize()) + [num_images]
+    spacing = list(cines[0].GetSpacing()) + [1.0]
+    origin = list(cines[0].GetOrigin()) + [0.0]
+    direction = np.eye(3)
+    direction[0:2, 0:2] = np.array(cines[0].GetDirection()).reshape(2, 2)
+
+    parameter_map = sitk.ParameterMap()
+    parameter_map['Transform'] = ['TranslationStackTransform']
+    parameter_map['NumberOfParameters'] = [str(2 * num_images)]
+    parameter_map['TransformParameters'] = [f'{p:.6f}' for p in np.asarray(displacements, dtype=float).flatten()]
+    parameter_map['InitialTransformParametersFileName'] = ['NoInitialTransform']
+    parameter_map['HowToCombineTransforms'] = ['Compose']
+    parameter_map['NumberOfSubTransforms'] = [str(num_images)]
+    parameter_map['StackSpacing'] = ['1']
+    parameter_map['StackOrigin'] = ['0']
+    parameter_map['FixedImageDimension'] = ['3']
+    parameter_map['MovingImageDimension'] = ['3']
+    parameter_map['FixedInternalImagePixelType'] = ['float']
+    parameter_map['MovingInternalImagePixelType'] = ['float']
+    parameter_map['Size'] = [str(s) for s in size]
+    parameter_map['Index'] = ['0', '0', '0']
+    parameter_map['Spacing'] = [str(s) for s in spacing]
+    parameter_map['Origin'] = [str(o) for o in origin]
+    parameter_map['Direction'] = [str(d) for d in direction.T.flatten()]
+    parameter_map['UseDirectionCosines'] = ['true']
+    parameter_map['ResampleInterpolator'] = ['FinalBSplineInterpolator']
+    parameter_map['FinalBSplineInterpolationOrder'] = ['3']
+    parameter_map['Resampler'] = ['DefaultResampler']
+    parameter_map['DefaultPixelValue'] = ['0']
+    parameter_map['ResultImageFormat'] = ['mhd']
+    parameter_map['ResultImagePixelType'] = ['float']
+    parameter_map['CompressResultImage'] = ['false']
+
+    return parameter_map
+
+#################################################################################
+def count_iterations(output_directory:str) -> int:
+    """ Count the optimiser iterations (all resolutions) from the Elastix iteration info files. """
+    return sum(len(metrics) for metrics in read_iteration_info(output_directory))
+
+#################################################################################
+def group_registration_elastix_telemetry(cines:list[sitk.Image], mask:sitk.Image, initial_transform_filename=None,
+                                         number_of_threads:int=None, config:RegistrationConfig=None,
+                                         output_directory:str=None) -> tuple[list[dict], dict]:
+    """ Group registration, see group_registration_elastix, logged to a (temporary if None) output directory to 
+    capture the telemetry: wall time, iterations, final metric and stop condition.
+
+    :return: The transform parameter map and the telemetry record, see registration_record
+    """
+    if config is None:
+        config = registration_profile('default')
+
+    def register(output_directory):
+        start = time.perf_counter()
+        _resultImage, transformParameterMap = group_registration_elastix(cines, mask, initial_transform_filename, 
+                                                                         number_of_threads, config, output_directory)
+        record = elastix_record(output_directory, time.perf_counter() - start, config.elastix_iteration_limits()[0],
+                                len(cines), cines[0].GetNumberOfPixels())
+        return transformParameterMap, record
+
+    if output_directory is not None:
+        return register(output_directory)
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        return register(output_directory)
+
+#################################################################################
+def group_registration_elastix_warm(cines:list[sitk.Image], mask:sitk.Image, initial_displacements:np.array=None, 
+                                    number_of_threads:int=None, config:RegistrationConfig=None) -> tuple[np.array, dict]:
+    """ Group registration started from initial displacements (warm start). 
+    The initial TranslationStackTransform is written to a temporary parameter file, since Elastix only 
+    takes initial transforms from file. 
+
+    :param initial_displacements: [image, (x, y)] displacements (mm) to start from, None to start from zero
+    :return: The (total) displacements [image, (x, y)] (mm), not reset, and the telemetry record 
+             (with the number of iterations used), see registration_record
+    """
+    with tempfile.TemporaryDirectory() as output_directory:
+        initial_transform_filename = None
+        if initial_displacements is not None:
+            initial_transform_filename = os.path.join(output_directory, 'InitialTransform.txt')
+            sitk.WriteParameterFile(initial_stack_transform(cines, initial_displacements), initial_transform_filename)
+
+        transformParameterMap, record = group_registration_elastix_telemetry(cines, mask, initial_transform_filename, 
+                                                                             number_of_threads, config, output_directory)
+
+    transform_parameters = np.array(transformParameterMap[0]['TransformParameters'], dtype=float)
+    displacements = transform_parameters.reshape(-1, 2)
+
+    # translations compose by addition
+    if initial_displacements is not None:
+        displacements = displacements + initial_displacements
 
+    return displacements, record
@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import numpy as np
+import SimpleITK as sitk
+from ..readcine.readcines import CineImage
+
+
+##########################################################################
+def cine_geometry(cine:CineImage) -> dict:
+    """ The geometry of a cine that determines where the mask slice is cut. """
+    image = cine.image
+    return {'origin': [round(x, 4) for x in image.GetOrigin()],
+            'spacing': [round(x, 4) for x in image.GetSpacing()],
+            'size': list(image.GetSize()),
+            'direction': [round(x, 4) for x in image.GetDirection()]}
+
+##########################################################################
+def mask_cache_key(rtss_uid:str, roi_name:str, cines:list[CineImage], parameters:dict) -> str:
+    """ Create the key of a set of registration masks.
+    The masks are fully determined by the structure set, the ROI, the cine geometries and the mask parameters.
+
+    :param rtss_uid  : SOP Instance UID of the RT structure set
+    :param roi_name  : Name of the ROI used to create the masks
+    :param cines     : One cine per slice direction (transversal, coronal, sagittal)
+    :param parameters: Parameters used when creating the masks, e.g. dilation distance
+    :return: hex digest used as key in the cache
+    """
+    description = {'rtss_uid': rtss_uid,
+                   'roi_name': roi_name,
+                   'geometries': [cine_geometry(cine) for cine in cines],
+                   'parameters': parameters}
+
+    description_str = json.dumps(description, sort_keys=True)
+    return hashlib.sha1(description_str.encode('utf-8')).hexdigest()
+
+##########################################################################
+def cache_filename(cache_dir:str, key:str) -> str:
+    return os.path.join(cache_dir, f'masks_{key}.npz')
+
+##########################################################################
+def read_cached_masks(cache_dir:str, key:str) -> tuple[list[sitk.Image], list[list]]|None:
+    """ Read masks and crop boxes from the cache. Returns None if not in the cache. """
+
+    filename = cache_filename(cache_dir, key)
+    if not os.path.exists(filename):
+        return None
+
+    masks, crop_boxes = [], []
+    with np.load(filename) as data:
+        num_masks = int(data['num_masks'])
+        for i in range(num_masks):
+            mask = sitk.GetImageFromArray(data[f'mask_{i}'].astype(np.uint8))
+            mask.SetOrigin(data[f'origin_{i}'].tolist())
+            mask.SetSpacing(data[f'spacing_{i}'].tolist())
+            mask.SetDirection(data[f'direction_{i}'].tolist())
+            masks.append(mask)
+            crop_boxes.append(data[f'crop_box_{i}'].tolist())
+
+    return masks, crop_boxes
+
+##########################################################################
+def write_cached_masks(cache_dir:str, key:str, masks:list[sitk.Image], crop_boxes:list[list]):
+    """ Write masks and crop boxes to the cache.
+    The file is first written to a temporary name to never leave a partially written file in the cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    data = {'num_masks': len(masks)}
+    for i, (mask, crop_box) in enumerate(zip(masks, crop_boxes)):
+        data[f'mask_{i}'] = sitk.GetArrayFromImage(mask).astype(np.uint8)
+        data[f'origin_{i}'] = np.array(mask.GetOrigin())
+        data[f'spacing_{i}'] = np.array(mask.GetSpacing())
+        data[f'direction_{i}'] = np.array(mask.GetDirection())
+        data[f'crop_box_{i}'] = np.array([int(x) for x in crop_box])
+
+    filename = cache_filename(cache_dir, key)
+    filename_tmp = f'{filename}.{os.getpid()}.tmp'
+    with open(filename_tmp, 'wb') as f:
+        np.savez_compressed(f, **data)
+    os.replace(filename_tmp, filename)
+
+##########################################################################
+def cached_masks(cache_dir:str|None, key:str, create_masks) -> tuple[list[sitk.Image], list[list]]:
+    """ Get the masks from the cache, or create (and cache) them if not found.
+
+    :param cache_dir   : Directory of the cache, if None the masks are always created
+    :param key         : Key of the masks, see mask_cache_key
+    :param create_masks: Function without arguments returning (masks, crop_boxes)
+    :return: masks and crop boxes
+    """
+    if cache_dir is None:
+        return create_masks()
+
+    cached = read_cached_masks(cache_dir, key)
+    if cached is not None:
+        return cached
+
+    masks, crop_boxes = create_masks()
+    write_cached_masks(cache_dir, key, masks, crop_boxes)
+
+    return masks, crop_boxes
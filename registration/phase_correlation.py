@@ -0,0 +1,154 @@
+import numpy as np
+import SimpleITK as sitk
+from scipy import fft
+from scipy.ndimage import gaussian_filter
+
+
+###########################################################################################
+def stack_to_array(images:list[sitk.Image]) -> np.array:
+    """ Convert a sequence of 2D images to a numpy stack [frame, row, col]. """
+    stack = np.empty([len(images)] + list(images[0].GetSize())[::-1], dtype=np.float32)
+    for i, image in enumerate(images):
+        stack[i] = sitk.GetArrayViewFromImage(image)
+    return stack
+
+###########################################################################################
+def registration_window(shape:tuple, mask:np.array=None, mask_smoothing=4.0) -> np.array:
+    """ Weights applied to every frame before the FFT, a Hann window times the (smoothed) mask.
+    The Hann window and the smoothing avoid the edges of the image and the mask dominating the correlation.
+    """
+    window = np.outer(np.hanning(shape[0]), np.hanning(shape[1]))
+    if mask is None:
+        return window.astype(np.float32)
+
+    mask_smooth = gaussian_filter(mask.astype(np.float32), mask_smoothing)
+    return (window * mask_smooth).astype(np.float32)
+
+###########################################################################################
+def weighted_spectrum(frames:np.array, window:np.array, workers=-1) -> np.array:
+    """ FFT of the frames after subtraction of the weighted mean and weighting with the window.
+    The FFT uses workers threads, -1 for all cores. """
+    mean = np.sum(frames * window, axis=(-2, -1), keepdims=True, dtype=np.float32) / np.sum(window)
+    return fft.rfft2((frames - mean) * window, workers=workers)
+
+###########################################################################################
+def subpixel_peak(correlation:np.array) -> np.array:
+    """ Position of the maximum of each correlation surface with parabolic sub pixel refinement.
+    The correlation is periodic, positions larger than half the size are returned as negative shifts.
+
+    :param correlation: Correlation surfaces [frame, row, col]
+    :return: The peak positions [frame, (col, row)] in pixels
+    """
+    num_frames, num_rows, num_cols = correlation.shape
+    frames = np.arange(num_frames)
+    peak = np.argmax(correlation.reshape(num_frames, -1), axis=1)
+    rows, cols = np.unravel_index(peak, (num_rows, num_cols))
+
+    def refine(c_minus, c_0, c_plus):
+        # Gaussian fit, i.e. parabolic fit of the logarithm of the three values around the peak
+        c_minus, c_0, c_plus = [np.log(np.maximum(c, 1e-6 * c_0)) for c in (c_minus, c_0, c_plus)]
+        denominator = c_minus - 2 * c_0 + c_plus
+        delta = np.zeros_like(c_0)
+        valid = np.abs(denominator) > 1e-12
+        delta[valid] = 0.5 * (c_minus[valid] - c_plus[valid]) / denominator[valid]
+        return np.clip(delta, -0.5, 0.5)
+
+    c_0 = correlation[frames, rows, cols]
+    delta_col = refine(correlation[frames, rows, (cols - 1) % num_cols], c_0, correlation[frames, rows, (cols + 1) % num_cols])
+    delta_row = refine(correlation[frames, (rows - 1) % num_rows, cols], c_0, correlation[frames, (rows + 1) % num_rows, cols])
+
+    col = cols + delta_col
+    row = rows + delta_row
+    col = np.where(col > num_cols / 2, col - num_cols, col)
+    row = np.where(row > num_rows / 2, row - num_rows, row)
+
+    return np.stack([col, row], axis=1)
+
+###########################################################################################
+def lowpass_filter(shape:tuple, cutoff:float) -> np.array:
+    """ Gaussian low pass filter (rfft2 layout), the cutoff is the standard deviation in cycles per pixel. """
+    ky = np.fft.fftfreq(shape[0])[:, None]
+    kx = np.fft.rfftfreq(shape[1])[None, :]
+    return np.exp(-(kx**2 + ky**2) / (2 * cutoff**2)).astype(np.float32)
+
+###########################################################################################
+def phase_correlation_shifts(frame_spectra:np.array, template_spectrum:np.array, shape:tuple, cutoff=0.15, workers=-1) -> np.array:
+    """ Shift of each frame relative to the template using phase correlation.
+    The normalised cross power spectrum is low pass filtered, which suppresses the (whitened) noise at high
+    frequencies and gives a smooth, Gaussian shaped, peak suitable for sub pixel refinement.
+
+    :param frame_spectra: rfft2 of the frames [frame, row, col//2+1]
+    :param template_spectrum: rfft2 of the template
+    :param shape: Shape of the frames (rows, cols)
+    :param cutoff: Standard deviation (cycles per pixel) of the low pass filter
+    :param workers: Number of FFT threads, -1 for all cores
+    :return: shifts [frame, (col, row)] in pixels, frame(x) = template(x - shift)
+    """
+    cross_power = frame_spectra * np.conj(template_spectrum)
+    cross_power /= np.abs(cross_power) + 1e-12
+    cross_power *= lowpass_filter(shape, cutoff)
+    correlation = fft.irfft2(cross_power, s=shape, workers=workers)
+    return subpixel_peak(correlation)
+
+###########################################################################################
+def shift_spectra(spectra:np.array, shifts:np.array, shape:tuple) -> np.array:
+    """ Shift frames in the Fourier domain by -shift, i.e. align frames to the template. """
+    ky = np.fft.fftfreq(shape[0])
+    kx = np.fft.rfftfreq(shape[1])
+    # the phase ramp is separable, i.e. only (rows + cols) complex exponentials per frame
+    phase_y = np.exp(2j * np.pi * shifts[:, 1, None] * ky[None, :]).astype(np.complex64)
+    phase_x = np.exp(2j * np.pi * shifts[:, 0, None] * kx[None, :]).astype(np.complex64)
+    return spectra * phase_y[:, :, None] * phase_x[:, None, :]
+
+###########################################################################################
+def phase_correlation_registration(image_sequence:list[sitk.Image], mask:sitk.Image=None, template='first',
+                                   num_template_frames=10, running_weight=0.1, num_refinements=2, batch_size=256, 
+                                   workers=-1) -> np.array:
+    """ Register all frames of a (cropped) 2D sequence to a template with FFT phase correlation.
+    The motion model is a pure translation, as the TranslationStackTransform in the group registration.
+
+    :param image_sequence: The 2D images
+    :param mask: Mask of the pixels used in the registration, if None all pixels
+    :param template: 'first' the mean of the first frames, or 'running' the template is updated with the
+                     registered frames (per batch) as an exponential moving average
+    :param num_template_frames: Number of frames in the initial template
+    :param running_weight: Weight of the latest batch in the running template
+    :param num_refinements: Number of times the frames are shifted back with the estimated shift and the residual 
+                            shift is estimated. Reduces the bias towards zero shift caused by the window.
+    :param batch_size: Number of frames transformed at the same time
+    :param workers: Number of FFT threads, -1 for all cores, e.g. the share of the cores of a worker process
+    :return: displacements [frame, (x, y)] in mm, not reset to the first frames
+    """
+    if template not in ['first', 'running']:
+        raise ValueError(f'Unknown template {template}')
+
+    frames = stack_to_array(image_sequence)
+    shape = frames.shape[1:]
+    np_mask = None if mask is None else sitk.GetArrayViewFromImage(mask) > 0
+
+    # The mask is only applied to the frames. Masking also the template would correlate the mask with itself,
+    # biasing the shifts towards zero.
+    window = registration_window(shape, np_mask)
+    template_window = registration_window(shape)
+
+    template_spectrum = weighted_spectrum(np.mean(frames[0:num_template_frames], axis=0), template_window, workers)
+
+    shifts = np.zeros([len(frames), 2])
+    for start in range(0, len(frames), batch_size):
+        batch = frames[start:start + batch_size]
+        batch_shifts = phase_correlation_shifts(weighted_spectrum(batch, window, workers), template_spectrum, shape, 
+                                                workers=workers)
+
+        batch_spectra = fft.rfft2(batch, workers=workers)
+        for _ in range(num_refinements):
+            aligned = fft.irfft2(shift_spectra(batch_spectra, batch_shifts, shape), s=shape, workers=workers)
+            batch_shifts += phase_correlation_shifts(weighted_spectrum(aligned, window, workers), template_spectrum, shape, 
+                                                     workers=workers)
+        shifts[start:start + batch_size] = batch_shifts
+
+        if template == 'running':
+            aligned = shift_spectra(weighted_spectrum(batch, template_window, workers), shifts[start:start + batch_size], shape)
+            template_spectrum = (1 - running_weight) * template_spectrum + running_weight * np.mean(aligned, axis=0)
+
+    spacing = np.array(image_sequence[0].GetSpacing())
+    return shifts * spacing
@@ -0,0 +1,152 @@
+import numpy as np
+import SimpleITK as sitk
+from .phase_correlation import stack_to_array, registration_window, weighted_spectrum, phase_correlation_shifts
+
+
+###########################################################################################
+def bin_stack(stack:np.array, factor:int) -> np.array:
+    """ Block average the last two dimensions of a stack with the factor (pixels beyond a whole block are dropped). """
+    if factor == 1:
+        return stack
+    num_rows = stack.shape[-2] // factor
+    num_cols = stack.shape[-1] // factor
+    blocks = stack[..., 0:num_rows * factor, 0:num_cols * factor]
+    blocks = blocks.reshape(stack.shape[:-2] + (num_rows, factor, num_cols, factor))
+    return blocks.mean(axis=(-3, -1), dtype=np.float32)
+
+
+class PreprocessedStack(object):
+    """ A prepared (cropped, 2D) image sequence and its mask as numpy arrays, with a cache of binned levels.
+    Keep the object to reuse the stack and the pyramid between registrations with different settings.
+    """
+
+    def __init__(self, image_sequence:list[sitk.Image], mask:sitk.Image=None):
+        self.stack = stack_to_array(image_sequence)
+        self.spacing = np.array(image_sequence[0].GetSpacing())
+        self.mask = np.ones(self.stack.shape[1:], dtype=bool) if mask is None else sitk.GetArrayFromImage(mask) > 0
+        self._levels = {1: self.stack}
+        self._mask_levels = {1: self.mask}
+
+    def __len__(self):
+        return len(self.stack)
+
+    def level(self, factor:int) -> np.array:
+        """ The stack binned with the factor, cached. """
+        if factor not in self._levels:
+            self._levels[factor] = bin_stack(self.stack, factor)
+        return self._levels[factor]
+
+    def mask_level(self, factor:int) -> np.array:
+        """ The mask binned with the factor, a binned pixel is in the mask if the most of the block is. """
+        if factor not in self._mask_levels:
+            self._mask_levels[factor] = bin_stack(self.mask.astype(np.float32), factor) > 0.5
+        return self._mask_levels[factor]
+
+###########################################################################################
+def normalised_values(values:np.array) -> np.array:
+    """ Zero mean, unit norm along the last axis, the dot product of two normalised vectors is their correlation. """
+    values = values - np.mean(values, axis=-1, keepdims=True)
+    return values / (np.sqrt(np.einsum('...i,...i->...', values, values))[..., None] + 1e-12)
+
+###########################################################################################
+def parabolic_offset(c_minus:np.array, c_0:np.array, c_plus:np.array) -> np.array:
+    """ Sub pixel offset of the peak of a parabola through three equidistant samples. """
+    denominator = c_minus - 2 * c_0 + c_plus
+    offset = np.zeros_like(c_0)
+    valid = np.abs(denominator) > 1e-12
+    offset[valid] = 0.5 * (c_minus[valid] - c_plus[valid]) / denominator[valid]
+    return np.clip(offset, -0.5, 0.5)
+
+###########################################################################################
+def correlation_scores(frame_values:np.array, template:np.array, rows:np.array, cols:np.array,
+                       base:np.array, search_range:int) -> np.array:
+    """ Normalised cross correlation of the frames with the template shifted by base + (d_col, d_row),
+    for all d_row, d_col in [-search_range, search_range].
+
+    :param frame_values: [frame, point] normalised frame values at the mask points
+    :param rows, cols: The mask points
+    :param base: [frame, (col, row)] integer shifts
+    :return: scores [frame, d_row, d_col]
+    """
+    pad = int(np.max(np.abs(base), initial=0)) + search_range
+    padded = np.pad(template, pad, mode='edge').ravel()
+    padded_cols = template.shape[1] + 2 * pad
+
+    points = (rows + pad) * padded_cols + (cols + pad)
+    base_index = points[None, :] - (base[:, 1] * padded_cols + base[:, 0])[:, None]
+
+    offsets = np.arange(-search_range, search_range + 1)
+    scores = np.empty([len(frame_values), len(offsets), len(offsets)], dtype=np.float32)
+    for i, d_row in enumerate(offsets):
+        for j, d_col in enumerate(offsets):
+            template_values = normalised_values(np.take(padded, base_index - (d_row * padded_cols + d_col)))
+            scores[:, i, j] = np.einsum('ij,ij->i', frame_values, template_values)
+    return scores
+
+###########################################################################################
+def restricted_search(frames:np.array, template:np.array, mask:np.array, predicted_shifts:np.array,
+                      search_range:int=1, max_recentre:int=3) -> np.array:
+    """ Refine the shifts by a direct search of the normalised cross correlation within +- search_range pixels
+    of the predicted shifts, followed by a parabolic sub pixel fit. Frames with the peak at the border of the
+    search are searched again around the peak, at most max_recentre times (if still at the border, no sub pixel fit).
+
+    :param frames: [frame, row, col]
+    :param template: [row, col]
+    :param mask: [row, col] pixels of the frames used in the correlation
+    :param predicted_shifts: [frame, (col, row)] in pixels, frame(x) = template(x - shift)
+    :param search_range: Half width (pixels) of the search around the predicted shifts
+    :return: shifts [frame, (col, row)] in pixels
+    """
+    rows, cols = np.nonzero(mask)
+    frame_values = normalised_values(frames[:, rows, cols])
+
+    base = np.round(predicted_shifts).astype(int)
+    offset = np.zeros(predicted_shifts.shape)
+    todo = np.arange(len(frames))
+    for attempt in range(max_recentre + 1):
+        scores = correlation_scores(frame_values[todo], template, rows, cols, base[todo], search_range)
+        best_i, best_j = np.unravel_index(np.argmax(scores.reshape(len(todo), -1), axis=1), scores.shape[1:])
+        base[todo] += np.stack([best_j, best_i], axis=1) - search_range
+
+        # sub pixel fit for the frames with the peak inside the search
+        inside = (best_i > 0) & (best_i < 2 * search_range) & (best_j > 0) & (best_j < 2 * search_range)
+        s = scores[inside]
+        i, j, k = best_i[inside], best_j[inside], np.arange(len(s))
+        offset[todo[inside], 0] = parabolic_offset(s[k, i, j - 1], s[k, i, j], s[k, i, j + 1])
+        offset[todo[inside], 1] = parabolic_offset(s[k, i - 1, j], s[k, i, j], s[k, i + 1, j])
+
+        todo = todo[~inside]
+        if len(todo) == 0:
+            break
+
+    return base + offset
+
+###########################################################################################
+def coarse_to_fine_registration(stack:PreprocessedStack, factors=(4, 2, 1), search_range=1, num_template_frames=10, 
+                                workers=-1) -> np.array:
+    """ Register all frames to the mean of the first frames, coarse to fine.
+    The displacements are estimated with phase correlation at the coarsest level and refined at each finer level
+    by a direct search within +- search_range pixels, i.e. no full resolution FFTs are needed.
+
+    :param stack: The preprocessed stack (the pyramid levels are cached in the stack)
+    :param factors: Binning factors from coarse to fine, the last should be 1
+    :param search_range: Half width (pixels) of the search at the finer levels
+    :param num_template_frames: Number of frames in the template
+    :param workers: Number of FFT threads at the coarsest level, -1 for all cores
+    :return: displacements [frame, (x, y)] in mm, not reset to the first frames
+    """
+    coarse = stack.level(factors[0])
+    shape = coarse.shape[1:]
+    window = registration_window(shape, stack.mask_level(factors[0]), mask_smoothing=1.0)
+    template_spectrum = weighted_spectrum(np.mean(coarse[0:num_template_frames], axis=0), registration_window(shape), workers)
+    shifts = phase_correlation_shifts(weighted_spectrum(coarse, window, workers), template_spectrum, shape, workers=workers)
+
+    previous_factor = factors[0]
+    for factor in factors[1:]:
+        frames = stack.level(factor)
+        template = np.mean(frames[0:num_template_frames], axis=0)
+        predicted_shifts = shifts * previous_factor / factor
+        shifts = restricted_search(frames, template, stack.mask_level(factor), predicted_shifts, search_range)
+        previous_factor = factor
+
+    return shifts * previous_factor * stack.spacing
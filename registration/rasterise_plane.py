@@ -0,0 +1,146 @@
+import numpy as np
+import SimpleITK as sitk
+
+
+##########################################################################
+def scanline_inside(polygons:list[np.array], line_v:float, positions_u:np.array) -> np.array:
+    """ Find the positions along a scanline that are inside a set of polygons.
+    The polygons are given in (u, v) coordinates and the scanline is v = line_v.
+    The even-odd rule is used, i.e. holes and overlapping polygons are handled as in the
+    DICOM RT structure set.
+
+    :param polygons   : List of closed polygons, each a (N, 2) array of (u, v) vertices
+    :param line_v     : The v coordinate of the scanline
+    :param positions_u: The u coordinates to test
+    :return: boolean array, True where the position is inside
+    """
+    crossings = []
+    for polygon in polygons:
+        u1, v1 = polygon[:, 0], polygon[:, 1]
+        u2, v2 = np.roll(u1, -1), np.roll(v1, -1)
+
+        # half open rule to count a vertex on the scanline exactly once
+        crossing = (v1 <= line_v) != (v2 <= line_v)
+        if not np.any(crossing):
+            continue
+
+        u1, v1, u2, v2 = u1[crossing], v1[crossing], u2[crossing], v2[crossing]
+        crossings.append(u1 + (line_v - v1) * (u2 - u1) / (v2 - v1))
+
+    if len(crossings) == 0:
+        return np.zeros(len(positions_u), dtype=bool)
+
+    crossings = np.sort(np.concatenate(crossings))
+    num_crossings_before = np.searchsorted(crossings, positions_u)
+
+    return num_crossings_before % 2 == 1
+
+##########################################################################
+def group_contours_by_z(contours:list[np.array]) -> tuple[np.array, list[list[np.array]]]:
+    """ Group the (axial) contour polygons per z position.
+
+    :param contours: List of (N, 3) arrays of contour points in patient coordinates (mm)
+    :return: sorted z positions and the polygons at each z position
+    """
+    z_positions = []
+    polygons = []
+    for contour in contours:
+        z = round(float(np.mean(contour[:, 2])), 3)
+        if z in z_positions:
+            polygons[z_positions.index(z)].append(contour)
+        else:
+            z_positions.append(z)
+            polygons.append([contour])
+
+    order = np.argsort(z_positions)
+    return np.array(z_positions)[order], [polygons[i] for i in order]
+
+##########################################################################
+def nearest_contour_slices(z_positions:np.array, z:np.array, slice_thickness:float=None) -> np.array:
+    """ Index of the contour slice closest to each z, -1 if z is outside the contoured slices.
+
+    :param z_positions    : Sorted z positions of the contour slices
+    :param z              : z positions to look up
+    :param slice_thickness: Thickness of a contour slice, if None taken from the contour spacing
+    :return: index per z
+    """
+    z = np.atleast_1d(z)
+    if len(z_positions) == 0:
+        return -np.ones(len(z), dtype=int)
+
+    if slice_thickness is None:
+        spacings = np.diff(z_positions)
+        slice_thickness = np.min(spacings) if len(spacings) > 0 else 0.0
+
+    idx = np.clip(np.searchsorted(z_positions, z), 1, max(len(z_positions) - 1, 1))
+    idx_low = idx - 1
+    idx_high = np.minimum(idx, len(z_positions) - 1)
+    use_high = np.abs(z_positions[idx_high] - z) < np.abs(z_positions[idx_low] - z)
+    nearest = np.where(use_high, idx_high, idx_low)
+
+    inside = np.abs(z_positions[nearest] - z) <= 0.5 * slice_thickness + 1e-3
+    return np.where(inside, nearest, -1)
+
+##########################################################################
+def rasterise_contours_to_plane(contours:list[np.array], plane:sitk.Image, slice_thickness:float=None) -> sitk.Image:
+    """ Rasterise RT structure set contours directly into a cine plane.
+    Replaces voxelising the structure into a 3D grid and resampling the grid to the plane.
+    The plane must have identity direction cosines with one dimension of size one (see resample_cine_to_identity).
+
+    For a transversal plane the contour slice nearest the plane is filled. For coronal and sagittal planes
+    each contour slice is intersected with the plane and the intersection is used for the extent
+    of the contour slice in z.
+
+    :param contours       : List of (N, 3) arrays of axial contour points in patient coordinates (mm)
+    :param plane          : The cine image defining the plane geometry
+    :param slice_thickness: Thickness of a contour slice, if None taken from the contour spacing
+    :return: uint8 mask with the same geometry as the plane
+    """
+    if not np.allclose(plane.GetDirection(), np.eye(3).flatten()):
+        raise ValueError(f'Plane must have identity direction cosines, got {plane.GetDirection()}')
+
+    size = np.array(plane.GetSize())
+    if np.sum(size == 1) < 1:
+        raise ValueError(f'Plane must have one dimension of size one, got size {size}')
+
+    origin = np.array(plane.GetOrigin())
+    spacing = np.array(plane.GetSpacing())
+    xs = origin[0] + spacing[0] * np.arange(size[0])
+    ys = origin[1] + spacing[1] * np.arange(size[1])
+    zs = origin[2] + spacing[2] * np.arange(size[2])
+
+    z_positions, polygons = group_contours_by_z(contours)
+    np_mask = np.zeros([size[2], size[1], size[0]], dtype=np.uint8)
+
+    if size[2] == 1:
+        # transversal, fill the nearest contour slice row by row
+        slice_index = nearest_contour_slices(z_positions, zs, slice_thickness)[0]
+        if slice_index >= 0:
+            polygons_xy = [polygon[:, [0, 1]] for polygon in polygons[slice_index]]
+            for j, y in enumerate(ys):
+                np_mask[0, j, :] = scanline_inside(polygons_xy, y, xs)
+
+    else:
+        # coronal or sagittal, intersect each contour slice with the plane
+        if size[0] == 1:
+            line_v, positions_u, columns = xs[0], ys, [1, 0]
+        else:
+            line_v, positions_u, columns = ys[0], xs, [0, 1]
+
+        slice_indices = nearest_contour_slices(z_positions, zs, slice_thickness)
+        intersections = {}
+        for k, slice_index in enumerate(slice_indices):
+            if slice_index < 0:
+                continue
+            if slice_index not in intersections:
+                polygons_uv = [polygon[:, columns] for polygon in polygons[slice_index]]
+                intersections[slice_index] = scanline_inside(polygons_uv, line_v, positions_u)
+
+            np_mask[k] = intersections[slice_index].reshape(np_mask.shape[1:])
+
+    mask = sitk.GetImageFromArray(np_mask)
+    mask.SetOrigin(plane.GetOrigin())
+    mask.SetSpacing(plane.GetSpacing())
+    mask.SetDirection(plane.GetDirection())
+
+    return mask
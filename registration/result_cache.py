@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+import numpy as np
+import SimpleITK as sitk
+
+
+##########################################################################
+def update_image_hash(hash_object, image:sitk.Image):
+    """ Add the pixels and the geometry of the image to the hash. """
+    geometry = {'origin': [round(x, 4) for x in image.GetOrigin()],
+                'spacing': [round(x, 4) for x in image.GetSpacing()],
+                'size': list(image.GetSize()),
+                'direction': [round(x, 4) for x in image.GetDirection()],
+                'pixel_type': image.GetPixelIDTypeAsString()}
+    hash_object.update(json.dumps(geometry, sort_keys=True).encode('utf-8'))
+    hash_object.update(np.ascontiguousarray(sitk.GetArrayViewFromImage(image)).tobytes())
+
+##########################################################################
+def stack_digest(images:list[sitk.Image]) -> str:
+    """ Hex digest of a sequence of (preprocessed) images, pixels and geometry. """
+    hash_object = hashlib.sha1()
+    hash_object.update(str(len(images)).encode('utf-8'))
+    for image in images:
+        update_image_hash(hash_object, image)
+    return hash_object.hexdigest()
+
+##########################################################################
+def registration_cache_key(images:list[sitk.Image], mask:sitk.Image, parameters:dict) -> str:
+    """ Create the key of a registration result.
+    The result is fully determined by the preprocessed stack, the mask and the registration parameters, so a change
+    in the preprocessing, the mask or the registration settings gives a new key.
+
+    :param images    : The preprocessed (cropped, 2D) images registered together
+    :param mask      : The registration mask
+    :param parameters: Parameters of the registration, e.g. transform, metric and config
+    :return: hex digest used as key in the cache
+    """
+    description = {'stack': stack_digest(images),
+                   'mask': stack_digest([mask]),
+                   'parameters': parameters}
+
+    description_str = json.dumps(description, sort_keys=True)
+    return hashlib.sha1(description_str.encode('utf-8')).hexdigest()
+
+##########################################################################
+def cache_filename(cache_dir:str, key:str) -> str:
+    return os.path.join(cache_dir, f'registration_{key}.npy')
+
+##########################################################################
+def read_cached_result(cache_dir:str, key:str) -> np.array:
+    """ Read the transform parameters from the cache. Returns None if not in the cache. """
+
+    filename = cache_filename(cache_dir, key)
+    if not os.path.exists(filename):
+        return None
+
+    return np.load(filename)
+
+##########################################################################
+def write_cached_result(cache_dir:str, key:str, transform_parameters:np.array):
+    """ Write the transform parameters to the cache.
+    The file is first written to a temporary name to never leave a partially written file in the cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    filename = cache_filename(cache_dir, key)
+    filename_tmp = f'{filename}.{os.getpid()}.tmp'
+    with open(filename_tmp, 'wb') as f:
+        np.save(f, np.asarray(transform_parameters, dtype=float))
+    os.replace(filename_tmp, filename)
+
+##########################################################################
+def cached_registration(cache_dir:str|None, key:str, register) -> np.array:
+    """ Get the transform parameters from the cache, or register (and cache the result) if not found.
+
+    :param cache_dir: Directory of the cache, if None the registration is always performed
+    :param key      : Key of the registration, see registration_cache_key
+    :param register : Function without arguments returning the transform parameters
+    :return: transform parameters
+    """
+    if cache_dir is None:
+        return register()
+
+    cached = read_cached_result(cache_dir, key)
+    if cached is not None:
+        return cached
+
+    transform_parameters = np.asarray(register(), dtype=float)
+    write_cached_result(cache_dir, key, transform_parameters)
+
+    return transform_parameters
@@ -1,8 +1,11 @@
-
+import os
 import numpy as np
 import SimpleITK as sitk
+from concurrent.futures import ProcessPoolExecutor
 from .single import rigid_registration, deformable_registration
-from .fit_rigid_transform import fit_rigid_transform
+from .fit_rigid_transform import fit_rigid_transform, fit_rigid_transforms, fit_rigid_transforms_robust
+from .config import RegistrationConfig, registration_profile
+from .telemetry import RegistrationTelemetry
 
 
 def extract_rigid_displacement(transform:sitk.Transform, positions:list) -> np.array:
@@ -12,7 +15,167 @@ def extract_rigid_displacement(transform:sitk.Transform, positions:list) -> np.a
     return fit_rigid_transform(positions, positions_t)
 
 
-def cine_sequence_deformable_registration(cines:list, mask:sitk.Image, positions=list) -> list[tuple[sitk.Image, np.array]]:
+def linear_point_model(transform:sitk.Transform, points:np.array) -> tuple[np.array, np.array]:
+    """ Model the transformed points as linear in the transform parameters, T(p) = T_0(p) + J(p) parameters.
+    This holds for translation, affine and B-spline transforms (given the fixed parameters).
+
+    :return: T_0(points) [point, dimension] and J [point, dimension, parameter]
+    """
+    transform = sitk.Transform(transform)
+    num_parameters = transform.GetNumberOfParameters()
+
+    def apply(parameters):
+        transform.SetParameters(parameters)
+        return np.array([transform.TransformPoint(point) for point in points])
+
+    zero = np.zeros(num_parameters)
+    points_0 = apply(zero)
+    J = np.empty([len(points), points.shape[1], num_parameters])
+    for k in range(num_parameters):
+        unit = zero.copy()
+        unit[k] = 1.0
+        J[:, :, k] = apply(unit) - points_0
+    return points_0, J
+
+
+def transform_points(transforms:list[sitk.Transform], points:np.array, max_parameters=5000) -> np.array:
+    """ Transform the points with each transform at once.
+
+    If the transforms share type and fixed parameters and are linear in their parameters (see linear_point_model), 
+    the points are transformed with one matrix product over all transforms. Otherwise, or with more than 
+    max_parameters parameters, each point is transformed with TransformPoint.
+
+    :param transforms: Transforms of the frames
+    :param points: [point, dimension]
+    :return: transformed points [frame, point, dimension]
+    """
+    points = np.asarray(points, dtype=float)
+    if len(transforms) == 0:
+        return np.empty((0,) + points.shape)
+    first = transforms[0]
+
+    def transform_each():
+        return np.array([[transform.TransformPoint(point) for point in points] for transform in transforms])
+
+    same_kind = all(transform.GetName() == first.GetName() and 
+                    transform.GetFixedParameters() == first.GetFixedParameters() for transform in transforms)
+    if not same_kind or first.GetNumberOfParameters() > max_parameters:
+        return transform_each()
+
+    points_0, J = linear_point_model(first, points)
+    parameters = np.array([transform.GetParameters() for transform in transforms])
+    points_t = points_0[None] + np.einsum('ndp,Np->Nnd', J, parameters)
+
+    # verify the linear model on the first and last transforms
+    for i in [0, len(transforms) - 1]:
+        exact = np.array([transforms[i].TransformPoint(point) for point in points])
+        if not np.allclose(points_t[i], exact, atol=1e-6):
+            return transform_each()
+
+    return points_t
+
+
+def extract_rigid_displacements(transforms:list[sitk.Transform], positions:list, robust=False) -> np.array:
+    """ Extract the displacements from the transforms of all frames at once, see extract_rigid_displacement.
+
+    :param robust: Down weight outlier positions, see fit_rigid_transforms_robust
+    :return: homogeneous transformation matrices [frame, m+1, m+1]
+    """
+    positions = np.asarray(positions, dtype=float)
+    if len(transforms) == 0:
+        dimension = positions.shape[1]
+        return np.empty((0, dimension + 1, dimension + 1))
+    positions_t = transform_points(transforms, positions)
+    if robust:
+        return fit_rigid_transforms_robust(positions, positions_t)
+    return fit_rigid_transforms(positions, positions_t)
+
+
+def chunk_ranges(num_frames:int, num_chunks:int) -> list[tuple[int, int]]:
+    """ Split the frames into at most num_chunks contiguous chunks of (almost) equal size, (start, stop) stop exclusive. """
+    num_chunks = max(1, min(num_chunks, num_frames))
+    bounds = np.linspace(0, num_frames, num_chunks + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def register_chunk(method:str, fixed:sitk.Image, movings:list[sitk.Image], mask:sitk.Image,
+                   config:RegistrationConfig=None, resample=True, records:list=None) -> list[tuple[sitk.Image, sitk.Transform]]:
+    """ Register the moving images to the fixed image in order, each warm started from the transform of the previous.
+    The first image of the chunk starts from the identity.
+
+    :param method: 'rigid' or 'deformable'
+    :param records: If given, the telemetry of each registration is appended
+    :return: List of registered images (None if not resample) and transforms
+    """
+    registration = {'rigid': rigid_registration, 'deformable': deformable_registration}[method]
+
+    initial_transform = None
+    results = []
+    for moving in movings:
+        registered_image, transform = registration(fixed, moving, mask, initial_transform=initial_transform, 
+                                                   config=config, resample=resample, records=records)
+        initial_transform = transform
+        results.append([registered_image, transform])
+
+    return results
+
+
+def register_chunk_records(method:str, fixed:sitk.Image, movings:list[sitk.Image], mask:sitk.Image,
+                           config:RegistrationConfig=None) -> tuple[list[tuple[sitk.Image, sitk.Transform]], list[dict]]:
+    """ register_chunk in a worker process, returning the results (transforms only) and the telemetry records. """
+    records = []
+    results = register_chunk(method, fixed, movings, mask, config, False, records)
+    return results, records
+
+
+def register_sequence(method:str, fixed:sitk.Image, movings:list[sitk.Image], mask:sitk.Image,
+                      config:RegistrationConfig=None, resample=True, num_chunks=1, 
+                      max_workers:int=None, records:list=None) -> list[tuple[sitk.Image, sitk.Transform]]:
+    """ Register the moving images to the fixed image, sequentially or in parallel chunks.
+
+    With num_chunks > 1 the sequence is split into contiguous chunks, see chunk_ranges, each warm started from its own
+    first frame, and the chunks are registered in a process pool. The results are merged back in order. Only the
+    transforms are returned from the workers, so resample must be False with num_chunks > 1.
+
+    :param method: 'rigid' or 'deformable'
+    :param num_chunks: Number of chunks, 1 for the sequential registration
+    :param max_workers: Number of processes, if None the number of chunks (limited by the number of cores)
+    :param records: If given, the telemetry of each registration is appended (in frame order)
+    """
+    if num_chunks <= 1:
+        return register_chunk(method, fixed, movings, mask, config, resample, records)
+    if resample:
+        raise ValueError('The registered images are not returned from parallel chunks, use resample=False')
+
+    ranges = chunk_ranges(len(movings), num_chunks)
+    if max_workers is None:
+        max_workers = min(len(ranges), os.cpu_count() or 1)
+
+    # share the cores between the workers instead of all workers using all cores
+    if config is None:
+        config = registration_profile('default')
+    config = config.with_threads(max(1, (os.cpu_count() or 1) // max_workers))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(register_chunk_records, method, fixed, movings[start:stop], mask, config) 
+                   for start, stop in ranges]
+        chunks = [future.result() for future in futures]
+
+    if records is not None:
+        records.extend([record for _, chunk_records in chunks for record in chunk_records])
+    return [result for chunk_results, _ in chunks for result in chunk_results]
+
+
+def add_sequence_telemetry(telemetry:RegistrationTelemetry, records:list[dict], plane:int):
+    """ Add the records of the frames of a sequence to the telemetry, as one batch. """
+    batch = telemetry.num_batches
+    for record in records:
+        telemetry.add(record, plane, batch)
+
+
+def cine_sequence_deformable_registration(cines:list, mask:sitk.Image, positions:list, resample=True, num_chunks=1,
+                                          max_workers:int=None, config:RegistrationConfig=None, 
+                                          telemetry:RegistrationTelemetry=None, plane:int=None) -> list[tuple[sitk.Image, np.array]]:
     """ Register the cine sequence to extract the motion. 
     
     Use the first cine as the fixed image and register all other cines to this image.
@@ -20,27 +183,31 @@ def cine_sequence_deformable_registration(cines:list, mask:sitk.Image, positions
 
     :param cines: List of cine images
     :param mask: Mask of the region of interest
-    :param centre_position: Position used to determine the displacement.
+    :param positions: Positions used to determine the displacement.
+    :param resample: If False the registered images are not computed (None), only the motion
+    :param num_chunks: Register in parallel chunks if > 1 (requires resample=False), see register_sequence
+    :param telemetry: If given, the telemetry of the registrations is added as one batch of the plane
+    :param plane: The plane of the cines (0 transversal, 1 coronal, 2 sagittal), required with telemetry
     :return: List of registered images and the displacement of the centre position.
     """
 
-    fixed = cines[0].image
-    initial_transform = None
-    results = []
-    
-    for moving in cines[1::]:
-        
-        registered_image, transform = deformable_registration(fixed.image, moving.image, mask, 
-                                                              initial_transform=initial_transform)
-        initial_transform = transform
-        rigid_transform = extract_rigid_displacement(transform, positions)
+    if telemetry is not None and plane is None:
+        raise ValueError('The plane of the cines is required to add the telemetry')
 
-        results.append([registered_image, rigid_transform])
+    fixed = cines[0].image
+    movings = [moving.image for moving in cines[1::]]
+    records = [] if telemetry is not None else None
+    results = register_sequence('deformable', fixed, movings, mask, config, resample, num_chunks, max_workers, records)
+    if telemetry is not None:
+        add_sequence_telemetry(telemetry, records, plane)
+    rigid_transforms = extract_rigid_displacements([transform for _, transform in results], positions)
 
-    return results
+    return [[registered_image, rigid_transform] for (registered_image, _), rigid_transform in zip(results, rigid_transforms)]
 
 
-def cine_sequence_rigid_registration(cines:list, mask:sitk.Image) -> list[tuple[sitk.Image, sitk.Transform]]:
+def cine_sequence_rigid_registration(cines:list, mask:sitk.Image, resample=True, num_chunks=1, max_workers:int=None,
+                                     config:RegistrationConfig=None, telemetry:RegistrationTelemetry=None, 
+                                     plane:int=None) -> list[tuple[sitk.Image, sitk.Transform]]:
     """ Rigidly register the cine sequence to extract the motion. 
     
     Use the first cine as the fixed image and register all other cines to this image.
@@ -48,19 +215,21 @@ def cine_sequence_rigid_registration(cines:list, mask:sitk.Image) -> list[tuple[
 
     :param cines: List of cine images
     :param mask: Mask of the region of interest
+    :param resample: If False the registered images are not computed (None), only the transforms
+    :param num_chunks: Register in parallel chunks if > 1 (requires resample=False), see register_sequence
+    :param telemetry: If given, the telemetry of the registrations is added as one batch of the plane
+    :param plane: The plane of the cines (0 transversal, 1 coronal, 2 sagittal), required with telemetry
     :return: List of registered images and the displacement of the centre position.
     """
 
-    fixed = cines[0]
-    initial_transform = None
-    results = []
-    
-    for moving in cines[1::]:
-        
-        registered_image, transform = rigid_registration(fixed.image, moving.image, mask, 
-                                                         initial_transform=initial_transform)
-        initial_transform = transform
-        results.append([registered_image, transform])
+    if telemetry is not None and plane is None:
+        raise ValueError('The plane of the cines is required to add the telemetry')
 
-    return results
+    fixed = cines[0].image
+    movings = [moving.image for moving in cines[1::]]
+    records = [] if telemetry is not None else None
+    results = register_sequence('rigid', fixed, movings, mask, config, resample, num_chunks, max_workers, records)
+    if telemetry is not None:
+        add_sequence_telemetry(telemetry, records, plane)
 
+    return results
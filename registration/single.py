@@ -1,5 +1,8 @@
 
+import time
 import SimpleITK as sitk
+from .config import RegistrationConfig, registration_profile
+from .telemetry import registration_record
 
 def command_iteration(method):
     """ Callback invoked when the optimization has an iteration """
@@ -12,10 +15,25 @@ def command_iteration(method):
     )
 
 
-def rigid_registration(fixed:sitk.Image, moving:sitk.Image, mask:sitk.Image, initial_transform=None) -> tuple[sitk.Image, sitk.Transform]:
+def flatten_transform(transform:sitk.Transform) -> sitk.Transform:
+    """ The transform of a composite of one transform, e.g. the result of a registration with an initial transform 
+    that is not modified in place, otherwise the transform. """
+    if isinstance(transform, sitk.CompositeTransform) and transform.GetNumberOfTransforms() == 1:
+        return transform.GetNthTransform(0)
+    return transform
+
+
+def rigid_registration(fixed:sitk.Image, moving:sitk.Image, mask:sitk.Image, initial_transform=None, 
+                       config:RegistrationConfig=None, resample=True, records:list=None) -> tuple[sitk.Image, sitk.Transform]:
     """
     Register the moving image to the fixed image using the SimpleITK library.
+    The config (default profile if None) controls iterations, sampling, resolutions, threads and logging.
+    If not resample, the registered image is None (only the transform is needed for the motion).
+    If a list of records is given, the telemetry of the registration is appended, see registration_record.
     """
+    if config is None:
+        config = registration_profile('default')
+
     fixed_f = sitk.Cast(fixed, sitk.sitkFloat32)
     moving_f = sitk.Cast(moving, sitk.sitkFloat32)   
 
@@ -32,34 +50,51 @@ def rigid_registration(fixed:sitk.Image, moving:sitk.Image, mask:sitk.Image, ini
     R.SetOptimizerAsRegularStepGradientDescent(
         learningRate=2.0,
         minStep=1e-4,
-        numberOfIterations=500,
+        numberOfIterations=config.simpleitk_iterations(),
         gradientMagnitudeTolerance=1e-8,
     )
     R.SetOptimizerScalesFromIndexShift()
+    config.apply_to_registration_method(R, fixed_f)
 
-    R.SetInitialTransform(initial_transform)
+    R.SetInitialTransform(initial_transform, inPlace=False)
     R.SetInterpolator(sitk.sitkLinear)
 
     metric_start = R.MetricEvaluate(fixed_f, moving_f)
     #R.AddCommand(sitk.sitkIterationEvent, lambda: command_iteration(R))
     
-    outTx = R.Execute(fixed_f, moving_f)
-
-    print("-------")
-    print(f"Optimizer stop condition: {R.GetOptimizerStopConditionDescription()}")
-    print(f" Iteration: {R.GetOptimizerIteration()}")
-    print(f" Metric value start/sopt: {metric_start} / {R.GetMetricValue()}")
-    print(f" Transform parameters: {outTx.GetParameters()}")
+    start = time.perf_counter()
+    outTx = flatten_transform(R.Execute(fixed_f, moving_f))
+    if records is not None:
+        records.append(registration_record('rigid', time.perf_counter() - start, R.GetOptimizerIteration(), 
+                                           config.simpleitk_iterations(), R.GetMetricValue(), 
+                                           R.GetOptimizerStopConditionDescription(), 1, fixed.GetNumberOfPixels()))
+
+    if config.log_to_console:
+        print("-------")
+        print(f"Optimizer stop condition: {R.GetOptimizerStopConditionDescription()}")
+        print(f" Iteration: {R.GetOptimizerIteration()}")
+        print(f" Metric value start/sopt: {metric_start} / {R.GetMetricValue()}")
+        print(f" Transform parameters: {outTx.GetParameters()}")
+
+    if not resample:
+        return None, outTx
 
     moving_t = sitk.Resample(moving, fixed, outTx, sitk.sitkLinear, 0.0, moving.GetPixelID())
 
     return moving_t, outTx
 
 
-def deformable_registration(fixed:sitk.Image, moving:sitk.Image, fixed_mask:sitk.Image, initial_transform=None) -> tuple[sitk.Image, sitk.Transform]:
+def deformable_registration(fixed:sitk.Image, moving:sitk.Image, fixed_mask:sitk.Image, initial_transform=None,
+                            config:RegistrationConfig=None, resample=True, records:list=None) -> tuple[sitk.Image, sitk.Transform]:
     """
     Register the moving image to the fixed image using the SimpleITK library.
+    The config (default profile if None) controls iterations, sampling, resolutions, threads and logging.
+    If not resample, the registered image is None (only the transform is needed for the motion).
+    If a list of records is given, the telemetry of the registration is appended, see registration_record.
     """
+    if config is None:
+        config = registration_profile('default')
+
     fixed_f = sitk.Cast(fixed, sitk.sitkFloat32)
     moving_f = sitk.Cast(moving, sitk.sitkFloat32)   
 
@@ -75,22 +110,33 @@ def deformable_registration(fixed:sitk.Image, moving:sitk.Image, fixed_mask:sitk
     R.SetOptimizerAsRegularStepGradientDescent(
         learningRate=2.0,
         minStep=1e-4,
-        numberOfIterations=500,
+        numberOfIterations=config.simpleitk_iterations(),
         gradientMagnitudeTolerance=1e-8,
     )
     R.SetOptimizerScalesFromIndexShift()
+    config.apply_to_registration_method(R, fixed_f)
 
-    R.SetInitialTransform(initial_transform)
+    R.SetInitialTransform(initial_transform, inPlace=False)
     R.SetInterpolator(sitk.sitkLinear)
 
-    R.AddCommand(sitk.sitkIterationEvent, lambda: command_iteration(R))
-    outTx = R.Execute(fixed_f, moving_f)
-
-    print("-------")
-    print(outTx)
-    print(f"Optimizer stop condition: {R.GetOptimizerStopConditionDescription()}")
-    print(f" Iteration: {R.GetOptimizerIteration()}")
-    print(f" Metric value: {R.GetMetricValue()}")
+    if config.log_to_console:
+        R.AddCommand(sitk.sitkIterationEvent, lambda: command_iteration(R))
+    start = time.perf_counter()
+    outTx = flatten_transform(R.Execute(fixed_f, moving_f))
+    if records is not None:
+        records.append(registration_record('deformable', time.perf_counter() - start, R.GetOptimizerIteration(), 
+                                           config.simpleitk_iterations(), R.GetMetricValue(), 
+                                           R.GetOptimizerStopConditionDescription(), 1, fixed.GetNumberOfPixels()))
+
+    if config.log_to_console:
+        print("-------")
+        print(outTx)
+        print(f"Optimizer stop condition: {R.GetOptimizerStopConditionDescription()}")
+        print(f" Iteration: {R.GetOptimizerIteration()}")
+        print(f" Metric value: {R.GetMetricValue()}")
+
+    if not resample:
+        return None, outTx
 
     #resampler = sitk.ResampleImageFilter()
     #resampler.SetReferenceImage(fixed_f)
@@ -0,0 +1,105 @@
+import os
+import glob
+import numpy as np
+
+
+###########################################################################################
+def read_iteration_info(output_directory:str) -> list[np.array]:
+    """ The metric values per iteration of each resolution from the Elastix IterationInfo files. """
+    metrics = []
+    for filename in sorted(glob.glob(os.path.join(output_directory, 'IterationInfo.*.txt'))):
+        with open(filename, 'r') as f:
+            lines = f.readlines()[1:]
+        metrics.append(np.array([float(line.split()[1]) for line in lines if len(line.split()) > 1]))
+    return metrics
+
+###########################################################################################
+def read_stop_condition(output_directory:str) -> str|None:
+    """ The stopping condition of the last resolution from the Elastix log, None if not logged. """
+    stop_condition = None
+    for filename in glob.glob(os.path.join(output_directory, 'elastix*.log')):
+        with open(filename, 'r', errors='replace') as f:
+            for line in f:
+                if 'Stopping condition:' in line:
+                    stop_condition = line.split('Stopping condition:', 1)[1].strip()
+    return stop_condition
+
+###########################################################################################
+def registration_record(method:str, wall_time:float, num_iterations:int, max_iterations:int, final_metric:float,
+                        stop_condition:str, num_frames:int, num_pixels:int, hit_iteration_cap:bool=None,
+                        cached=False) -> dict:
+    """ The telemetry of one registration (one plane of a batch or window).
+
+    :param wall_time        : Wall time (s)
+    :param num_iterations   : Number of optimiser iterations, over all resolutions
+    :param max_iterations   : Maximum number of iterations per resolution
+    :param num_pixels       : Number of pixels per frame
+    :param hit_iteration_cap: If None, the number of iterations reached the maximum of all resolutions
+    :param cached           : The result was read from the registration result cache
+    """
+    if hit_iteration_cap is None:
+        hit_iteration_cap = num_iterations >= max_iterations
+    return {'Method': method,
+            'WallTime': float(wall_time),
+            'Iterations': int(num_iterations),
+            'MaxIterations': int(max_iterations),
+            'HitIterationCap': bool(hit_iteration_cap),
+            'FinalMetric': None if final_metric is None else float(final_metric),
+            'StopCondition': stop_condition,
+            'NumFrames': int(num_frames),
+            'NumPixels': int(num_pixels),
+            'Cached': bool(cached)}
+
+###########################################################################################
+def elastix_record(output_directory:str, wall_time:float, max_iterations:int, num_frames:int, num_pixels:int) -> dict:
+    """ The telemetry of an Elastix registration logged to the output directory. """
+    metrics = read_iteration_info(output_directory)
+    final_metric = metrics[-1][-1] if len(metrics) > 0 and len(metrics[-1]) > 0 else None
+    hit_iteration_cap = any(len(m) >= max_iterations for m in metrics)
+    return registration_record('elastix', wall_time, sum(len(m) for m in metrics), max_iterations, final_metric,
+                               read_stop_condition(output_directory), num_frames, num_pixels, hit_iteration_cap)
+
+
+class RegistrationTelemetry(object):
+    """ Telemetry of the registrations of a fraction, one record per plane and batch (or window).
+    Collected in the main process, the workers return the records, see registration_record.
+    """
+
+    PLANES = ['Transversal', 'Coronal', 'Sagittal']
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, record:dict, plane:int, batch:int):
+        """ Add the record of a registration of the plane (0 transversal, 1 coronal, 2 sagittal) in a batch. """
+        record = dict(record)
+        record['Plane'] = self.PLANES[plane]
+        record['Batch'] = int(batch)
+        self.records.append(record)
+
+    @property
+    def num_batches(self) -> int:
+        """ Number of batches recorded, the next batch index. """
+        return 1 + max([record['Batch'] for record in self.records], default=-1)
+
+    def summary(self) -> dict:
+        """ Totals over all records, and per plane. """
+        def totals(records):
+            num_frames = sum(record['NumFrames'] for record in records)
+            wall_time = sum(record['WallTime'] for record in records)
+            return {'NumRegistrations': len(records),
+                    'NumFrames': num_frames,
+                    'WallTime': wall_time,
+                    'WallTimePerFrame': wall_time / num_frames if num_frames > 0 else None,
+                    'Iterations': sum(record['Iterations'] for record in records),
+                    'NumHitIterationCap': sum(record['HitIterationCap'] for record in records),
+                    'NumCached': sum(record['Cached'] for record in records)}
+
+        summary = totals(self.records)
+        for plane in self.PLANES:
+            summary[plane] = totals([record for record in self.records if record['Plane'] == plane])
+        return summary
+
+    def to_dict(self) -> dict:
+        return {'Summary': self.summary(),
+                'Records': self.records}
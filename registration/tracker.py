@@ -0,0 +1,146 @@
+import time
+import numpy as np
+import SimpleITK as sitk
+from ..readcine.readcines import CineImage, SliceDirection, resample_cine_to_identity
+from .preprocessing import crop_image, image_to_2d
+from .phase_correlation import registration_window, weighted_spectrum, phase_correlation_shifts
+from .pyramid import restricted_search
+
+
+class QuantileNormaliser(object):
+    """ Map the intensities of a frame to the reference by piecewise linear interpolation between quantiles.
+    The numpy equivalent of histogram_matching_sequence (HistogramMatching with match points, without threshold
+    at mean intensity), with the reference quantiles computed once.
+    """
+
+    def __init__(self, reference:np.array, num_match_points=10):
+        self.levels = np.linspace(0, 100, num_match_points + 2)
+        self.reference_quantiles = np.percentile(reference, self.levels)
+
+    def __call__(self, frame:np.array) -> np.array:
+        quantiles = np.percentile(frame, self.levels)
+        return np.interp(frame, quantiles, self.reference_quantiles).astype(np.float32)
+
+
+class PlaneTracker(object):
+    """ Template, mask and normaliser of one slice direction, registers one frame at a time to the template. """
+
+    def __init__(self, reference_images:list[sitk.Image], mask:sitk.Image, crop_box:list, slice_direction:SliceDirection,
+                 num_template_frames=10, refine=True):
+        """
+        :param reference_images: The first (identity direction) images of the plane, at least num_template_frames
+        :param mask            : The cropped 2D registration mask, see prepare_masks
+        :param crop_box        : The crop box of the plane, see prepare_masks
+        :param refine          : Refine the phase correlation by a +-1 pixel search at full resolution
+        """
+        self.crop_box = crop_box
+        self.slice_direction = slice_direction
+        self.refine = refine
+
+        frames = [self._to_array(image) for image in reference_images]
+        self.normaliser = QuantileNormaliser(frames[min(10, len(frames) - 1)])
+        self.template = np.mean([self.normaliser(frame) for frame in frames[0:num_template_frames]], axis=0)
+
+        self.mask = sitk.GetArrayFromImage(mask) > 0
+        self.spacing = np.array(mask.GetSpacing())
+        self.window = registration_window(self.template.shape, self.mask)
+        self.template_spectrum = weighted_spectrum(self.template, registration_window(self.template.shape))
+
+    def _to_array(self, image:sitk.Image) -> np.array:
+        """ Crop to the box and convert to a 2D array. """
+        image_2d = image_to_2d(crop_image(image, self.crop_box), self.slice_direction)
+        return sitk.GetArrayViewFromImage(image_2d).astype(np.float32)
+
+    def track(self, image:sitk.Image) -> np.array:
+        """ The displacement (dx, dy) in mm of an (identity direction) image relative to the template. """
+        frame = self.normaliser(self._to_array(image))[None]
+        shifts = phase_correlation_shifts(weighted_spectrum(frame, self.window), self.template_spectrum, frame.shape[1:])
+        if self.refine:
+            shifts = restricted_search(frame, self.template, self.mask, shifts)
+        return shifts[0] * self.spacing
+
+
+class FrameTracker(object):
+    """ Low latency motion tracking, one raw cine frame at a time.
+
+    A PlaneTracker holds the template, mask and normaliser for each slice direction (transversal, coronal, sagittal).
+    The latency of each frame is recorded. If the median latency of the last frames of a plane exceeds the latency
+    budget, the refinement of that plane is turned off (phase correlation only), recorded in refinement_events.
+    """
+
+    def __init__(self, reference_sequences:list[list[sitk.Image]], masks:list[sitk.Image], crop_boxes:list,
+                 latency_budget_ms=50.0, num_template_frames=10, refine=True, num_latency_frames=20):
+        """
+        :param reference_sequences: The first (identity direction) images of the transversal, coronal and sagittal planes
+        :param masks              : The cropped 2D registration masks, see prepare_masks
+        :param crop_boxes         : The crop boxes, see prepare_masks
+        :param latency_budget_ms  : Latency budget per frame (ms)
+        :param num_latency_frames : Number of recent frames used to compare the latency with the budget
+        """
+        directions = [SliceDirection.TRANSVERSAL, SliceDirection.CORONAL, SliceDirection.SAGITTAL]
+        self.planes = [PlaneTracker(images, mask, crop_box, direction, num_template_frames, refine)
+                       for images, mask, crop_box, direction in zip(reference_sequences, masks, crop_boxes, directions)]
+        self.latency_budget_ms = latency_budget_ms
+        self.num_latency_frames = num_latency_frames
+        self.latencies = [[] for _ in self.planes]
+        self.refinement_events = []
+
+    @staticmethod
+    def plane_index(cine:CineImage) -> int:
+        if cine.is_transversal():
+            return 0
+        if cine.is_coronal():
+            return 1
+        if cine.is_sagittal():
+            return 2
+        raise ValueError('Unknown slice direction of cine')
+
+    def _record_latency(self, plane:int, start:float):
+        latencies = self.latencies[plane]
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        tracker = self.planes[plane]
+        recent = latencies[-self.num_latency_frames:]
+        if tracker.refine and len(recent) == self.num_latency_frames and np.median(recent) > self.latency_budget_ms:
+            tracker.refine = False
+            self.refinement_events.append({'Plane': plane, 'Frame': len(latencies) - 1, 
+                                           'MedianLatency': float(np.median(recent)), 'Refine': False})
+
+    def track(self, plane:int, image:sitk.Image) -> np.array:
+        """ The displacement (dx, dy) in mm of an identity direction image of the plane. """
+        start = time.perf_counter()
+        displacement = self.planes[plane].track(image)
+        self._record_latency(plane, start)
+        return displacement
+
+    def track_cine(self, cine:CineImage) -> tuple[int, np.array]:
+        """ Track a raw cine (resampled to identity direction here), the latency includes the resampling.
+
+        :return: the plane index and the displacement (dx, dy) in mm
+        """
+        start = time.perf_counter()
+        plane = self.plane_index(cine)
+        displacement = self.planes[plane].track(resample_cine_to_identity(cine).image)
+        self._record_latency(plane, start)
+        return plane, displacement
+
+    def latency_statistics(self) -> dict:
+        """ Latency statistics (ms) per plane and over all frames. """
+        def statistics(latencies):
+            if len(latencies) == 0:
+                return {'NumFrames': 0}
+            latencies = np.array(latencies)
+            return {'NumFrames': len(latencies),
+                    'Mean': float(np.mean(latencies)),
+                    'P50': float(np.percentile(latencies, 50)),
+                    'P90': float(np.percentile(latencies, 90)),
+                    'P99': float(np.percentile(latencies, 99)),
+                    'Max': float(np.max(latencies)),
+                    'OverBudget': float(np.mean(latencies > self.latency_budget_ms))}
+
+        return {'LatencyBudget': self.latency_budget_ms,
+                'RefinementEvents': self.refinement_events,
+                'Transversal': statistics(self.latencies[0]),
+                'Coronal': statistics(self.latencies[1]),
+                'Sagittal': statistics(self.latencies[2]),
+                'All': statistics([latency for latencies in self.latencies for latency in latencies])}
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class WarmStart(object):
+    """ State to warm start the group registration of a batch from the solution of the previous batch.
+
+    Each batch starts with the same reference images (see run_all), followed by the new images. The reference
+    images are initialised with their displacements in the previous batch, and the new images with a prediction
+    from the previous batch:
+        'last'  : the last displacement of the previous batch
+        'mean'  : the mean displacement of the previous batch (the breathing mid position)
+        'linear': a linear fit over the previous batch, extrapolated over the new batch (baseline drift)
+
+    The iterations saved are measured against the iterations of a cold start, by default the first batch of the
+    plane (started from zero). The number of iterations only depends on the start with an optimiser that stops
+    early, see RegistrationConfig.early_stopping_tolerance.
+    """
+
+    def __init__(self, predictor='mean', num_reference_images=10, num_planes=3):
+        if predictor not in ['last', 'mean', 'linear']:
+            raise ValueError(f'Unknown predictor {predictor}')
+
+        self.predictor = predictor
+        self.num_reference_images = num_reference_images
+        self._previous = [None] * num_planes
+        self.iterations = [[] for _ in range(num_planes)]
+        self.iterations_saved = [[] for _ in range(num_planes)]
+        self.cold_start_iterations = [None] * num_planes
+
+    def _predict(self, previous:np.array, num_images:int) -> np.array:
+        """ Predict the displacements of the new images from the displacements of the previous batch. """
+        if self.predictor == 'last':
+            return np.repeat(previous[-1:], num_images, axis=0)
+
+        if self.predictor == 'mean':
+            return np.repeat(np.mean(previous, axis=0, keepdims=True), num_images, axis=0)
+
+        # linear, fit over the previous batch with image index as time
+        t_previous = np.arange(len(previous))
+        t_new = len(previous) + np.arange(num_images)
+        coefficients = np.polyfit(t_previous, previous, 1)
+        return np.outer(t_new, coefficients[0]) + coefficients[1]
+
+    def initial_displacements(self, plane:int, num_images:int) -> np.array:
+        """ Initial displacements [image, (x, y)] of the next batch of a plane, None if there is no previous batch.
+
+        :param plane: Index of the slice direction
+        :param num_images: Number of images in the batch, including the reference images
+        """
+        previous = self._previous[plane]
+        if previous is None:
+            return None
+
+        n_ref = self.num_reference_images
+        reference = previous[0:n_ref]
+        new = previous[n_ref:] if len(previous) > n_ref else previous
+        return np.concatenate([reference, self._predict(new, num_images - n_ref)])
+
+    def update(self, plane:int, displacements:np.array, num_iterations:int, cold_start_iterations:int=None):
+        """ Store the (not reset) displacements of a registered batch and the iterations used.
+
+        :param cold_start_iterations: The iterations of the batch started from zero, if None the iterations of 
+                                      the first batch of the plane. Negative savings are kept.
+        """
+        if self._previous[plane] is None and self.cold_start_iterations[plane] is None:
+            self.cold_start_iterations[plane] = num_iterations
+        if cold_start_iterations is None:
+            cold_start_iterations = self.cold_start_iterations[plane]
+
+        self._previous[plane] = np.array(displacements)
+        self.iterations[plane].append(num_iterations)
+        self.iterations_saved[plane].append(cold_start_iterations - num_iterations)
+
+    def to_dict(self) -> dict:
+        return {'Predictor': self.predictor,
+                'Iterations': self.iterations,
+                'ColdStartIterations': self.cold_start_iterations,
+                'IterationsSaved': self.iterations_saved,
+                'TotalIterationsSaved': int(np.sum([np.sum(saved) for saved in self.iterations_saved]))}
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+###########################################################################################
+def window_ranges(num_frames:int, window_size:int, overlap:int) -> list[tuple[int, int]]:
+    """ Split a sequence into overlapping windows.
+    A last window adding fewer frames than the overlap is merged with the window before.
+
+    :param num_frames : Number of frames in the sequence
+    :param window_size: Number of frames per window
+    :param overlap    : Number of frames shared by adjacent windows
+    :return: list of (start, stop) frame indices, stop exclusive
+    """
+    if overlap < 1 or overlap >= window_size:
+        raise ValueError(f'Overlap must be between 1 and window size - 1, got {overlap} for window size {window_size}')
+
+    step = window_size - overlap
+    ranges = []
+    start = 0
+    while True:
+        stop = min(start + window_size, num_frames)
+        ranges.append((start, stop))
+        if stop == num_frames:
+            break
+        start += step
+
+    if len(ranges) > 1 and ranges[-1][1] - ranges[-2][1] < overlap:
+        ranges = ranges[:-2] + [(ranges[-2][0], num_frames)]
+
+    return ranges
+
+###########################################################################################
+def window_offsets(window_displacements:list[np.array], ranges:list[tuple[int, int]]) -> np.array:
+    """ Offsets that align the windows to each other in the least squares sense over the overlaps.
+    Each window is registered to itself (e.g. groupwise), so its displacements are known up to a constant.
+    For a chain of windows the least squares offset between two windows is the mean difference over their overlap.
+    The first window has zero offset.
+
+    :return: offsets [window, direction]
+    """
+    offsets = np.zeros([len(ranges), window_displacements[0].shape[1]])
+    for i in range(1, len(ranges)):
+        start, _ = ranges[i]
+        previous_start, previous_stop = ranges[i-1]
+        overlap_previous = window_displacements[i-1][start - previous_start:]
+        overlap_current = window_displacements[i][0:previous_stop - start]
+        offsets[i] = offsets[i-1] + np.mean(overlap_previous - overlap_current, axis=0)
+
+    return offsets
+
+###########################################################################################
+def stitch_windows(window_displacements:list[np.array], ranges:list[tuple[int, int]]) -> np.array:
+    """ Stitch the displacements of overlapping windows into one trace.
+    The windows are aligned with window_offsets and blended linearly over the overlaps.
+
+    :param window_displacements: Displacements [frame, direction] per window
+    :param ranges: (start, stop) of each window, see window_ranges
+    :return: displacements [frame, direction] of the full sequence
+    """
+    num_frames = ranges[-1][1]
+    offsets = window_offsets(window_displacements, ranges)
+
+    displacements = np.zeros([num_frames, window_displacements[0].shape[1]])
+    weights = np.zeros(num_frames)
+    for i, ((start, stop), d) in enumerate(zip(ranges, window_displacements)):
+        if len(d) != stop - start:
+            raise ValueError(f'Window {i} has {len(d)} displacements, expected {stop - start}')
+
+        # ramp the weight up over the overlap with the previous window and down over the next
+        w = np.ones(stop - start)
+        if i > 0:
+            n = ranges[i-1][1] - start
+            w[0:n] = np.arange(1, n + 1) / (n + 1)
+        if i < len(ranges) - 1:
+            n = stop - ranges[i+1][0]
+            w[len(w) - n:] = np.arange(n, 0, -1) / (n + 1)
+
+        displacements[start:stop] += w[:, None] * (d + offsets[i])
+        weights[start:stop] += w
+
+    return displacements / weights[:, None]
@@ -0,0 +1,54 @@
+import os
+import sys
+import glob
+import json
+
+
+#################################################################################
+def read_registration_cost(report_filename:str) -> dict|None:
+    """ The registration telemetry summary of a motion report, None if the report has no telemetry. """
+    with open(report_filename, 'r') as f:
+        report = json.load(f)
+
+    if 'RegistrationTelemetry' not in report:
+        return None
+
+    summary = report['RegistrationTelemetry']['Summary']
+    return {'Report': os.path.basename(report_filename),
+            'PatientID': report.get('PatientID'),
+            'PlanLabel': report.get('PlanLabel'),
+            'WallTime': summary['WallTime'],
+            'WallTimePerFrame': summary['WallTimePerFrame'],
+            'NumFrames': summary['NumFrames'],
+            'Iterations': summary['Iterations'],
+            'NumHitIterationCap': summary['NumHitIterationCap'],
+            'NumRegistrations': summary['NumRegistrations'],
+            'NumCached': summary['NumCached']}
+
+#################################################################################
+def registration_cost_summary(report_filenames:list[str]) -> list[dict]:
+    """ The registration cost of the fractions, the most expensive first. Reports without telemetry are skipped. """
+    costs = [read_registration_cost(filename) for filename in report_filenames]
+    costs = [cost for cost in costs if cost is not None]
+    return sorted(costs, key=lambda cost: cost['WallTime'], reverse=True)
+
+
+if __name__ == "__main__":
+    """
+    Rank the fractions by registration cost from the telemetry in the motion reports of run_all.py.
+    Usage: python registration_cost_summary.py <report directory>
+    """
+    report_dir = sys.argv[1]
+
+    report_filenames = sorted(glob.glob(os.path.join(report_dir, '*_cine_motion_analysis.json')))
+    costs = registration_cost_summary(report_filenames)
+
+    for cost in costs:
+        per_frame = cost['WallTimePerFrame'] * 1e3 if cost['WallTimePerFrame'] is not None else float('nan')
+        print(f'{cost["Report"]:60} {cost["WallTime"]:8.1f} s {per_frame:7.1f} ms/frame '
+              f'{cost["Iterations"]:7} iterations {cost["NumHitIterationCap"]:3} at cap')
+
+    results_filename = os.path.join(report_dir, 'registration_cost_summary.json')
+    with open(results_filename, 'w') as f:
+        json.dump(costs, f, indent=4)
+        print(f'Wrote registration cost summary to {results_filename}')
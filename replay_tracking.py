@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+
+from readcine.readcines_mha import readcines_mha
+from MRLCinema.extract_motion import resample_to_identity, filter_geometry, sort_cines_direction, prepare_masks_cached
+from MRLCinema.registration.tracker import FrameTracker
+from MRLCinema.motion_trace import MotionTrace
+
+
+#################################################################################
+def replay(tracker:FrameTracker, cines:list, speed=1.0) -> tuple[list[np.array], list[np.array], int]:
+    """ Feed the cines one at a time to the tracker, at the acquisition rate times speed (0 as fast as possible).
+
+    :return: times and displacements per plane, and the number of frames tracked after the next frame was acquired
+    """
+    times, displacements = [[], [], []], [[], [], []]
+    num_late = 0
+    t_first = cines[0].relative_time
+    wall_start = time.perf_counter()
+
+    for i, cine in enumerate(cines):
+        if speed > 0:
+            wait = (cine.relative_time - t_first) / speed - (time.perf_counter() - wall_start)
+            if wait > 0:
+                time.sleep(wait)
+
+        plane, displacement = tracker.track_cine(cine)
+        times[plane].append(cine.relative_time)
+        displacements[plane].append(displacement)
+
+        if speed > 0 and i + 1 < len(cines):
+            next_arrival = (cines[i+1].relative_time - t_first) / speed
+            num_late += (time.perf_counter() - wall_start) > next_arrival
+
+    return [np.array(t) for t in times], [np.array(d) for d in displacements], num_late
+
+#################################################################################
+def compare_to_trace(times:list[np.array], displacements:list[np.array], motion_trace:MotionTrace) -> dict:
+    """ RMS and maximum difference (mm) per plane and direction between the tracked displacements and the
+    (offline) motion trace interpolated at the tracked times. """
+    reference = [(motion_trace.times_transversal, motion_trace.displacements_transversal),
+                 (motion_trace.times_coronal, motion_trace.displacements_coronal),
+                 (motion_trace.times_sagittal, motion_trace.displacements_sagittal)]
+
+    comparison = {}
+    for name, t, d, (t_ref, d_ref) in zip(['Transversal', 'Coronal', 'Sagittal'], times, displacements, reference):
+        if len(t) == 0 or len(t_ref) == 0:
+            continue
+        inside = (t >= t_ref[0]) & (t <= t_ref[-1])
+        d_ref_t = np.stack([np.interp(t[inside], t_ref, d_ref[:, i]) for i in range(2)], axis=1)
+        difference = d[inside] - d_ref_t
+        comparison[name] = {'NumFrames': int(np.sum(inside)),
+                            'RMS': np.sqrt(np.mean(difference**2, axis=0)).tolist(),
+                            'Max': np.max(np.abs(difference), axis=0).tolist()}
+    return comparison
+
+
+if __name__ == "__main__":
+    """
+    Replay an archived fraction through the frame tracker at the acquisition rate and compare with the
+    motion trace of run_all.py.
+    Usage: python replay_tracking.py <cine_times_filenames.json> <rtss.dcm> <cine_motion_analysis.json> [speed] [num_cines]
+    """
+    cine_filename_times_filename = sys.argv[1]
+    rtss_filename = sys.argv[2]
+    report_filename = sys.argv[3]
+    speed = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+    num_cines = int(sys.argv[5]) if len(sys.argv) > 5 else 2000
+    num_reference_images = 10
+
+    with open(cine_filename_times_filename, 'r') as f:
+        cine_filename_times = json.load(f)
+
+    cine_filenames = list(cine_filename_times.keys())[0:num_cines]
+    cines = readcines_mha({ filename: cine_filename_times[filename] for filename in cine_filenames })
+
+    transversals, coronals, sagittals = sort_cines_direction(cines)
+    transversals, coronals, sagittals = filter_geometry(transversals), filter_geometry(coronals), filter_geometry(sagittals)
+
+    # template, masks and normalisers from the first images, as in run_all
+    references = resample_to_identity(transversals[0:num_reference_images], coronals[0:num_reference_images],
+                                      sagittals[0:num_reference_images])
+    masks, crop_boxes = prepare_masks_cached(references[0][0], references[1][0], references[2][0], rtss_filename, None)
+    tracker = FrameTracker([[cine.image for cine in sequence] for sequence in references], masks, crop_boxes)
+
+    cines = sorted(transversals + coronals + sagittals, key=lambda cine: cine.relative_time)
+    times, displacements, num_late = replay(tracker, cines, speed)
+
+    results = {'Speed': speed,
+               'NumFrames': len(cines),
+               'NumLate': num_late,
+               'Latency': tracker.latency_statistics(),
+               'Comparison': compare_to_trace(times, displacements, MotionTrace.from_file(report_filename))}
+
+    latency = results['Latency']['All']
+    print(f'{len(cines)} frames, latency p50 {latency["P50"]:.1f} ms, p99 {latency["P99"]:.1f} ms, {num_late} late frames')
+    for event in results['Latency']['RefinementEvents']:
+        print(f'Plane {event["Plane"]} frame {event["Frame"]}: median latency {event["MedianLatency"]:.1f} ms above budget, '
+              f'refinement turned off')
+    for name, comparison in results['Comparison'].items():
+        print(f'{name:12} RMS difference {comparison["RMS"][0]:.2f} {comparison["RMS"][1]:.2f} mm')
+
+    results_filename = os.path.splitext(report_filename)[0] + '_replay.json'
+    with open(results_filename, 'w') as f:
+        json.dump(results, f, indent=4)
+        print(f'Wrote replay to {results_filename}')
@@ -2,8 +2,13 @@
 import json
 import numpy as np
 from .motion_trace import MotionTrace
+from .registration.config import RegistrationConfig
+from .registration.warm_start import WarmStart
+from .registration.telemetry import RegistrationTelemetry
 
-def create_report(patient_ID:str, cine_path:str, plan_label:str, prescription:tuple, motion_trace:MotionTrace) -> dict:
+def create_report(patient_ID:str, cine_path:str, plan_label:str, prescription:tuple, motion_trace:MotionTrace,
+                  registration_config:RegistrationConfig=None, warm_start:WarmStart=None, 
+                  telemetry:RegistrationTelemetry=None) -> dict:
     """ Create a report for the given patient ID and cine path corresponding to a given RT Plan.
     
     :param patient_ID   : The patient ID
@@ -11,6 +16,9 @@ def create_report(patient_ID:str, cine_path:str, plan_label:str, prescription:tu
     :param plan_label   : The label of the RT Plan
     :param times        : The times of the cine images
     :param displacements: The displacements of the images
+    :param registration_config: The registration settings used to extract the motion
+    :param warm_start   : The warm start of the batches, reports the predictor and the iterations saved
+    :param telemetry    : The registration telemetry, reports the cost of the registrations per plane and batch
     """
 
     displacements_transversal = motion_trace.displacements_transversal
@@ -39,6 +47,13 @@ def create_report(patient_ID:str, cine_path:str, plan_label:str, prescription:tu
     report['DisplacementCoronalX'] = displacements_coronal[:,0].tolist()
     report['DisplacementCoronalZ'] = displacements_coronal[:,1].tolist()
 
+    if registration_config is not None:
+        report['RegistrationProfile'] = registration_config.to_dict()
+    if warm_start is not None:
+        report['WarmStart'] = warm_start.to_dict()
+    if telemetry is not None:
+        report['RegistrationTelemetry'] = telemetry.to_dict()
+
     report['version'] = '1.0' 
 
     return report
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import sys
 import glob
 import time
 import json
@@ -10,10 +11,16 @@ from datetime import datetime
 from MRLCinema.readcine.readcines import readcines_bin
 from readcine.readcines_mha import readcines_mha
 from MRLCinema.extract_motion import motion_analysis, resample_to_identity, filter_geometry
-from MRLCinema.extract_motion import sort_cines_direction, prepare_masks, extract_times
+from MRLCinema.extract_motion import sort_cines_direction, prepare_masks_cached, extract_times
+from MRLCinema.extract_motion import prepare_images, motion_analysis_windowed
+from MRLCinema.registration.preprocessing import crop_image
+from MRLCinema.registration.warm_start import WarmStart
+from MRLCinema.registration.group import peak_memory_mb
+from MRLCinema.registration.telemetry import RegistrationTelemetry
 from MRLCinema.report import create_report
+from MRLCinema.registration.config import registration_profile
 from MRLCinema.patient_data import read_cine_patient_ID, find_cine_frame_of_reference
-from MRLCinema.patient_data import find_structure_set, find_plan_from_frame_of_reference, prescription
+from MRLCinema.patient_data import find_structure_set_filename, find_plan_from_frame_of_reference, prescription
 from MRLCinema.motion_trace import MotionTrace
 
 def find_patient_path(patient_ID:str, paths:str) -> str|None:
@@ -38,6 +45,11 @@ if __name__ == "__main__":
     It reads the patient information, extracts the motion from the cine data,
     and creates a report for each fraction.
     The report is saved in the patient's data directory.
+    Usage: python run_all.py [--warm-start | --windowed]
+    By default each batch is registered when read. With --warm-start each batch is started from the solution of 
+    the previous batch (see WarmStart), with an optimiser that stops early so the iterations saved are measured.
+    With --windowed the prepared images of the whole fraction are kept in memory and registered in overlapping 
+    windows after the last batch.
     """
     
     patient_data_root= f'/mnt/P/TERAPI/MRLINAC/QA/RTQADATA/PATIENT_DATA'
@@ -45,6 +57,17 @@ if __name__ == "__main__":
 
     cine_root_path = '/mnt/Q/MotionManagementData'
     cine_report_path = f'/mnt/P/TERAPI/MRLINAC/QA/RTQADATA/MotionManagement'
+    mask_cache_path = os.path.join(cine_report_path, 'MaskCache')
+    registration_cache_path = os.path.join(cine_report_path, 'RegistrationCache')
+    registration_config = registration_profile('default')
+
+    # one registration per batch, or windowed registration of the full fraction after the last batch (--windowed)
+    windowed = '--windowed' in sys.argv[1:]
+    use_warm_start = '--warm-start' in sys.argv[1:] and not windowed
+    if use_warm_start:
+        registration_config = registration_config.with_early_stopping(0.01)
+    window_size = 200
+    window_overlap = 50
 
     cine_dirs = sorted(glob.glob(os.path.join(cine_root_path, '*')))
     cine_dirs = ['/mnt/Q/1.3.46.670589.11.79101.5.0.4376.2025040911534537010']
@@ -130,10 +153,10 @@ if __name__ == "__main__":
             #    continue
             
             #
-            # Read the structure set to setup masks
+            # Find the structure set to setup masks (only parsed if the masks are not cached)
             #
-            rtss = find_structure_set(patient_path, frame_of_ref)
-            if rtss is None:
+            rtss_filename = find_structure_set_filename(patient_path, frame_of_ref)
+            if rtss_filename is None:
                 print(f'No RTSS found for {patient_ID} in {cine_dir}')
                 continue
 
@@ -152,6 +175,9 @@ if __name__ == "__main__":
             start = 0
             stop = min(start + num_images_per_batch, num_tot_cines)
             motion_trace = MotionTrace()
+            warm_start = WarmStart(predictor='mean') if use_warm_start else None
+            telemetry = RegistrationTelemetry()
+            prepared_images, prepared_times, references = [[], [], []], [[], [], []], None
 
             while start < stop:
 
@@ -187,10 +213,11 @@ if __name__ == "__main__":
                 times_coronal = [cine.relative_time for cine in coronals]
                 times_sagittal = [cine.relative_time for cine in sagittals]
 
-                # append reference images to the current batch at the start 
-                transversals = transversals_ref + transversals
-                coronals = coronals_ref + coronals
-                sagittals = sagittals_ref + sagittals
+                # append reference images to the current batch at the start (not needed when windowed, all batches are registered together)
+                if not windowed:
+                    transversals = transversals_ref + transversals
+                    coronals = coronals_ref + coronals
+                    sagittals = sagittals_ref + sagittals
                 
                 # convert to indentity direction cosines and work only wit them from now on in this inner loop
                 transversals_identity, coronals_identity, sagittals_identity = resample_to_identity(transversals, coronals, sagittals)
@@ -199,16 +226,30 @@ if __name__ == "__main__":
                 # create crop box and masks
                 #
                 if masks is None:
-                   masks, crop_boxes = prepare_masks(transversals_identity[0], coronals_identity[0], sagittals_identity[0], rtss)
+                   masks, crop_boxes = prepare_masks_cached(transversals_identity[0], coronals_identity[0], sagittals_identity[0], 
+                                                            rtss_filename, mask_cache_path)
                 
                 #
-                # Extract the motion
+                # Extract the motion, or when windowed prepare the images for the registration after the last batch
                 #
-                displacements = motion_analysis(transversals_identity, coronals_identity, sagittals_identity, masks[0], masks[1], masks[2], crop_boxes)
-                motion_trace.add([times_transversal, times_coronal, times_sagittal], displacements)
+                if windowed:
+                    if references is None:
+                        references = [crop_image(sequence[10].image, crop_box) 
+                                      for sequence, crop_box in zip([transversals_identity, coronals_identity, sagittals_identity], crop_boxes)]
+                    images = prepare_images(transversals_identity, coronals_identity, sagittals_identity, crop_boxes, references)
+                    for i, times in enumerate([times_transversal, times_coronal, times_sagittal]):
+                        prepared_images[i].extend(images[i])
+                        prepared_times[i].extend(times)
+                else:
+                    displacements = motion_analysis(transversals_identity, coronals_identity, sagittals_identity, masks[0], masks[1], masks[2], crop_boxes,
+                                                    config=registration_config, warm_start=warm_start, telemetry=telemetry)
+                    motion_trace.add([times_transversal, times_coronal, times_sagittal], displacements)
+                    if warm_start is not None:
+                        print(f'Iterations {[iterations[-1] for iterations in warm_start.iterations]}, '
+                              f'saved by warm start {[saved[-1] for saved in warm_start.iterations_saved]}')
                 
                 num_cines_analysed += len(cines)
-                print(start, stop, num_cines_analysed, num_tot_cines)
+                print(start, stop, num_cines_analysed, num_tot_cines, f'peak memory {peak_memory_mb():.0f} MB')
 
                 start += len(cines)
                 stop = min(start + num_images_per_batch, num_tot_cines)
@@ -220,18 +261,32 @@ if __name__ == "__main__":
                 if len(sagittals_ref) == 0:
                    sagittals_ref = sagittals[0:10]
                 
+            if windowed:
+                displacements = motion_analysis_windowed(prepared_images, masks, window_size, window_overlap, config=registration_config,
+                                                         cache_dir=registration_cache_path, telemetry=telemetry)
+                motion_trace.add(prepared_times, displacements)
+                print(f'Windowed registration, peak memory {peak_memory_mb():.0f} MB')
+
+            motion_trace.freeze()
 
             #
             # Create the report, write to fraction directory
             # { } []
             report = create_report(patient_ID, cine_dir, rtplan.plan_name, [prescribed_dose, number_of_fractions],
-                                   motion_trace)
+                                   motion_trace, registration_config, warm_start, telemetry)
             
             with open(report_filename, 'w') as f:
                 json.dump(report, f, indent=4)
                 print(f'Wrote report to {report_filename}')
+
+            # binary motion trace, loaded by the panel app instead of the report
+            motion_trace.patient_ID, motion_trace.plan_label = patient_ID, rtplan.plan_name
+            motion_trace_filename = os.path.splitext(report_filename)[0] + '.mtrace'
+            motion_trace.to_binary(motion_trace_filename)
+            print(f'Wrote motion trace to {motion_trace_filename}')
             
-            print(f'END Processing {cine_dir}: {time.time()-start_time:.2f} seconds')
+            registration_time = telemetry.summary()['WallTime']
+            print(f'END Processing {cine_dir}: {time.time()-start_time:.2f} seconds, registration {registration_time:.2f} seconds')
     
         except Exception as e:
             print(f'Error processing {cine_dir}: {e}')
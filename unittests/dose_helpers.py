@@ -0,0 +1,25 @@
+import numpy as np
+import SimpleITK as sitk
+
+
+def gaussian_dose(shape, widths, amplitude=1.0, spacing=(2.0, 2.0, 2.0), origin=None, direction=None):
+    """ Gaussian dose centred in a grid of shape (z, y, x), widths (z, y, x) in voxels. """
+    z, y, x = np.meshgrid(*[np.arange(n) for n in shape], indexing='ij')
+    (cz, cy, cx), (wz, wy, wx) = [n // 2 for n in shape], widths
+    dose = sitk.GetImageFromArray(amplitude * np.exp(-(((x - cx) / wx)**2 + ((y - cy) / wy)**2 + ((z - cz) / wz)**2)))
+    dose.SetSpacing(spacing)
+    if origin is not None:
+        dose.SetOrigin(origin)
+    if direction is not None:
+        dose.SetDirection(direction)
+    return dose
+
+
+def resample_accumulation(dose, displacements, weights):
+    """ The time step loop of dose_accumulation_sitk. """
+    accumulated_dose = sitk.Image(dose.GetSize(), sitk.sitkFloat64)
+    accumulated_dose.CopyInformation(dose)
+    for displacement, weight in zip(displacements, weights):
+        translation = sitk.TranslationTransform(3, displacement.tolist())
+        accumulated_dose += sitk.Resample(dose, accumulated_dose, translation, sitk.sitkLinear, 0.0, sitk.sitkFloat64) * weight
+    return accumulated_dose
@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from MRLCinema.doseaccumulation.alignment import DeliveryTimeline, displacement_mu_histogram, mu_weighted_percentiles
+
+
+class TestAlignment(unittest.TestCase):
+
+    def setUp(self):
+        # two beams of 10 s at 2 MU per 0.1 s sample, 5 s beam off in between
+        self.times = np.arange(0, 25, 0.1)
+        self.delta_mu = np.where((self.times < 10) | (self.times >= 15), 2.0, 0.0)
+        self.delivery = DeliveryTimeline(self.times, self.delta_mu)
+
+    def test_nearest_cumulative_mu(self):
+        times = np.sort(np.concatenate([self.times, [2.5, 2.5, 7.0]]))
+        delivery = DeliveryTimeline(times, np.ones(len(times)))
+        queries = np.random.default_rng(0).uniform(-1, 26, 500)
+        queries[0:3] = [2.5, 2.55, 24.9]
+        expected = [delivery.cumulative_mu[np.abs(times - query).argmin()] for query in queries]
+        np.testing.assert_array_equal(delivery.nearest_cumulative_mu(queries), expected)
+
+    def test_beam_on_segments(self):
+        segments = self.delivery.beam_on_segments()
+        np.testing.assert_allclose(segments, [[0.0, 9.9], [15.0, 24.9]])
+
+    def test_sample_mu(self):
+        # trace 10 s longer than the delivery, aligned at the end
+        trace_times = np.arange(0, 35, 0.5)
+        offset = self.delivery.end_aligned_offset(trace_times)
+        self.assertAlmostEqual(offset, 34.5 - 24.9)
+
+        sample_mu = self.delivery.sample_mu(trace_times, offset)
+        self.assertAlmostEqual(np.sum(sample_mu), self.delivery.total_mu)
+        self.assertEqual(np.sum(sample_mu[trace_times < offset - 0.5]), 0.0)
+
+        # all MU delivered at +1 mm during the first beam and -1 mm during the second
+        displacements = np.where(trace_times - offset < 12.5, 1.0, -1.0)
+        histogram, _ = displacement_mu_histogram(displacements, sample_mu, np.array([-2.0, 0.0, 2.0]))
+        np.testing.assert_allclose(histogram, [0.5, 0.5], atol=0.02)
+        self.assertAlmostEqual(float(mu_weighted_percentiles(displacements, sample_mu, 90)), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
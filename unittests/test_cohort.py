@@ -0,0 +1,63 @@
+import os
+import json
+import unittest
+import tempfile
+import numpy as np
+from MRLCinema.motion_trace import MotionTrace
+from MRLCinema.report import create_report
+from MRLCinema.cohort import load_cohort, displacement_statistics, SERIES
+
+
+def find_start_index(cine_times, treatment_time):
+    """ As the analysis notebooks. """
+    if np.max(cine_times) > treatment_time:
+        time_discard = np.max(cine_times) - treatment_time
+        return np.argmax(cine_times >= time_discard)
+    return 0
+
+
+def displacement_statistics_1d(cine_times, translations, treatment_time, q=0.975):
+    """ As the analysis notebooks. """
+    start_index = find_start_index(cine_times, treatment_time)
+    translations_reset = translations[start_index:]
+    translations_reset = translations_reset - np.mean(translations_reset[0:10])
+    return [np.percentile(translations_reset, 100*q), np.percentile(translations_reset, 100-100*q)]
+
+
+class TestCohort(unittest.TestCase):
+
+    def test_displacement_statistics(self):
+        rng = np.random.default_rng(0)
+        traces = []
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = []
+            for i, num_samples in enumerate([120, 300, 45]):
+                motion_trace = MotionTrace()
+                times = [np.sort(rng.uniform(0, num_samples, num_samples)) for _ in range(3)]
+                motion_trace.add(times, [rng.normal(size=[num_samples, 2]) + i for _ in range(3)])
+                filenames.append(os.path.join(directory, f'P{i}_Plan_cine_motion_analysis.json'))
+                with open(filenames[-1], 'w') as f:
+                    json.dump(create_report(f'P{i}', 'cines', 'Plan', [8, 5], motion_trace), f)
+                traces.append(motion_trace)
+
+            table = load_cohort(filenames, max_workers=2)
+
+        self.assertEqual(table.fraction_keys(), [('P0', 'Plan'), ('P1', 'Plan'), ('P2', 'Plan')])
+        self.assertEqual(len(table), 2 * (120 + 300 + 45) * 3)
+
+        treatment_times = np.array([100.0, np.nan, 60.0])
+        statistics = displacement_statistics(table, treatment_times)
+        self.assertEqual(statistics.shape, (3, len(SERIES), 2))
+
+        for i, motion_trace in enumerate(traces):
+            times = [motion_trace.times_transversal, motion_trace.times_coronal, motion_trace.times_sagittal]
+            displacements = [motion_trace.displacements_transversal, motion_trace.displacements_coronal, 
+                             motion_trace.displacements_sagittal]
+            treatment_time = treatment_times[i] if not np.isnan(treatment_times[i]) else np.inf
+            for j, (_, plane, column) in enumerate(SERIES):
+                expected = displacement_statistics_1d(times[plane], displacements[plane][:, column], treatment_time)
+                np.testing.assert_allclose(statistics[i, j], expected, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 import numpy as np
 import SimpleITK as sitk
-from MRLCinema.create_margin import create_margin_sitk, create_margin
+from MRLCinema.create_margin import create_margin_sitk, create_margin, MarginEngine, create_margins_parallel
 
 
 
@@ -67,4 +67,46 @@ class TestCreateMargin(unittest.TestCase):
         self.assertFalse( np.any(mask_margin[10,19,0:9]))
         self.assertFalse( np.any(mask_margin[10,10,12:]))
 
+    def test_engine_single_voxel(self):
+        """ Expand a single voxel (4, 3, 2) mm in x, y, z, same as create_margin along the axes. """
+        mask = np.zeros([21, 21, 21], dtype=int)
+        mask[10, 10, 10] = 1
+        margin = np.array([4, 3, 2])
+        spacing = np.array([0.5, 1, 2])
+
+        engine = MarginEngine(mask, spacing, max_margin=margin)
+        mask_margin = engine.create_margin(margin)
+
+        self.assertTrue(np.array_equal(mask_margin[:,10,10], create_margin(mask, spacing, margin)[:,10,10]))
+        self.assertTrue(np.array_equal(mask_margin[10,:,10], create_margin(mask, spacing, margin)[10,:,10]))
+        self.assertTrue(np.array_equal(mask_margin[10,10,:], create_margin(mask, spacing, margin)[10,10,:]))
+
+    def test_engine_sub_voxel(self):
+        """ A 1.5 mm margin is not rounded to 2 voxels. """
+        mask = np.zeros([21, 21, 21], dtype=int)
+        mask[10, 10, 10] = 1
+        spacing = np.array([1, 1, 1])
+
+        engine = MarginEngine(mask, spacing)
+        mask_margin = engine.create_margin([1.5, 1.5, 1.5])
+
+        self.assertEqual(mask_margin[11, 11, 10], 1)
+        self.assertEqual(mask_margin[12, 10, 10], 0)
+        self.assertEqual(np.sum(mask_margin), 19)
+
+        # same ratio, i.e. the distance map is reused
+        mask_margin = engine.create_margin([2, 2, 2])
+        self.assertEqual(len(engine._distance_maps), 1)
+        self.assertEqual(mask_margin[12, 10, 10], 1)
+
+    def test_margins_parallel(self):
+        mask = np.zeros([21, 21, 21], dtype=int)
+        mask[8:12, 9:11, 10] = 1
+        spacing = np.array([1, 1, 2])
+        margins = [np.array([3, 3, 3]), np.array([5, 5, 2])]
+
+        expanded = create_margins_parallel([mask, mask], [spacing, spacing], margins, max_workers=2)
 
+        engine = MarginEngine(mask, spacing)
+        for i, margin in enumerate(margins):
+            self.assertTrue(np.array_equal(expanded[1][i], engine.create_margin(margin)))
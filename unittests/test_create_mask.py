@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from MRLCinema.registration.create_mask import registration_mask_family, registration_mask_from_slice
+
+
+def create_mask_slice():
+    """ An elliptic mask in a transversal cine plane (one slice). """
+    y, x = np.mgrid[0:50, 0:60]
+    mask = ((((x - 28) / 10.0)**2 + ((y - 24) / 7.0)**2) <= 1).astype(np.uint8)
+    mask_slice = sitk.GetImageFromArray(mask[None])
+    mask_slice.SetSpacing([1.5, 1.2, 5.0])
+    mask_slice.SetOrigin([-40.0, -30.0, 10.0])
+    return mask_slice
+
+
+class TestCreateMask(unittest.TestCase):
+
+    def test_registration_mask_family(self):
+        mask_slice = create_mask_slice()
+        dilation_distances = [5, 10, 20]
+        num_pixels_per_sides = [0, 3]
+        family = registration_mask_family(mask_slice, dilation_distances, num_pixels_per_sides)
+
+        self.assertEqual(sorted(family.keys()), [(d, n) for d in dilation_distances for n in num_pixels_per_sides])
+        for (dilation_distance, num_pixels_per_side), mask in family.items():
+            self.assertEqual(mask.GetSize(), mask_slice.GetSize())
+            self.assertEqual(mask.GetOrigin(), mask_slice.GetOrigin())
+            self.assertEqual(mask.GetSpacing(), mask_slice.GetSpacing())
+            # the same mask as created one at a time
+            expected = registration_mask_from_slice(mask_slice, dilation_distance, num_pixels_per_side)
+            self.assertTrue(np.array_equal(sitk.GetArrayFromImage(mask), sitk.GetArrayFromImage(expected)))
+
+        # a larger dilation contains the smaller
+        for small, large in zip(dilation_distances[:-1], dilation_distances[1:]):
+            mask_small = sitk.GetArrayFromImage(family[(small, 0)])
+            mask_large = sitk.GetArrayFromImage(family[(large, 0)])
+            self.assertTrue(np.all(mask_large >= mask_small))
+            self.assertGreater(np.sum(mask_large), np.sum(mask_small))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 import numpy as np
-from MRLCinema.registration.fit_rigid_transform import fit_rigid_transform
+from MRLCinema.registration.fit_rigid_transform import fit_rigid_transform, fit_rigid_transforms, fit_rigid_transforms_robust
 
 class TestStringMethods(unittest.TestCase):
 
@@ -19,5 +19,35 @@ class TestStringMethods(unittest.TestCase):
 
     #def test_rotation(self):
 
+    def test_batched(self):
+        rng = np.random.default_rng(0)
+        A = rng.uniform(-10, 10, size=[6, 3])
+        angles = rng.uniform(-0.3, 0.3, size=5)
+        B = []
+        for angle, t in zip(angles, rng.uniform(-5, 5, size=[5, 3])):
+            R = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+            B.append(A @ R.T + t)
+        B = np.array(B)
+
+        transforms = fit_rigid_transforms(A, B)
+        self.assertEqual(transforms.shape, (5, 4, 4))
+        for b, transform in zip(B, transforms):
+            self.assertTrue(np.allclose(transform, fit_rigid_transform(A, b)))
+            self.assertTrue(np.allclose(A @ transform[0:3, 0:3].T + transform[0:3, 3], b))
+
+    def test_robust(self):
+        rng = np.random.default_rng(1)
+        A = rng.uniform(-10, 10, size=[10, 2])
+        B = np.array([A + [1, -2], A + [3, 0]])
+        B[:, 0] += 20
+
+        transforms = fit_rigid_transforms_robust(A, B)
+        self.assertTrue(np.allclose(transforms[:, 0:2, 2], [[1, -2], [3, 0]], atol=1e-6))
+
+        # zero weight for the outlier gives the same result
+        weights = np.ones(10)
+        weights[0] = 0
+        self.assertTrue(np.allclose(fit_rigid_transforms(A, B, weights), transforms, atol=1e-6))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
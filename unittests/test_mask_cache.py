@@ -0,0 +1,74 @@
+import unittest
+import tempfile
+import numpy as np
+import SimpleITK as sitk
+from types import SimpleNamespace
+from MRLCinema.registration.mask_cache import mask_cache_key, cached_masks
+
+
+def create_cines(origin_z=0.0):
+    """ One cine (object with an image) per slice direction. """
+    cines = []
+    for size in [(40, 30, 1), (40, 1, 20), (1, 30, 20)]:
+        image = sitk.Image(size, sitk.sitkFloat32)
+        image.SetSpacing([1.5, 1.5, 1.5])
+        image.SetOrigin([-30.0, -20.0, origin_z])
+        cines.append(SimpleNamespace(image=image))
+    return cines
+
+
+def create_masks():
+    masks = []
+    for i in range(3):
+        mask = np.zeros([1, 30, 40], dtype=np.uint8)
+        mask[0, 10:20, 5 + i:25] = 1
+        mask = sitk.GetImageFromArray(mask)
+        mask.SetSpacing([1.5, 1.5, 1.5])
+        mask.SetOrigin([-30.0, -20.0, 2.0 * i])
+        masks.append(mask)
+    return masks, [[5, 35, 3, 27, 0, 1]] * 3
+
+
+class TestMaskCache(unittest.TestCase):
+
+    def test_key(self):
+        parameters = {'dilation_distance': 20, 'num_pixels_per_side': 3}
+        key = mask_cache_key('1.2.3', 'Z_MM', create_cines(), parameters)
+
+        self.assertEqual(key, mask_cache_key('1.2.3', 'Z_MM', create_cines(), dict(parameters)))
+        self.assertNotEqual(key, mask_cache_key('1.2.4', 'Z_MM', create_cines(), parameters))
+        self.assertNotEqual(key, mask_cache_key('1.2.3', 'CTV', create_cines(), parameters))
+        self.assertNotEqual(key, mask_cache_key('1.2.3', 'Z_MM', create_cines(origin_z=1.0), parameters))
+        self.assertNotEqual(key, mask_cache_key('1.2.3', 'Z_MM', create_cines(), 
+                                                {'dilation_distance': 15, 'num_pixels_per_side': 3}))
+
+    def test_cached_masks(self):
+        calls = []
+        def create():
+            calls.append(1)
+            return create_masks()
+
+        parameters = {'dilation_distance': 20}
+        key = mask_cache_key('1.2.3', 'Z_MM', create_cines(), parameters)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            masks, crop_boxes = cached_masks(cache_dir, key, create)
+            cached, cached_crop_boxes = cached_masks(cache_dir, key, create)
+            self.assertEqual(len(calls), 1)
+
+            # another key (e.g. a changed structure set) creates the masks again
+            cached_masks(cache_dir, mask_cache_key('1.2.4', 'Z_MM', create_cines(), parameters), create)
+            self.assertEqual(len(calls), 2)
+
+        self.assertEqual(cached_crop_boxes, crop_boxes)
+        for mask, mask_cached in zip(masks, cached):
+            self.assertTrue(np.array_equal(sitk.GetArrayFromImage(mask), sitk.GetArrayFromImage(mask_cached)))
+            self.assertEqual(mask.GetOrigin(), mask_cached.GetOrigin())
+            self.assertEqual(mask.GetSpacing(), mask_cached.GetSpacing())
+
+        # without a cache directory the masks are always created
+        cached_masks(None, key, create)
+        self.assertEqual(len(calls), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
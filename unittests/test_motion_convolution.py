@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from MRLCinema.doseaccumulation.motion_convolution import dose_accumulation_convolution
+from MRLCinema.unittests.dose_helpers import gaussian_dose, resample_accumulation
+
+
+def create_dose(direction=None):
+    return gaussian_dose([30, 32, 34], [4.0, 4.0, 5.0], 2.0, [2.0, 2.5, 3.0], [-10.0, 5.0, 3.0], direction)
+
+
+class TestMotionConvolution(unittest.TestCase):
+
+    def test_against_resampling(self):
+        rng = np.random.default_rng(0)
+        displacements = rng.normal(size=[100, 3]) * [2.0, 3.0, 4.0]
+        weights = rng.uniform(size=100)
+        weights = weights / np.sum(weights)
+
+        for direction in [None, [0, 1, 0, -1, 0, 0, 0, 0, 1]]:
+            dose = create_dose(direction)
+            expected = sitk.GetArrayFromImage(resample_accumulation(dose, displacements, weights))
+            accumulated_dose = dose_accumulation_convolution(dose, displacements, weights)
+            np.testing.assert_allclose(sitk.GetArrayFromImage(accumulated_dose), expected, atol=1e-5)
+            self.assertEqual(accumulated_dose.GetOrigin(), dose.GetOrigin())
+
+    def test_static(self):
+        dose = create_dose()
+        accumulated_dose = dose_accumulation_convolution(dose, np.zeros([3, 3]), [0.2, 0.3, 0.5])
+        np.testing.assert_allclose(sitk.GetArrayFromImage(accumulated_dose), sitk.GetArrayFromImage(dose), atol=1e-12)
+
+    def test_dose_at_edge(self):
+        dose = sitk.GetImageFromArray(np.ones([6, 7, 8]))
+        dose.SetSpacing([2.0, 2.0, 2.0])
+        displacements = np.array([[0.6, 0.0, 0.0], [0.0, -3.0, 0.0]])
+        weights = np.array([0.4, 0.6])
+
+        accumulated = sitk.GetArrayFromImage(dose_accumulation_convolution(dose, displacements, weights))
+        resampled = sitk.GetArrayFromImage(resample_accumulation(dose, displacements, weights))
+
+        # same inside, zero outside the grid for the convolution
+        np.testing.assert_allclose(accumulated[:, 2:-2, 1:-1], resampled[:, 2:-2, 1:-1], atol=1e-12)
+        np.testing.assert_allclose(accumulated[:, 3, -1], 0.6 + 0.4 * 0.7, atol=1e-12)
+        np.testing.assert_allclose(accumulated[:, 1, 3], 0.4 + 0.6 * 0.5, atol=1e-12)
+        np.testing.assert_allclose(resampled[:, 3, -1], 1.0, atol=1e-12)
+        np.testing.assert_allclose(resampled[:, 1, 3], 1.0, atol=1e-12)
+
+    def test_no_displacements(self):
+        dose = create_dose()
+        accumulated_dose = dose_accumulation_convolution(dose, np.zeros([0, 3]), [])
+        self.assertEqual(accumulated_dose.GetSize(), dose.GetSize())
+        self.assertEqual(np.max(np.abs(sitk.GetArrayFromImage(accumulated_dose))), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
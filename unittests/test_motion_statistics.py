@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+from MRLCinema.motion_statistics import TDigest, motion_statistics, motion_statistics_sketch
+
+
+class TestTDigest(unittest.TestCase):
+
+    def test_quantiles(self):
+        rng = np.random.default_rng(0)
+        values = 2.0 * rng.normal(size=100000) + 5.0 * np.sin(np.arange(100000) / 30)
+
+        digest = TDigest()
+        for i in range(0, len(values), 250):
+            digest.update(values[i:i+250])
+
+        self.assertEqual(digest.count, len(values))
+        np.testing.assert_allclose(digest.percentile([2.5, 50, 97.5]), np.percentile(values, [2.5, 50, 97.5]), atol=0.05)
+        self.assertAlmostEqual(float(digest.abs_quantile(0.95)), np.percentile(np.abs(values), 95), delta=0.05)
+        self.assertEqual(digest.quantile(0.0), values.min())
+        self.assertEqual(digest.quantile(1.0), values.max())
+
+    def test_abs_quantile(self):
+        digest = TDigest()
+        digest.update(np.full(1000, 2.0))
+        np.testing.assert_allclose(digest.abs_quantile([0.05, 0.5, 0.95]), 2.0)
+
+        digest = TDigest()
+        digest.update(np.tile([-1.0, 1.0], 500))
+        np.testing.assert_allclose(digest.abs_quantile([0.05, 0.5, 0.95]), 1.0)
+
+        digest = TDigest()
+        digest.update(np.linspace(-3.0, -1.0, 1001))
+        self.assertAlmostEqual(float(digest.abs_quantile(0.0)), 1.0)
+        self.assertAlmostEqual(float(digest.abs_quantile(0.5)), 2.0, delta=0.01)
+
+    def test_merge(self):
+        rng = np.random.default_rng(1)
+        values = [rng.normal(size=20000) + shift for shift in [-1.0, 0.0, 2.0]]
+        digests = []
+        for v in values:
+            digest = TDigest()
+            digest.update(v)
+            digests.append(TDigest.from_dict(digest.to_dict()))
+
+        merged = TDigest.merged(digests)
+        all_values = np.concatenate(values)
+        self.assertEqual(merged.count, len(all_values))
+        np.testing.assert_allclose(merged.percentile([5, 95]), np.percentile(all_values, [5, 95]), atol=0.05)
+
+    def test_motion_statistics(self):
+        rng = np.random.default_rng(2)
+        displacements = [rng.normal(size=[5000, 2]) * scale for scale in [1.0, 2.0, 3.0]]
+        sketches = []
+        for d in displacements:
+            plane_sketches = [TDigest(), TDigest()]
+            for column, sketch in enumerate(plane_sketches):
+                sketch.update(d[:, column])
+            sketches.append(plane_sketches)
+
+        np.testing.assert_allclose(motion_statistics_sketch(*sketches), motion_statistics(*displacements), atol=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
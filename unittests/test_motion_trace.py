@@ -0,0 +1,132 @@
+import os
+import json
+import unittest
+import tempfile
+import numpy as np
+from MRLCinema.motion_trace import MotionTrace, _GrowableArray
+from MRLCinema.report import create_report
+
+
+class TestMotionTrace(unittest.TestCase):
+
+    def test_growable_array(self):
+        buffer = _GrowableArray((2,), capacity=2)
+        for i in range(5):
+            buffer.append([i, -i])
+        buffer.extend(np.ones([10, 2]))
+        self.assertEqual(len(buffer), 15)
+        self.assertGreaterEqual(buffer.capacity, 15)
+        np.testing.assert_array_equal(buffer.array[4], [4, -4])
+
+        array = buffer.freeze()
+        self.assertEqual(array.shape, (15, 2))
+        self.assertFalse(array.flags.writeable)
+        with self.assertRaises(ValueError):
+            buffer.append([0, 0])
+
+    def test_add_batches(self):
+        rng = np.random.default_rng(0)
+        motion_trace = MotionTrace()
+        times, displacements = [], []
+        for batch in range(3):
+            batch_times = [np.arange(20) + 20 * batch + plane for plane in range(3)]
+            batch_displacements = [rng.normal(size=[20 + (motion_trace.n_skip if batch > 0 else 0), 2]) for _ in range(3)]
+            motion_trace.add(batch_times, batch_displacements)
+            times.append(batch_times[1])
+            displacements.append(batch_displacements[1][motion_trace.n_skip if batch > 0 else 0:])
+
+        np.testing.assert_array_equal(motion_trace.times_coronal, np.concatenate(times))
+        np.testing.assert_array_equal(motion_trace.displacements_coronal, np.concatenate(displacements))
+
+        motion_trace.append_frame(0, 60.0, [1.0, 2.0])
+        self.assertEqual(motion_trace.end_times(), 61)
+        np.testing.assert_array_equal(motion_trace.displacements_transversal[-1], [1.0, 2.0])
+
+        with self.assertRaises(ValueError):
+            motion_trace.extend(2, [1.0, 2.0], np.zeros([3, 2]))
+
+        motion_trace.freeze()
+        self.assertEqual(len(motion_trace.times_transversal), 61)
+        self.assertEqual(motion_trace.start_times(), 0)
+
+    def test_binary(self):
+        rng = np.random.default_rng(0)
+        motion_trace = MotionTrace()
+        motion_trace.add([np.arange(n) * 0.2 for n in [101, 57, 0]], [rng.normal(size=[n, 2]) for n in [101, 57, 0]])
+        motion_trace.freeze()
+
+        with tempfile.TemporaryDirectory() as directory:
+            report_filename = os.path.join(directory, 'report.json')
+            with open(report_filename, 'w') as f:
+                json.dump(create_report('P1', 'cines', 'Plan1', [8, 5], motion_trace), f)
+            trace_json = MotionTrace.from_file(report_filename)
+
+            binary_filename = os.path.join(directory, 'report.mtrace')
+            trace_json.to_binary(binary_filename)
+            for memory_map in [True, False]:
+                trace = MotionTrace.from_binary(binary_filename, memory_map)
+                self.assertEqual(trace.patient_ID, 'P1')
+                self.assertEqual(trace.plan_label, 'Plan1')
+                np.testing.assert_array_equal(trace.times_transversal, motion_trace.times_transversal)
+                np.testing.assert_array_equal(trace.displacements_coronal, motion_trace.displacements_coronal)
+                self.assertEqual(trace.displacements_sagittal.shape, (0, 2))
+                self.assertAlmostEqual(trace.end_times(), 20.0)
+                del trace
+
+            with self.assertRaises(ValueError):
+                MotionTrace.from_binary(report_filename)
+
+    def test_resample_3d(self):
+        rng = np.random.default_rng(1)
+        times = [np.sort(rng.uniform(0, 100, n)) for n in [300, 250, 280]]
+        displacements = [rng.normal(size=[len(t), 2]) for t in times]
+        motion_trace = MotionTrace()
+        motion_trace.add(times, displacements)
+
+        query = np.concatenate([rng.uniform(-5, 105, 500), times[0][0:20], times[2][0:20]])
+
+        # previous: the last sample before the time in each plane, the mean of the two planes per axis
+        def previous(plane, column):
+            idx = np.clip(np.searchsorted(times[plane], query) - 1, 0, len(times[plane]) - 1)
+            return displacements[plane][idx, column]
+        expected = np.stack([0.5 * (previous(0, 0) + previous(1, 0)), 
+                             0.5 * (previous(0, 1) + previous(2, 0)),
+                             0.5 * (previous(2, 1) + previous(1, 1))], axis=1)
+        np.testing.assert_array_equal(motion_trace.resample_3d(query), expected)
+
+        def linear(plane, column):
+            return np.interp(query, times[plane], displacements[plane][:, column])
+        expected = np.stack([0.5 * (linear(0, 0) + linear(1, 0)), 
+                             0.5 * (linear(0, 1) + linear(2, 0)),
+                             0.5 * (linear(2, 1) + linear(1, 1))], axis=1)
+        np.testing.assert_allclose(motion_trace.resample_3d(query, method='linear'), expected, atol=1e-12)
+
+        # the cached timeline is updated when the trace is extended
+        motion_trace.append_frame(0, 200.0, [10.0, 10.0])
+        self.assertAlmostEqual(motion_trace.resample_3d(300.0, fusion='max_abs')[0, 0], 10.0)
+
+        with self.assertRaises(ValueError):
+            motion_trace.resample_3d(query, method='cubic')
+
+    def test_sketches(self):
+        rng = np.random.default_rng(2)
+        displacements = rng.normal(size=[3000, 2]) * [1.0, 3.0]
+        motion_trace = MotionTrace()
+        for i in range(0, 2000):
+            motion_trace.append_frame(1, 0.2 * i, displacements[i])
+        motion_trace.extend(1, 0.2 * np.arange(2000, 3000), displacements[2000:])
+
+        ranges = motion_trace.percentile_ranges(0.975)
+        self.assertEqual(list(ranges.keys()), ['Coronal'])
+        np.testing.assert_allclose(ranges['Coronal'][1], np.percentile(displacements[:, 1], [97.5, 2.5]), atol=0.1)
+
+        loaded = MotionTrace()
+        loaded.displacements_coronal = displacements
+        self.assertEqual(loaded._sketches[1], None)
+        self.assertEqual(loaded.sketches[1][0].count, 3000)
+        loaded.append_frame(1, 600.0, [0.0, 0.0])
+        self.assertEqual(loaded.sketches[1][0].count, 3001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import json
+import unittest
+import tempfile
+import numpy as np
+from MRLCinema.motion_trace import MotionTrace
+from MRLCinema.motion_trace_catalog import update_catalog, read_catalog, merged_sketches
+from MRLCinema.report import create_report
+
+
+def write_report(directory, patient_ID, num_samples):
+    rng = np.random.default_rng(num_samples)
+    motion_trace = MotionTrace()
+    motion_trace.add([np.arange(num_samples) * 0.25] * 3, [rng.normal(size=[num_samples, 2]) for _ in range(3)])
+    filename = os.path.join(directory, f'{patient_ID}_Plan1_cine_motion_analysis.json')
+    with open(filename, 'w') as f:
+        json.dump(create_report(patient_ID, 'cines', 'Plan1', [8, 5], motion_trace), f)
+    return filename
+
+
+class TestMotionTraceCatalog(unittest.TestCase):
+
+    def test_update_catalog(self):
+        with tempfile.TemporaryDirectory() as directory:
+            catalog_filename = os.path.join(directory, 'catalog.json')
+            write_report(directory, 'P1', 41)
+            filename = write_report(directory, 'P2', 81)
+
+            catalog = update_catalog(catalog_filename, directory)
+            self.assertEqual(len(catalog['Entries']), 2)
+            entry = catalog['Entries'][os.path.basename(filename)]
+            self.assertEqual(entry['PatientID'], 'P2')
+            self.assertAlmostEqual(entry['Duration'], 20.0)
+            self.assertEqual(entry['NumSamples']['Coronal'], 81)
+            self.assertEqual(len(entry['Statistics']['Percentile95']), 3)
+            self.assertEqual(read_catalog(catalog_filename), catalog)
+
+            sketches = merged_sketches(list(catalog['Entries'].values()))
+            self.assertEqual(sketches['Sagittal'][1].count, 41 + 81)
+
+            # only new and modified reports are loaded, removed reports are dropped
+            os.remove(filename)
+            write_report(directory, 'P3', 21)
+            catalog = update_catalog(catalog_filename, directory)
+            self.assertEqual(sorted(entry['PatientID'] for entry in catalog['Entries'].values()), ['P1', 'P3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
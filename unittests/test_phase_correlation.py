@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from scipy.ndimage import shift, gaussian_filter
+from MRLCinema.registration.phase_correlation import phase_correlation_registration
+
+
+def create_sequence(shifts, spacing):
+    """ Sequence of a smooth random image shifted by shifts [frame, (x, y)] in pixels. """
+    rng = np.random.default_rng(0)
+    image = gaussian_filter(rng.normal(size=[64, 56]), 3)
+    sequence = []
+    for dx, dy in shifts:
+        frame = sitk.GetImageFromArray(shift(image, (dy, dx), order=3, mode='nearest').astype(np.float32))
+        frame.SetSpacing(spacing)
+        sequence.append(frame)
+    return sequence
+
+
+class TestPhaseCorrelation(unittest.TestCase):
+
+    def test_integer_shifts(self):
+        shifts = np.array([[0, 0], [3, 0], [0, -2], [-4, 5]])
+        sequence = create_sequence(shifts, (1.0, 1.0))
+
+        displacements = phase_correlation_registration(sequence, num_template_frames=1)
+        self.assertTrue(np.allclose(displacements, shifts, atol=0.25))
+
+    def test_subpixel_shifts_mm(self):
+        rng = np.random.default_rng(1)
+        shifts = rng.uniform(-3, 3, size=[50, 2])
+        shifts[0] = 0
+        spacing = np.array([1.5, 1.2])
+        sequence = create_sequence(shifts, spacing.tolist())
+
+        mask = np.zeros([64, 56], dtype=np.uint8)
+        mask[12:52, 10:46] = 1
+        mask = sitk.GetImageFromArray(mask)
+        mask.SetSpacing(spacing.tolist())
+
+        for template in ['first', 'running']:
+            displacements = phase_correlation_registration(sequence, mask, template=template, num_template_frames=1)
+            error = displacements - shifts * spacing
+            self.assertLess(np.sqrt(np.mean(error**2)), 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
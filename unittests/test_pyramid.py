@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from scipy.ndimage import shift, gaussian_filter
+from MRLCinema.registration.pyramid import bin_stack, PreprocessedStack, coarse_to_fine_registration
+
+
+def create_sequence(shifts, spacing, shape=(128, 112)):
+    """ Sequence of a smooth noisy image shifted by shifts [frame, (x, y)] in pixels, and a central mask. """
+    rng = np.random.default_rng(0)
+    image = gaussian_filter(rng.normal(size=shape), 3)
+    sequence = []
+    for dx, dy in shifts:
+        frame = shift(image, (dy, dx), order=3, mode='nearest') + rng.normal(scale=0.002, size=shape)
+        frame = sitk.GetImageFromArray(frame.astype(np.float32))
+        frame.SetSpacing(spacing)
+        sequence.append(frame)
+
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[shape[0] // 4:3 * shape[0] // 4, shape[1] // 4:3 * shape[1] // 4] = 1
+    mask = sitk.GetImageFromArray(mask)
+    mask.SetSpacing(spacing)
+    return sequence, mask
+
+
+class TestPyramid(unittest.TestCase):
+
+    def test_bin_stack(self):
+        stack = np.arange(2 * 4 * 6, dtype=np.float32).reshape(2, 4, 6)
+        binned = bin_stack(stack, 2)
+        self.assertEqual(binned.shape, (2, 2, 3))
+        self.assertAlmostEqual(binned[1, 1, 2], np.mean(stack[1, 2:4, 4:6]))
+
+        # incomplete blocks are dropped
+        self.assertEqual(bin_stack(stack, 4).shape, (2, 1, 1))
+
+    def test_cached_levels(self):
+        sequence, mask = create_sequence(np.zeros([3, 2]), [1.0, 1.0])
+        stack = PreprocessedStack(sequence, mask)
+        self.assertIs(stack.level(2), stack.level(2))
+        self.assertEqual(stack.mask_level(4).shape, (32, 28))
+
+    def test_synthetic_accuracy(self):
+        """ Sub millimetre accuracy, the timing against phase correlation is in pyramid_benchmark.py. """
+        rng = np.random.default_rng(1)
+        shifts = rng.uniform(-8, 8, size=[300, 2])
+        shifts[0:10] = 0
+        spacing = np.array([1.5, 1.2])
+        sequence, mask = create_sequence(shifts, spacing.tolist())
+
+        displacements = coarse_to_fine_registration(PreprocessedStack(sequence, mask))
+
+        error = displacements - shifts * spacing
+        self.assertLess(np.max(np.abs(error)), 0.5)
+        self.assertLess(np.sqrt(np.mean(error**2)), 0.1)
+
+if __name__ == '__main__':
+    unittest.main()
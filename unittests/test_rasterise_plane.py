@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from MRLCinema.registration.rasterise_plane import rasterise_contours_to_plane, scanline_inside
+
+
+def square_contours(half_width, z_positions):
+    """ Axial square contours centered at x = y = 0. """
+    contours = []
+    for z in z_positions:
+        contours.append(np.array([[-half_width, -half_width, z],
+                                  [ half_width, -half_width, z],
+                                  [ half_width,  half_width, z],
+                                  [-half_width,  half_width, z]]))
+    return contours
+
+def create_plane(origin, size, spacing=(1.0, 1.0, 1.0)):
+    plane = sitk.Image(list(size), sitk.sitkFloat32)
+    plane.SetOrigin(origin)
+    plane.SetSpacing(spacing)
+    return plane
+
+
+class TestRasterisePlane(unittest.TestCase):
+    """ Test the rasterisation of contours in cine planes.
+    Remmber simpleitk reverse pixel ordering.
+    """
+
+    def test_scanline_hole(self):
+        """ A polygon inside another polygon is a hole (even-odd rule). """
+        outer = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=float)
+        inner = np.array([[3, 3], [7, 3], [7, 7], [3, 7]], dtype=float)
+        inside = scanline_inside([outer, inner], 5.0, np.arange(0.5, 10, 1.0))
+        self.assertTrue(np.array_equal(inside, [1, 1, 1, 0, 0, 0, 0, 1, 1, 1]))
+
+    def test_transversal(self):
+        contours = square_contours(5.5, [-2.0, 0.0, 2.0])
+        plane = create_plane((-10, -10, 0.4), (21, 21, 1))
+
+        mask = sitk.GetArrayFromImage(rasterise_contours_to_plane(contours, plane))
+        self.assertEqual(mask.shape, (1, 21, 21))
+        self.assertEqual(np.sum(mask), 11 * 11)
+        self.assertEqual(mask[0, 10, 10], 1)
+        self.assertEqual(mask[0, 10, 4], 0)
+
+    def test_transversal_outside(self):
+        """ No contours within half a slice thickness of the plane. """
+        contours = square_contours(5.5, [-2.0, 0.0, 2.0])
+        plane = create_plane((-10, -10, 5.0), (21, 21, 1))
+
+        mask = sitk.GetArrayFromImage(rasterise_contours_to_plane(contours, plane))
+        self.assertEqual(np.sum(mask), 0)
+
+    def test_sagittal(self):
+        contours = square_contours(5.5, [-2.0, 0.0, 2.0])
+        plane = create_plane((0.0, -10, -10), (1, 21, 21))
+
+        mask = sitk.GetArrayFromImage(rasterise_contours_to_plane(contours, plane))
+        self.assertEqual(mask.shape, (21, 21, 1))
+        # z from -3 to 3 (three slices of 2 mm), y from -5 to 5
+        self.assertEqual(np.sum(mask), 7 * 11)
+        self.assertTrue(np.all(mask[7:14, 5:16, 0] == 1))
+
+    def test_coronal(self):
+        contours = square_contours(5.5, [-2.0, 0.0, 2.0])
+        plane = create_plane((-10, 20.0, -10), (21, 1, 21))
+
+        mask = sitk.GetArrayFromImage(rasterise_contours_to_plane(contours, plane))
+        self.assertEqual(mask.shape, (21, 1, 21))
+        self.assertEqual(np.sum(mask), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
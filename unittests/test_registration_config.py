@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from MRLCinema.registration.config import registration_profile
+from MRLCinema.registration.single import rigid_registration
+
+
+def create_images():
+    y, x = np.mgrid[0:64, 0:64]
+    fixed = sitk.GetImageFromArray(100 * np.exp(-(((x - 30) / 6.0)**2 + ((y - 34) / 8.0)**2)).astype(np.float32))
+    moving = sitk.GetImageFromArray(100 * np.exp(-(((x - 32) / 6.0)**2 + ((y - 32.5) / 8.0)**2)).astype(np.float32))
+    mask = sitk.GetImageFromArray(((np.abs(x - 31) < 20) & (np.abs(y - 33) < 20)).astype(np.uint8))
+    return fixed, moving, mask
+
+
+class TestRegistrationConfig(unittest.TestCase):
+
+    def test_default_parameter_map(self):
+        parameter_map = {'NumberOfResolutions': ['4'], 'MaximumNumberOfIterations': ['256'],
+                         'NumberOfSpatialSamples': ['2048'], 'ImageSampler': ['RandomCoordinate']}
+        default_map = registration_profile('default').apply_to_parameter_map(dict(parameter_map))
+        self.assertEqual(default_map['NumberOfResolutions'], ['1'])
+        self.assertEqual({key: value for key, value in default_map.items() if key != 'NumberOfResolutions'},
+                         {key: value for key, value in parameter_map.items() if key != 'NumberOfResolutions'})
+        self.assertEqual(registration_profile('fast').apply_to_parameter_map(dict(parameter_map))['MaximumNumberOfIterations'], ['100'])
+
+    def test_default_rigid_registration(self):
+        fixed, moving, mask = create_images()
+        _, transform_default = rigid_registration(fixed, moving, mask)
+        _, transform_repeated = rigid_registration(fixed, moving, mask)
+        self.assertEqual(transform_default.GetParameters(), transform_repeated.GetParameters())
+        np.testing.assert_allclose(transform_default.GetParameters(), [2.0, -1.5], atol=0.05)
+        self.assertEqual(registration_profile('default').simpleitk_iterations(), 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
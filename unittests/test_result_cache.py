@@ -0,0 +1,46 @@
+import unittest
+import tempfile
+import numpy as np
+import SimpleITK as sitk
+from MRLCinema.registration.result_cache import registration_cache_key, cached_registration
+
+
+def create_images(num_images, value=0.0):
+    rng = np.random.default_rng(0)
+    return [sitk.GetImageFromArray(rng.normal(size=[16, 12]).astype(np.float32) + value) for _ in range(num_images)]
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_key(self):
+        images = create_images(5)
+        mask = sitk.GetImageFromArray(np.ones([16, 12], dtype=np.uint8))
+        parameters = {'type': 'group_registration', 'config': {'maximum_number_of_iterations': 250}}
+        key = registration_cache_key(images, mask, parameters)
+
+        self.assertEqual(key, registration_cache_key(create_images(5), mask, parameters))
+        self.assertNotEqual(key, registration_cache_key(create_images(5, 1.0), mask, parameters))
+        self.assertNotEqual(key, registration_cache_key(images[0:4], mask, parameters))
+        self.assertNotEqual(key, registration_cache_key(images, mask, {'type': 'group_registration', 
+                                                                       'config': {'maximum_number_of_iterations': 500}}))
+        mask_changed = sitk.GetImageFromArray(np.ones([16, 12], dtype=np.uint8))
+        mask_changed.SetSpacing([0.5, 0.5])
+        self.assertNotEqual(key, registration_cache_key(images, mask_changed, parameters))
+
+    def test_cached_registration(self):
+        calls = []
+        def register():
+            calls.append(1)
+            return ['1.5', '-2.0', '0.25', '3']
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = cached_registration(cache_dir, 'abc', register)
+            second = cached_registration(cache_dir, 'abc', register)
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(np.array_equal(first, [1.5, -2.0, 0.25, 3.0]))
+        self.assertTrue(np.array_equal(first, second))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from types import SimpleNamespace
+from scipy.ndimage import shift, gaussian_filter
+from MRLCinema.registration.sequence import chunk_ranges, cine_sequence_rigid_registration, transform_points
+from MRLCinema.registration.sequence import extract_rigid_displacements
+from MRLCinema.registration.telemetry import RegistrationTelemetry
+
+
+def create_cines(shifts):
+    """ Cines (objects with an image) of a smooth random image shifted by shifts [frame, (x, y)] in pixels. """
+    rng = np.random.default_rng(0)
+    image = gaussian_filter(rng.normal(size=[64, 64]), 3) * 100
+    return [SimpleNamespace(image=sitk.GetImageFromArray(shift(image, (dy, dx), order=3, mode='nearest').astype(np.float32)))
+            for dx, dy in shifts]
+
+
+class TestSequence(unittest.TestCase):
+
+    def test_chunk_ranges(self):
+        self.assertEqual(chunk_ranges(10, 3), [(0, 3), (3, 7), (7, 10)])
+        self.assertEqual(chunk_ranges(2, 4), [(0, 1), (1, 2)])
+
+    def test_chunked_rigid_registration(self):
+        shifts = np.array([[0, 0], [1, 0], [2, -1], [3, -1], [2, 0], [1, 1]], dtype=float)
+        cines = create_cines(shifts)
+        mask = np.zeros([64, 64], dtype=np.uint8)
+        mask[16:48, 16:48] = 1
+        mask = sitk.GetImageFromArray(mask)
+
+        sequential = cine_sequence_rigid_registration(cines, mask, resample=False)
+        chunked = cine_sequence_rigid_registration(cines, mask, resample=False, num_chunks=2, max_workers=2)
+        with self.assertRaises(ValueError):
+            cine_sequence_rigid_registration(cines, mask, num_chunks=2, max_workers=2)
+
+        self.assertEqual(len(chunked), len(cines) - 1)
+        for (image_s, transform_s), (image_c, transform_c), true_shift in zip(sequential, chunked, shifts[1:]):
+            self.assertIsNone(image_s)
+            self.assertIsNone(image_c)
+            self.assertIsInstance(transform_s, sitk.TranslationTransform)
+            # the transform maps fixed to moving points, i.e. the shift of the moving image
+            self.assertTrue(np.allclose(transform_c.GetParameters(), true_shift, atol=0.2))
+            self.assertTrue(np.allclose(transform_c.GetParameters(), transform_s.GetParameters(), atol=0.2))
+
+        telemetry = RegistrationTelemetry()
+        with self.assertRaises(ValueError):
+            cine_sequence_rigid_registration(cines, mask, resample=False, telemetry=telemetry)
+        cine_sequence_rigid_registration(cines, mask, resample=False, telemetry=telemetry, plane=2)
+        self.assertEqual(len(telemetry.records), len(cines) - 1)
+        self.assertEqual(telemetry.records[0]['Plane'], 'Sagittal')
+
+    def test_transform_points(self):
+        rng = np.random.default_rng(1)
+        initial = sitk.BSplineTransformInitializer(sitk.Image(64, 64, sitk.sitkFloat32), [4, 4])
+        transforms = []
+        for _ in range(4):
+            transform = sitk.BSplineTransform(initial)
+            transform.SetParameters(rng.normal(size=initial.GetNumberOfParameters()).tolist())
+            transforms.append(transform)
+        points = rng.uniform(5, 60, size=[7, 2])
+
+        expected = np.array([[transform.TransformPoint(point) for point in points] for transform in transforms])
+        self.assertTrue(np.allclose(transform_points(transforms, points), expected))
+
+        # not linear in the parameters
+        transforms = [sitk.Euler2DTransform((30, 30), 0.1 * i, (i, 0)) for i in range(3)]
+        expected = np.array([[transform.TransformPoint(point) for point in points] for transform in transforms])
+        self.assertTrue(np.allclose(transform_points(transforms, points), expected))
+
+    def test_no_transforms(self):
+        points = np.array([[10.0, 20.0], [30.0, 25.0], [20.0, 40.0]])
+        self.assertEqual(transform_points([], points).shape, (0, 3, 2))
+        self.assertEqual(extract_rigid_displacements([], points).shape, (0, 3, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+import SimpleITK as sitk
+from MRLCinema.doseaccumulation.shift_cache import ShiftedDoseCache
+from MRLCinema.unittests.dose_helpers import gaussian_dose, resample_accumulation
+
+
+def create_dose(spacing=(2.0, 2.0, 2.0), direction=None):
+    return gaussian_dose([20, 22, 24], [3.0, 3.0, 4.0], spacing=spacing, direction=direction)
+
+
+class TestShiftedDoseCache(unittest.TestCase):
+
+    def test_accumulate(self):
+        dose = create_dose()
+        cache = ShiftedDoseCache(dose, subdivisions=4)
+
+        # positions on the quantisation grid (0.5 mm), visited repeatedly
+        rng = np.random.default_rng(0)
+        displacements = 0.5 * rng.integers(-4, 5, size=[200, 3])
+        weights = np.full(200, 1 / 200)
+
+        expected = resample_accumulation(dose, displacements, weights)
+        accumulated_dose = cache.accumulate(displacements, weights)
+        np.testing.assert_allclose(sitk.GetArrayFromImage(accumulated_dose), sitk.GetArrayFromImage(expected), atol=1e-12)
+
+        num_positions = len(np.unique(displacements, axis=0))
+        self.assertEqual(cache.misses, num_positions)
+        self.assertEqual(cache.hits, 0)
+
+        cache.accumulate(displacements + 0.1, weights)
+        self.assertEqual(cache.hits, num_positions)
+        self.assertAlmostEqual(cache.hit_rate, 0.5)
+
+    def test_direction(self):
+        dose = create_dose([2.0, 2.5, 3.0], [0, 1, 0, -1, 0, 0, 0, 0, 1])
+        cache = ShiftedDoseCache(dose, subdivisions=4)
+
+        # positions on the quantisation grid of the rotated, anisotropic voxels
+        rng = np.random.default_rng(1)
+        keys = rng.integers(-6, 7, size=[50, 3])
+        displacements = np.array([cache.translation(key) for key in keys])
+        np.testing.assert_array_equal(cache.quantise(displacements), keys)
+
+        weights = np.full(50, 1 / 50)
+        expected = resample_accumulation(dose, displacements, weights)
+        accumulated_dose = cache.accumulate(displacements, weights)
+        np.testing.assert_allclose(sitk.GetArrayFromImage(accumulated_dose), sitk.GetArrayFromImage(expected), atol=1e-12)
+
+    def test_memory_bound(self):
+        dose = create_dose()
+        dose_megabytes = 24 * 22 * 20 * 8 / 1e6
+        cache = ShiftedDoseCache(dose, max_megabytes=2.5 * dose_megabytes)
+
+        for shift in range(4):
+            cache.shifted_dose((shift, 0, 0))
+        cache.shifted_dose((2, 0, 0))
+        cache.shifted_dose((0, 0, 0))
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics['NumEntries'], 2)
+        self.assertEqual(statistics['Evictions'], 3)
+        self.assertEqual(statistics['Hits'], 1)
+        self.assertLessEqual(statistics['Megabytes'], 2.5 * dose_megabytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import unittest
+import tempfile
+from MRLCinema.registration.telemetry import elastix_record, registration_record, RegistrationTelemetry
+
+
+def write_iteration_info(output_directory, resolution, metrics):
+    filename = os.path.join(output_directory, f'IterationInfo.0.R{resolution}.txt')
+    with open(filename, 'w') as f:
+        f.write('1:ItNr\t2:Metric\t3a:Time\n')
+        for i, metric in enumerate(metrics):
+            f.write(f'{i}\t{metric}\t0.1\n')
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_elastix_record(self):
+        with tempfile.TemporaryDirectory() as output_directory:
+            write_iteration_info(output_directory, 0, [3.0, 2.0, 1.5])
+            write_iteration_info(output_directory, 1, [1.4, 1.2])
+            with open(os.path.join(output_directory, 'elastix.log'), 'w') as f:
+                f.write('Stopping condition: Maximum number of iterations has been reached.\n')
+                f.write('Stopping condition: Step too small.\n')
+
+            record = elastix_record(output_directory, 2.5, 3, 100, 64*64)
+
+        self.assertEqual(record['Iterations'], 5)
+        self.assertAlmostEqual(record['FinalMetric'], 1.2)
+        self.assertTrue(record['HitIterationCap'])
+        self.assertEqual(record['StopCondition'], 'Step too small.')
+        self.assertEqual(record['NumFrames'], 100)
+
+    def test_summary(self):
+        telemetry = RegistrationTelemetry()
+        self.assertEqual(telemetry.num_batches, 0)
+
+        for batch in range(2):
+            for plane in range(3):
+                record = registration_record('elastix', 1.0 + plane, 100, 250, -1.0, None, 50, 1000, cached=(batch == 1))
+                telemetry.add(record, plane, batch)
+
+        self.assertEqual(telemetry.num_batches, 2)
+        summary = telemetry.summary()
+        self.assertEqual(summary['NumRegistrations'], 6)
+        self.assertEqual(summary['NumFrames'], 300)
+        self.assertAlmostEqual(summary['WallTime'], 12.0)
+        self.assertEqual(summary['NumHitIterationCap'], 0)
+        self.assertEqual(summary['NumCached'], 3)
+        self.assertAlmostEqual(summary['Sagittal']['WallTimePerFrame'], 6.0 / 100)
+        self.assertEqual(len(telemetry.to_dict()['Records']), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
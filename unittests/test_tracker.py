@@ -0,0 +1,64 @@
+import time
+import unittest
+import numpy as np
+from types import SimpleNamespace
+from MRLCinema.registration.tracker import QuantileNormaliser, FrameTracker
+
+
+def create_frame_tracker(latency_budget_ms=50.0, num_latency_frames=20):
+    """ A frame tracker with stand-in plane trackers, to test the latency budget without images. """
+    tracker = FrameTracker.__new__(FrameTracker)
+    tracker.planes = [SimpleNamespace(refine=True) for _ in range(3)]
+    tracker.latency_budget_ms = latency_budget_ms
+    tracker.num_latency_frames = num_latency_frames
+    tracker.latencies = [[] for _ in tracker.planes]
+    tracker.refinement_events = []
+    return tracker
+
+
+class TestTracker(unittest.TestCase):
+
+    def test_quantile_normaliser(self):
+        rng = np.random.default_rng(0)
+        reference = rng.gamma(2.0, 50.0, size=[40, 30])
+        normaliser = QuantileNormaliser(reference)
+
+        self.assertEqual(normaliser(reference).dtype, np.float32)
+        np.testing.assert_allclose(normaliser(reference), reference, rtol=1e-5)
+        # a linear change of the intensities is undone
+        np.testing.assert_allclose(normaliser(3.0 * reference + 20.0), reference, rtol=1e-5, atol=1e-3)
+
+    def test_latency_budget(self):
+        tracker = create_frame_tracker(latency_budget_ms=50.0, num_latency_frames=20)
+
+        for frame in range(19):
+            tracker._record_latency(0, time.perf_counter() - 0.1)
+            tracker._record_latency(1, time.perf_counter())
+        self.assertTrue(tracker.planes[0].refine)
+
+        # the median of the last frames is above the budget
+        tracker._record_latency(0, time.perf_counter() - 0.1)
+        tracker._record_latency(1, time.perf_counter())
+        self.assertFalse(tracker.planes[0].refine)
+        self.assertTrue(tracker.planes[1].refine)
+        self.assertTrue(tracker.planes[2].refine)
+
+        self.assertEqual(len(tracker.refinement_events), 1)
+        self.assertEqual(tracker.refinement_events[0]['Plane'], 0)
+        self.assertEqual(tracker.refinement_events[0]['Frame'], 19)
+        self.assertGreater(tracker.refinement_events[0]['MedianLatency'], 50.0)
+
+        statistics = tracker.latency_statistics()
+        self.assertEqual(statistics['Transversal']['NumFrames'], 20)
+        self.assertEqual(statistics['Sagittal'], {'NumFrames': 0})
+        self.assertEqual(statistics['Transversal']['OverBudget'], 1.0)
+        self.assertEqual(statistics['Coronal']['OverBudget'], 0.0)
+        self.assertEqual(statistics['All']['NumFrames'], 40)
+
+        # the refinement stays off
+        tracker._record_latency(0, time.perf_counter() - 0.1)
+        self.assertEqual(len(tracker.refinement_events), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
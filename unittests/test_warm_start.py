@@ -0,0 +1,27 @@
+import unittest
+import numpy as np
+from MRLCinema.registration.warm_start import WarmStart
+
+
+class TestWarmStart(unittest.TestCase):
+
+    def test_iterations_saved(self):
+        warm_start = WarmStart(predictor='mean', num_reference_images=2, num_planes=1)
+        self.assertIsNone(warm_start.initial_displacements(0, 5))
+
+        # the first batch is a cold start, the reference of the savings
+        warm_start.update(0, np.array([[0.0, 0.0], [0.0, 0.0], [1.0, 2.0], [3.0, 4.0]]), 120)
+        initial = warm_start.initial_displacements(0, 5)
+        np.testing.assert_allclose(initial, [[0, 0], [0, 0], [2, 3], [2, 3], [2, 3]])
+
+        warm_start.update(0, initial, 80)
+        warm_start.update(0, initial, 130)
+        warm_start.update(0, initial, 60, cold_start_iterations=100)
+
+        self.assertEqual(warm_start.cold_start_iterations, [120])
+        self.assertEqual(warm_start.iterations_saved, [[0, 40, -10, 40]])
+        self.assertEqual(warm_start.to_dict()['TotalIterationsSaved'], 70)
+
+
+if __name__ == '__main__':
+    unittest.main()
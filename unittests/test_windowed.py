@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+from MRLCinema.registration.windowed import window_ranges, stitch_windows
+
+
+class TestWindowed(unittest.TestCase):
+
+    def test_window_ranges(self):
+        ranges = window_ranges(500, 200, 50)
+        self.assertEqual(ranges, [(0, 200), (150, 350), (300, 500)])
+
+        # short last window merged with the window before
+        ranges = window_ranges(510, 200, 50)
+        self.assertEqual(ranges, [(0, 200), (150, 350), (300, 510)])
+
+        ranges = window_ranges(100, 200, 50)
+        self.assertEqual(ranges, [(0, 100)])
+
+    def test_stitch_offsets(self):
+        """ Each window is known up to a constant offset, the stitched trace is the true trace. """
+        t = np.arange(520) * 0.2
+        trace = np.stack([5 * np.sin(2 * np.pi * t / 4), 2 * np.cos(2 * np.pi * t / 4)], axis=1)
+
+        ranges = window_ranges(len(trace), 200, 50)
+        windows = []
+        for i, (start, stop) in enumerate(ranges):
+            d = trace[start:stop]
+            windows.append(d - np.mean(d, axis=0) + np.array([i, -2 * i]))
+
+        stitched = stitch_windows(windows, ranges)
+        stitched = stitched - stitched[0] + trace[0]
+
+        self.assertEqual(stitched.shape, trace.shape)
+        self.assertTrue(np.allclose(stitched, trace))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@ from pathlib import Path
 
 from MRLCinema.readcine.readcines import readcines
 from MRLCinema.visualisation.fraction_cinema.prepare_motion_visualisation import prepare_motion_visualisation
-from MRLCinema.motion_trace import MotionTrace
+from MRLCinema.motion_trace_catalog import update_catalog, load_motion_trace_cached
 from U2Dose.dicomio.rtstruct import RtStruct
 
 #
@@ -32,6 +32,8 @@ mm_data_path = '/mnt/Q/MotionManagementData'
 patient_data_root= f'/mnt/P/TERAPI/MRLINAC/QA/RTQADATA/PATIENT_DATA'
 patient_data_root_archive = f'/mnt/P/TERAPI/MRLINAC/QA/RTQADATA/Patient_Data_Archive'
 cine_report_path = f'/mnt/P/TERAPI/MRLINAC/QA/RTQADATA/MotionManagement'
+mask_cache_path = os.path.join(cine_report_path, 'MaskCache')
+motion_trace_catalog_filename = os.path.join(cine_report_path, 'motion_trace_catalog.json')
 
 
 #
@@ -51,19 +53,26 @@ def find_patient_path(patient_ID:str, paths:str) -> str|None:
 
     return None
 
-def find_patient_plan_labels(motion_traces:dict, patient_ID:str) -> list[str]:
+def find_patient_plan_labels(catalog_entries:dict, patient_ID:str) -> list[str]:
     plan_labels = []
-    for k, _ in motion_traces.items():
+    for k, _ in catalog_entries.items():
         if k[0] == patient_ID:
             plan_labels.append(k[1])
     return plan_labels
 
-def read_rtss(patient_path, plan_label): 
-    """ Read the RT Structure Set for a given patient ID and plan label. """
+def find_rtss_filename(patient_path, plan_label) -> str|None: 
+    """ Find the RT Structure Set filename for a given patient ID and plan label. """
     rtss_filenames = glob.glob(os.path.join(patient_path, plan_label, 'RS*.dcm'))
     if len(rtss_filenames) == 0:
         return None
-    rtss = RtStruct(rtss_filenames[0])
+    return rtss_filenames[0]
+
+def read_rtss(patient_path, plan_label): 
+    """ Read the RT Structure Set for a given patient ID and plan label. """
+    rtss_filename = find_rtss_filename(patient_path, plan_label)
+    if rtss_filename is None:
+        return None
+    rtss = RtStruct(rtss_filename)
     rtss.parse()
     return rtss
 
@@ -79,7 +88,7 @@ class BusinessLogic(object):
         self._patient_IDs = [] 
         self._current_patient_plan_names = None
 
-        self._motion_traces = {}
+        self._catalog_entries = {}
         self._current_motion_trace = None
 
         self._current_cines = None
@@ -90,13 +99,13 @@ class BusinessLogic(object):
         self._current_cines, self._current_cine_times, self._current_cine_masks = None, None, None
     
     def read_motion_traces(self):
-        """ Read available motion traces. Save patient IDs. """
-        trace_filenames = glob.glob(os.path.join(cine_report_path, '*cine_motion_analysis.json'))
+        """ Read the catalog of available motion traces (updated with new reports). Save patient IDs. 
+        The motion traces are loaded when a plan is selected. """
+        catalog = update_catalog(motion_trace_catalog_filename, cine_report_path)
         patient_IDs = set()
-        for filename in trace_filenames:
-            trace = MotionTrace.from_file(filename)
-            self._motion_traces[(trace.patient_ID, trace.plan_label)] = trace
-            patient_IDs.add(trace.patient_ID)
+        for entry in catalog['Entries'].values():
+            self._catalog_entries[(entry['PatientID'], entry['PlanLabel'])] = entry
+            patient_IDs.add(entry['PatientID'])
 
         self._patient_IDs = sorted(list(patient_IDs))
     
@@ -121,8 +130,11 @@ class BusinessLogic(object):
                 patient_path = find_patient_path(self._current_patient_ID, [patient_data_root, patient_data_root_archive])
                 if patient_path is None:
                     return
-                rtss = read_rtss(patient_path, self._current_plan_label)        
-                self._current_cines, self._current_cine_times, self._current_cine_masks = prepare_motion_visualisation(cines, rtss)
+                rtss_filename = find_rtss_filename(patient_path, self._current_plan_label)
+                if rtss_filename is None:
+                    return
+                self._current_cines, self._current_cine_times, self._current_cine_masks = prepare_motion_visualisation(cines, rtss_filename, 
+                                                                                                                       mask_cache_path)
                 
     @property
     def current_patient_ID(self): 
@@ -131,7 +143,7 @@ class BusinessLogic(object):
     @current_patient_ID.setter
     def current_patient_ID(self, patient_ID):
         self._current_patient_ID = patient_ID
-        self._current_patient_plan_names = find_patient_plan_labels(self._motion_traces, patient_ID)
+        self._current_patient_plan_names = find_patient_plan_labels(self._catalog_entries, patient_ID)
         self.current_plan_label = None
         self._current_cines = None
         self._current_cine_times = None
@@ -148,7 +160,10 @@ class BusinessLogic(object):
     @current_plan_label.setter
     def current_plan_label(self, plan_name:str):
         self._current_plan_label = plan_name
-        self._current_motion_trace = self._motion_traces.get((self._current_patient_ID, plan_name))
+        entry = self._catalog_entries.get((self._current_patient_ID, plan_name))
+        self._current_motion_trace = None
+        if entry is not None:
+            self._current_motion_trace = load_motion_trace_cached(entry['Filename'], entry['ModificationTime'])
         self._current_cines = None
         self._current_cine_times = None
         self._current_cine_masks = None
@@ -157,6 +172,11 @@ class BusinessLogic(object):
     def current_patient_plan_names(self):
         return self._current_patient_plan_names
     
+    @property
+    def current_catalog_entry(self) -> dict|None:
+        """ The catalog entry of the current patient and plan (duration, number of samples and statistics). """
+        return self._catalog_entries.get((self._current_patient_ID, self._current_plan_label))
+
     @property
     def current_motion_trace(self) -> dict:
         return self._current_motion_trace
@@ -3,18 +3,51 @@ import numpy as np
 import SimpleITK as sitk
 
 from ...readcine.readcines import CineImage, SliceDirection, resample_cine_to_identity 
-from ...registration.create_mask import create_grid
 from ...registration.preprocessing import crop_sequence, crop_image, find_crop_box, sequence_to_2d, image_to_2d
 from ...extract_motion import sort_cines_direction, filter_geometry
-from ...readcine.convert_to_sitk import sitk_resample_mask_to_slice
-from U2Dose.patient.Roi import Roi
-from U2Dose.dicomio.rtstruct import RtStruct
+from ...registration.rasterise_plane import rasterise_contours_to_plane
+from ...registration.mask_cache import mask_cache_key, cached_masks
+from ...patient_data import read_sop_instance_uid, read_roi_contours
 
 
 
 #################################################################################
-def prepare_motion_visualisation(cines:list[CineImage], rtss:RtStruct):
-    """ Prepare the cines for subsequent motion analysis. """""
+def prepare_visualisation_masks(transversal:CineImage, coronal:CineImage, sagittal:CineImage, z_mm_contours:list[np.array], margin=50):
+    """ Create the Z_MM masks, cropped and converted to 2D, and the crop boxes per slice direction. 
+    The contours are rasterised directly in each cine plane.
+    """
+
+    mask_transversal = rasterise_contours_to_plane(z_mm_contours, transversal.image)
+    mask_sagittal = rasterise_contours_to_plane(z_mm_contours, sagittal.image)
+    mask_coronal = rasterise_contours_to_plane(z_mm_contours, coronal.image)
+
+    crop_box_transversal = find_crop_box(mask_transversal, m=margin)
+    mask_transversal_cropped = crop_image(mask_transversal, crop_box_transversal)
+    mask_transversal_cropped = sitk.Cast(mask_transversal_cropped, sitk.sitkUInt8)
+
+    crop_box_sagittal = find_crop_box(mask_sagittal, m=margin)
+    mask_sagittal_cropped = crop_image(mask_sagittal, crop_box_sagittal)
+    mask_sagittal_cropped = sitk.Cast(mask_sagittal_cropped, sitk.sitkUInt8)
+    
+    crop_box_coronal = find_crop_box(mask_coronal, m=margin)
+    mask_coronal_cropped = crop_image(mask_coronal, crop_box_coronal)
+    mask_coronal_cropped = sitk.Cast(mask_coronal_cropped, sitk.sitkUInt8)
+
+    mask_transversal_cropped = image_to_2d(mask_transversal_cropped, SliceDirection.TRANSVERSAL)
+    mask_sagittal_cropped = image_to_2d(mask_sagittal_cropped, SliceDirection.SAGITTAL)
+    mask_coronal_cropped = image_to_2d(mask_coronal_cropped, SliceDirection.CORONAL)
+
+    masks = [mask_transversal_cropped, mask_sagittal_cropped, mask_coronal_cropped]
+    crop_boxes = [crop_box_transversal, crop_box_sagittal, crop_box_coronal]
+
+    return masks, crop_boxes
+
+
+#################################################################################
+def prepare_motion_visualisation(cines:list[CineImage], rtss_filename:str, cache_dir:str=None):
+    """ Prepare the cines for subsequent motion analysis. 
+    The masks are read from the cache directory if created before (for the same structure set and cine geometry). 
+    """
 
     #
     # Sort cines in time and then split into directions
@@ -37,33 +70,25 @@ def prepare_motion_visualisation(cines:list[CineImage], rtss:RtStruct):
     coronals = [resample_cine_to_identity(cine) for cine in coronals]
 
     #
-    # Create the grid for the mask
+    # Create the masks (or read from cache)
     #
-    grid = create_grid(transversals[0], coronals[0], sagittals[0])
-    z_mm = Roi.from_rtstruct(rtss, name='Z_MM', grid=grid)
-
-    mask_transversal = sitk_resample_mask_to_slice(z_mm, transversals[0].image)
-    mask_sagittal = sitk_resample_mask_to_slice(z_mm, sagittals[0].image)
-    mask_coronal = sitk_resample_mask_to_slice(z_mm, coronals[0].image)
-
+    def create_masks():
+        z_mm_contours = read_roi_contours(rtss_filename, 'Z_MM')
+        return prepare_visualisation_masks(transversals[0], coronals[0], sagittals[0], z_mm_contours)
+    
+    if cache_dir is None:
+        masks, crop_boxes = create_masks()
+    else:
+        key = mask_cache_key(read_sop_instance_uid(rtss_filename), 'Z_MM', [transversals[0], coronals[0], sagittals[0]], 
+                             {'type': 'visualisation', 'rasterisation': 'plane', 'margin': 50})
+        masks, crop_boxes = cached_masks(cache_dir, key, create_masks)
 
     # 
-    # Prepocessoing by cropping (image and mask) 
+    # Prepocessoing by cropping
     #
-    crop_box = find_crop_box(mask_transversal, m=50)
-    transversals_cropped = crop_sequence(transversals, crop_box)
-    mask_transversal_cropped = crop_image(mask_transversal, crop_box)
-    mask_transversal_cropped = sitk.Cast(mask_transversal_cropped, sitk.sitkUInt8)
-
-    crop_box = find_crop_box(mask_sagittal, m=50)
-    sagittals_cropped = crop_sequence(sagittals, crop_box)
-    mask_sagittal_cropped = crop_image(mask_sagittal, crop_box)
-    mask_sagittal_cropped = sitk.Cast(mask_sagittal_cropped, sitk.sitkUInt8)
-    
-    crop_box = find_crop_box(mask_coronal, m=50)
-    coronals_cropped = crop_sequence(coronals, crop_box)
-    mask_coronal_cropped = crop_image(mask_coronal, crop_box)
-    mask_coronal_cropped = sitk.Cast(mask_coronal_cropped, sitk.sitkUInt8)
+    transversals_cropped = crop_sequence(transversals, crop_boxes[0])
+    sagittals_cropped = crop_sequence(sagittals, crop_boxes[1])
+    coronals_cropped = crop_sequence(coronals, crop_boxes[2])
 
     #
     # convert to 2D images
@@ -71,9 +96,6 @@ def prepare_motion_visualisation(cines:list[CineImage], rtss:RtStruct):
     transversals_cropped = sequence_to_2d(transversals_cropped, SliceDirection.TRANSVERSAL)
     sagittals_cropped = sequence_to_2d(sagittals_cropped, SliceDirection.SAGITTAL)
     coronals_cropped = sequence_to_2d(coronals_cropped, SliceDirection.CORONAL)
-    mask_transversal_cropped = image_to_2d(mask_transversal_cropped, SliceDirection.TRANSVERSAL)
-    mask_sagittal_cropped = image_to_2d(mask_sagittal_cropped, SliceDirection.SAGITTAL)
-    mask_coronal_cropped = image_to_2d(mask_coronal_cropped, SliceDirection.CORONAL)
 
     #
     # extract timing info
@@ -84,6 +106,5 @@ def prepare_motion_visualisation(cines:list[CineImage], rtss:RtStruct):
 
     prepared_cines = [transversals_cropped, sagittals_cropped, coronals_cropped]
     times = [t_transversal, t_sagittal, t_coronal] 
-    masks = [mask_transversal_cropped, mask_sagittal_cropped, mask_coronal_cropped]
 
     return prepared_cines, times, masks
\ No newline at end of file